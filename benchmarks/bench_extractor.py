@@ -0,0 +1,50 @@
+"""
+Benchmarks the per-file time of `Extractor.extract` on the source files of the test examples.
+
+Usage: python benchmarks/bench_extractor.py [--r REPEATS] [--no-seq2seq] [--p PATH]
+"""
+
+from argparse import ArgumentParser
+from os.path import join, dirname, abspath
+from libsa4py.cst_extractor import Extractor
+from libsa4py.utils import list_files, read_file
+import time
+
+
+def bench_extractor(files: list, repeats: int, include_seq2seq: bool) -> dict:
+    """
+    Returns the mean extraction time of each file in milliseconds.
+    """
+
+    programs = {f: read_file(f) for f in files}
+    # Warm-up, e.g. for loading lazily-imported modules
+    for p in programs.values():
+        Extractor.extract(p, include_seq2seq=include_seq2seq)
+
+    files_time = {}
+    for f, p in programs.items():
+        start_t = time.perf_counter()
+        for _ in range(repeats):
+            Extractor.extract(p, include_seq2seq=include_seq2seq)
+        files_time[f] = (time.perf_counter() - start_t) / repeats * 1000
+
+    return files_time
+
+
+def main():
+    arg_parser = ArgumentParser(description="Benchmarks the per-file time of the extractor")
+    arg_parser.add_argument("--p", default=join(dirname(dirname(abspath(__file__))), 'tests', 'examples'), type=str,
+                            help="Path to Python source files")
+    arg_parser.add_argument("--r", default=10, type=int, help="Number of repeats per file")
+    arg_parser.add_argument("--no-seq2seq", dest='no_seq2seq', action='store_true',
+                            help="Whether to exclude the seq2seq representation")
+    args = arg_parser.parse_args()
+
+    files_time = bench_extractor(sorted(list_files(args.p)), args.r, not args.no_seq2seq)
+    for f, t in files_time.items():
+        print("%-40s %8.2f ms" % (f.split('/')[-1], t))
+    print("%-40s %8.2f ms" % ("Total", sum(files_time.values())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmarks the startup time of LibSA4Py in fresh interpreters: importing the extractor and the merge, `libsa4py --help`,
+and the `process --no-nlp` command on an empty dataset. To compare two versions, run it with the `--src` of each.
+
+Usage: python benchmarks/bench_import_time.py [--src PATH_TO_LIBSA4PY_SRC] [--r REPEATS]
+"""
+
+from argparse import ArgumentParser
+from statistics import median
+from typing import List
+import subprocess
+import tempfile
+import time
+import sys
+import os
+
+
+def bench_cmd(cmd: List[str], src: str, repeats: int) -> float:
+    """
+    Returns the median wall time of running a command in milliseconds
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([src] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    times = []
+    for _ in range(repeats):
+        start_t = time.perf_counter()
+        subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start_t) * 1000)
+    return median(times)
+
+
+def main():
+    arg_parser = ArgumentParser(description="Benchmarks the startup time of LibSA4Py")
+    arg_parser.add_argument("--src", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            help="Path to the source of LibSA4Py")
+    arg_parser.add_argument("--r", default=5, type=int, help="Number of repeats per command")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.mkdir(os.path.join(tmp_dir, 'projects'))
+        cmds = {"python": [sys.executable, "-c", "pass"],
+                "import libsa4py.cst_extractor": [sys.executable, "-c", "import libsa4py.cst_extractor"],
+                "import libsa4py.merge": [sys.executable, "-c", "import libsa4py.merge"],
+                "libsa4py --help": [sys.executable, "-m", "libsa4py", "--help"],
+                "libsa4py process --no-nlp": [sys.executable, "-m", "libsa4py", "process", "--p",
+                                              os.path.join(tmp_dir, 'projects'), "--o", os.path.join(tmp_dir, 'out'),
+                                              "--no-nlp", "--j", "1"]}
+        for name, cmd in cmds.items():
+            print("%-30s %10.2f ms" % (name, bench_cmd(cmd, args.src, args.r)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmarks the NLP pipeline of sentences on the docstrings extracted from source files, comparing the stages of
+`SentenceProcessor` before the POS tagging and the removal of stop words with their former implementation, i.e.,
+a regex pass per step with patterns compiled in `re.sub` and a list of stop words. It checks the outputs are identical.
+
+Usage: python benchmarks/bench_nl_preprocessing.py [--i SOURCE_FILES...] [--r REPEATS]
+"""
+
+from argparse import ArgumentParser
+from typing import List
+from libsa4py.cst_extractor import Extractor
+from libsa4py.nl_preprocessing import SentenceProcessor, get_stop_words, first_cap_regex, all_cap_regex
+from libsa4py.utils import read_file
+import glob
+import time
+import re
+
+
+def legacy_split_words(sentence: str) -> List[str]:
+    sentence = re.sub('[0-9]+', ' ', sentence)
+    sentence = re.sub('[^A-Za-z0-9 ]+', ' ', sentence).replace('\n', '').replace('\r', '')
+    sentence = sentence.replace("_", " ")
+    sentence = ' '.join([all_cap_regex.sub(r'\1 \2', first_cap_regex.sub(r'\1 \2', word))
+                         for word in sentence.split(" ")]).lower()
+    return [word for word in sentence.split(' ') if word != '']
+
+
+def legacy_remove_stop_words(sentence: str, stop_words: List[str]) -> str:
+    return ' '.join([word for word in sentence.split(' ') if word not in stop_words])
+
+
+def collect_docstrings(d, docstrings: List[str]):
+    """
+    Collects the docstrings of functions and the descriptions of their parameters in an extracted module
+    """
+
+    for fn in d['funcs'] + [fn for cls in d['classes'] for fn in cls['funcs']]:
+        docstrings.extend(s for s in fn['docstring'].values() if s)
+        docstrings.extend(s for s in fn['params_descr'].values() if s)
+
+
+def bench(fn, sentences: List[str], repeats: int) -> float:
+    """
+    Returns the mean time of applying fn to all the sentences in milliseconds
+    """
+
+    start_t = time.perf_counter()
+    for _ in range(repeats):
+        for s in sentences:
+            fn(s)
+    return (time.perf_counter() - start_t) / repeats * 1000
+
+
+def main():
+    arg_parser = ArgumentParser(description="Benchmarks the NLP pipeline of sentences")
+    arg_parser.add_argument("--i", nargs='+', default=glob.glob('tests/examples/*.py'),
+                            help="Source files to extract the docstrings from")
+    arg_parser.add_argument("--r", default=200, type=int, help="Number of repeats")
+    args = arg_parser.parse_args()
+
+    docstrings = []
+    for f in args.i:
+        collect_docstrings(Extractor.extract(read_file(f)).to_dict(), docstrings)
+    print("%d docstrings" % len(docstrings))
+
+    stop_words_list = list(get_stop_words())
+    sentences_words = [' '.join(w) for w in map(SentenceProcessor.split_words, docstrings)]
+    assert list(map(legacy_split_words, docstrings)) == list(map(SentenceProcessor.split_words, docstrings))
+    assert [legacy_remove_stop_words(s, stop_words_list) for s in sentences_words] == \
+           list(map(SentenceProcessor.remove_stop_words, sentences_words))
+
+    print("%-20s %10.3f ms" % ("split words legacy", bench(legacy_split_words, docstrings, args.r)))
+    print("%-20s %10.3f ms" % ("split words", bench(SentenceProcessor.split_words, docstrings, args.r)))
+    print("%-20s %10.3f ms" % ("stop words legacy", bench(lambda s: legacy_remove_stop_words(s, stop_words_list),
+                                                          sentences_words, args.r)))
+    print("%-20s %10.3f ms" % ("stop words", bench(SentenceProcessor.remove_stop_words, sentences_words, args.r)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmarks the time of applying types with `TypeApplier` on synthetic modules with a growing number of functions
+and methods, or a growing depth of nested functions, to check that it scales linearly.
+
+Usage: python benchmarks/bench_type_apply.py [--n 250 500 1000 2000] [--d 0] [--r REPEATS]
+"""
+
+from argparse import ArgumentParser
+from itertools import chain
+from typing import List
+from libsa4py.cst_extractor import Extractor
+from libsa4py.cst_transformers import TypeApplier, TypeAnnotationRemover
+import libcst as cst
+import time
+
+
+def nested_fn(name: str, depth: int, indent: str) -> List[str]:
+    """
+    A typed function with a chain of depth nested functions
+    """
+
+    fn = [indent + "def %s(a: int, b: str) -> int:" % name, indent + "    v: int = a"]
+    if depth > 0:
+        fn += nested_fn(name + "_n", depth - 1, indent + "    ")
+    return fn + [indent + "    return v"]
+
+
+def synthetic_module(n: int, depth: int = 0) -> str:
+    """
+    A module with n typed functions and a class with n typed methods, each with depth nested functions
+    """
+
+    fns = list(chain.from_iterable(nested_fn("f%d" % i, depth, "") for i in range(n)))
+    methods = list(chain.from_iterable(nested_fn("m%d" % i, depth, "    ") for i in range(n)))
+    # Methods take self
+    methods = [m.replace("(a: int", "(self, a: int", 1) if m.startswith("    def m") else m for m in methods]
+    return "\n".join(fns + ["class C:"] + methods) + "\n"
+
+
+def bench_type_apply(n: int, depth: int, repeats: int) -> float:
+    """
+    Returns the mean time of applying the types of the synthetic module of size n in milliseconds
+    """
+
+    program = synthetic_module(n, depth)
+    f_processed_dict = Extractor.extract(program).to_dict()
+    module = cst.metadata.MetadataWrapper(cst.parse_module(program).visit(TypeAnnotationRemover()),
+                                          unsafe_skip_copy=True)
+    # Resolves the metadata once so that only the applier is timed
+    module.resolve_many(TypeApplier.METADATA_DEPENDENCIES)
+    start_t = time.perf_counter()
+    for _ in range(repeats):
+        module.visit(TypeApplier(f_processed_dict, apply_nlp=False))
+    return (time.perf_counter() - start_t) / repeats * 1000
+
+
+def main():
+    arg_parser = ArgumentParser(description="Benchmarks applying types on synthetic modules")
+    arg_parser.add_argument("--n", default=[250, 500, 1000, 2000], nargs='+', type=int,
+                            help="Number of functions and methods of the synthetic modules")
+    arg_parser.add_argument("--d", default=0, type=int, help="Depth of nested functions in every function")
+    arg_parser.add_argument("--r", default=3, type=int, help="Number of repeats per module")
+    args = arg_parser.parse_args()
+
+    for n in args.n:
+        print("%-10d %10.2f ms" % (n, bench_type_apply(n, args.d, args.r)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmarks resolving the aliases of types with `normalize_type` on the types of processed projects, keeping the
+frequency of each type, with and without its cache.
+
+Usage: python benchmarks/bench_type_normalizer.py [--i JSON_FILES...] [--r REPEATS]
+"""
+
+from argparse import ArgumentParser
+from typing import List
+from libsa4py.type_normalizer import normalize_type
+from libsa4py.utils import load_json
+import glob
+import time
+
+
+def collect_types(d, types: List[str]):
+    """
+    Collects the types of parameters, return types, and variables of a processed project or file
+    """
+
+    if isinstance(d, dict):
+        for k, v in d.items():
+            if k in ('params', 'variables') and isinstance(v, dict):
+                types.extend(t for t in v.values() if isinstance(t, str) and t)
+            elif k == 'ret_type' and isinstance(v, str):
+                if v:
+                    types.append(v)
+            else:
+                collect_types(v, types)
+    elif isinstance(d, list):
+        for e in d:
+            collect_types(e, types)
+
+
+def bench_normalize(normalize_fn, types: List[str], repeats: int) -> float:
+    """
+    Returns the mean time of normalizing all the types in milliseconds
+    """
+
+    start_t = time.perf_counter()
+    for _ in range(repeats):
+        for t in types:
+            normalize_fn(t)
+    return (time.perf_counter() - start_t) / repeats * 1000
+
+
+def main():
+    arg_parser = ArgumentParser(description="Benchmarks resolving the aliases of types")
+    arg_parser.add_argument("--i", nargs='+', default=glob.glob('tests/exp_outputs/*.json') +
+                            ['tests/examples/type_apply_ex.json'], help="Processed JSON files to collect the types from")
+    arg_parser.add_argument("--r", default=20, type=int, help="Number of repeats")
+    args = arg_parser.parse_args()
+
+    types = []
+    for f in args.i:
+        collect_types(load_json(f), types)
+    print("%d types (%d unique)" % (len(types), len(set(types))))
+
+    print("%-12s %10.2f ms" % ("uncached", bench_normalize(normalize_type.__wrapped__, types, args.r)))
+    normalize_type.cache_clear()
+    print("%-12s %10.2f ms" % ("cached", bench_normalize(normalize_type, types, args.r)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmarks the time of finding the usage of variables by `Visitor` on synthetic modules with a growing number of
+module variables, local variables, and statements, to check that it scales linearly.
+
+Usage: python benchmarks/bench_vars_use.py [--n 500 1000 2000 4000] [--r REPEATS]
+"""
+
+from argparse import ArgumentParser
+from libsa4py.cst_visitor import Visitor
+import libcst as cst
+import time
+
+
+def synthetic_module(n: int) -> str:
+    """
+    A module with n module variables, and a function with n local variables and n statements that use them
+    """
+
+    mod_vars = ["v%d = %d" % (i, i) for i in range(n)]
+    fn_smts = ["    l%d = v%d + a + l%d" % (i, i, max(i - 1, 0)) for i in range(n)]
+    return "\n".join(mod_vars + ["def f(a, b):"] + fn_smts + ["    return l%d" % (n - 1)]) + "\n"
+
+
+def bench_vars_use(n: int, repeats: int) -> float:
+    """
+    Returns the mean time of visiting the synthetic module of size n in milliseconds
+    """
+
+    module = cst.metadata.MetadataWrapper(cst.parse_module(synthetic_module(n)), unsafe_skip_copy=True,
+                                          cache={cst.metadata.TypeInferenceProvider: {'types': []}})
+    # Resolves the metadata once, as the extractor does, so that only the visitor is timed
+    module.resolve_many(Visitor.METADATA_DEPENDENCIES)
+    start_t = time.perf_counter()
+    for _ in range(repeats):
+        module.visit(Visitor())
+    return (time.perf_counter() - start_t) / repeats * 1000
+
+
+def main():
+    arg_parser = ArgumentParser(description="Benchmarks finding the usage of variables on synthetic modules")
+    arg_parser.add_argument("--n", default=[500, 1000, 2000, 4000], nargs='+', type=int,
+                            help="Number of variables and statements of the synthetic modules")
+    arg_parser.add_argument("--r", default=3, type=int, help="Number of repeats per module")
+    args = arg_parser.parse_args()
+
+    for n in args.n:
+        print("%-10d %10.2f ms" % (n, bench_vars_use(n, args.r)))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,14 @@ UNK_TYPE_ANNOT = 'U'
 # Maximum time for type checking in sec.
 MAX_TC_TIME = 120
 
+# Maximum number of files whose types are queried from pyre at once
+PYRE_QUERY_BATCH_SIZE = 256
+
+# Maximum number of files (and their total size in bytes) of a project that are processed by a single task of the
+# file-level scheduler. The new entries of a worker's NLP cache are saved once per task.
+FILE_TASK_BATCH_SIZE = 32
+FILE_TASK_BATCH_BYTES = 256 * 1024
+
 # Python types
 PY_TYPING_MOD = {'ABCMeta', 'AbstractSet', 'Any', 'AnyStr', 'AsyncContextManager', 'AsyncGenerator', 'AsyncIterable',
                  'AsyncIterator', 'Awaitable', 'BinaryIO', 'ByteString', 'CT_co', 'Callable', 'ChainMap', 'ClassVar',
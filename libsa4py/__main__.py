@@ -1,18 +1,35 @@
 from argparse import ArgumentParser
 from multiprocessing import cpu_count
 from libsa4py.utils import find_repos_list
-from libsa4py.cst_pipeline import Pipeline, TypeAnnotatingProjects
-from libsa4py.merge import merge_projects
 
 
+# The commands import their modules when they run, so that `libsa4py --help` and invalid args fail fast
 def process_projects(args):
+    from libsa4py.cst_pipeline import Pipeline
     input_repos = find_repos_list(args.p) if args.l is None else find_repos_list(args.p)[:args.l]
-    p = Pipeline(args.p, args.o, not args.no_nlp, args.use_cache, args.use_pyre, args.use_tc, args.d, args.s)
+    p = Pipeline(args.p, args.o, not args.no_nlp, args.use_cache, args.use_pyre, args.use_tc, args.d, args.s,
+                 args.sched, args.module_cache, args.module_cache_size, args.output_format,
+                 args.normalize_types, args.nlp_cache_size, args.nlp_cache_policy, args.nlp_cache, args.pyre_servers,
+                 args.pyre_snapshot)
     p.run(input_repos, args.j)
 
 
+def dump_pyre_types(args):
+    from libsa4py.cst_pipeline import Pipeline
+    input_repos = find_repos_list(args.p) if args.l is None else find_repos_list(args.p)[:args.l]
+    p = Pipeline(args.p, None, nlp_transf=False, use_cache=args.use_cache, use_pyre=True,
+                 pyre_servers=args.pyre_servers, pyre_snapshot_dir=args.o)
+    p.run_pyre_dump(input_repos, args.j)
+
+
+def merge_processed_projects(args):
+    from libsa4py.merge import merge_projects
+    merge_projects(args)
+
+
 def apply_types_projects(args):
-    tap = TypeAnnotatingProjects(args.p, args.o)
+    from libsa4py.cst_pipeline import TypeAnnotatingProjects
+    tap = TypeAnnotatingProjects(args.p, args.o, scheduler=args.sched, output_tree=args.tree, diff_path=args.diff)
     tap.run(args.j)
 
 
@@ -33,26 +50,79 @@ def main():
                                                                                  "techniques to extracted identifiers")
     process_parser.add_argument("--pyre", dest='use_pyre', action='store_true',
                                 help="Whether to run pyre to infer types of variables in files")
+    process_parser.add_argument("--pyre-servers", dest='pyre_servers', required=False, type=int,
+                                help="Maximum number of pyre servers running at the same time "
+                                     "[default: no. of workers]")
+    process_parser.add_argument("--pyre-snapshot", dest='pyre_snapshot', required=False, type=str,
+                                help="Path to the pyre snapshots of projects (see pyre-dump) to use their types "
+                                     "without running pyre")
     process_parser.add_argument("--tc", dest='use_tc', action='store_true',
                                 help="Whether to type-check type annotations in projects")
+    process_parser.add_argument("--sched", default='project', choices=['project', 'file'],
+                                help="Whether to distribute whole projects or single files over the workers")
+    process_parser.add_argument("--mc", "--module-cache", dest='module_cache', required=False, type=str,
+                                help="Path to a persistent cache of extracted files, keyed by their source code")
+    process_parser.add_argument("--mc-size", "--module-cache-size", dest='module_cache_size', default=1024, type=int,
+                                help="Maximum size of the files' cache in MB")
+    process_parser.add_argument("--of", "--output-format", dest='output_format', default='json',
+                                choices=['json', 'jsonl'],
+                                help="Whether to save a whole project as a JSON or stream its files as JSON lines")
+    process_parser.add_argument("--norm-types", dest='normalize_types', action='store_true',
+                                help="Whether to resolve the aliases of extracted types, e.g., Dict[Any, Any] -> dict")
+
+    process_parser.add_argument("--nlp-cache", dest='nlp_cache', required=False, type=str,
+                                help="Path to a file to persist the cache of processed identifiers and sentences "
+                                     "between runs")
+    process_parser.add_argument("--nlp-cache-size", dest='nlp_cache_size', default=65536, type=int,
+                                help="Maximum number of processed identifiers (sentences) in the cache of a worker")
+    process_parser.add_argument("--nlp-cache-policy", dest='nlp_cache_policy', default='lru', choices=['lru', 'fifo'],
+                                help="Whether to evict the least recently used or the oldest entries of the NLP cache")
 
     process_parser.set_defaults(no_nlp=False)
     process_parser.set_defaults(use_cache=False)
     process_parser.set_defaults(use_pyre=False)
     process_parser.set_defaults(use_tc=False)
+    process_parser.set_defaults(normalize_types=False)
     process_parser.set_defaults(func=process_projects)
 
     merge_parser = sub_parsers.add_parser('merge')
     merge_parser.add_argument("--o", required=True, type=str, help="Path to store JSON-based processed projects")
     merge_parser.add_argument("--l", required=False, type=int, help="Number of projects to be merged")
-    merge_parser.set_defaults(func=merge_projects)
+    merge_parser.add_argument("--j", default=cpu_count(), type=int, help="Number of workers for merging projects")
+    merge_parser.add_argument("--df", "--df-format", dest='df_format', default='csv', choices=['csv', 'parquet'],
+                              help="Whether to save the dataframes as CSV or Parquet files")
+    merge_parser.add_argument("--vars", dest='vars', action='store_true',
+                              help="Whether to also save the dataframe of all the variables")
+    merge_parser.set_defaults(vars=False)
+    merge_parser.set_defaults(func=merge_processed_projects)
 
     apply_parser = sub_parsers.add_parser('apply')
     apply_parser.add_argument("--p", required=True, type=str, help="Path to Python projects")
     apply_parser.add_argument("--o", required=True, type=str, help="Path to store JSON-based processed projects")
     apply_parser.add_argument("--j", default=cpu_count(), type=int, help="Number of workers for processing projects")
+    apply_parser.add_argument("--sched", default='file', choices=['project', 'file'],
+                              help="Whether to distribute single files or whole projects over the workers")
+    apply_output = apply_parser.add_mutually_exclusive_group()
+    apply_output.add_argument("--tree", required=False, type=str,
+                              help="Path to write the annotated files to, rather than rewriting the files under --p")
+    apply_output.add_argument("--diff", required=False, type=str,
+                              help="Path to a JSONL file to write the diffs of the annotated files to, rather than "
+                                   "rewriting the files under --p")
     apply_parser.set_defaults(func=apply_types_projects)
 
+    pyre_dump_parser = sub_parsers.add_parser('pyre-dump')
+    pyre_dump_parser.add_argument("--p", required=True, type=str, help="Path to Python projects")
+    pyre_dump_parser.add_argument("--o", required=True, type=str, help="Path to store the pyre snapshots of projects")
+    pyre_dump_parser.add_argument("--j", default=cpu_count(), type=int, help="Number of workers for dumping projects")
+    pyre_dump_parser.add_argument("--l", required=False, type=int, help="Number of projects to dump")
+    pyre_dump_parser.add_argument("--c", "--cache", dest='use_cache', action='store_true',
+                                  help="Whether to ignore dumped projects")
+    pyre_dump_parser.add_argument("--pyre-servers", dest='pyre_servers', required=False, type=int,
+                                  help="Maximum number of pyre servers running at the same time "
+                                       "[default: no. of workers]")
+    pyre_dump_parser.set_defaults(use_cache=False)
+    pyre_dump_parser.set_defaults(func=dump_pyre_types)
+
     args = arg_parser.parse_args()
     args.func(args)
 
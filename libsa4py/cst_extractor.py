@@ -1,9 +1,10 @@
 from libsa4py.cst_visitor import Visitor
 from libsa4py.representations import ModuleInfo, create_output_seq
 from libsa4py.cst_transformers import TypeAdder, SpaceAdder, StringRemover, CommentAndDocStringRemover, NumberRemover,\
-    TypeAnnotationRemover, TypeQualifierResolver
+    TypeAnnotationRemover, TypeQualifierResolver, Seq2SeqTransformer
 from libsa4py.nl_preprocessing import normalize_module_code
 from libsa4py.exceptions import ParseError
+from typing import Tuple
 
 import libcst as cst
 
@@ -22,42 +23,63 @@ class Extractor:
         except Exception as e:
             raise ParseError(str(e))
 
+        # The metadata of the parsed module (i.e. positions, scopes and qualified names) is resolved once and shared
+        # between the type qualifier resolver and the visitor. The module is not modified by the visitors and
+        # transformers, hence it is safe to skip copying it.
+        mw = cst.metadata.MetadataWrapper(parsed_program, unsafe_skip_copy=True,
+                                          cache={cst.metadata.TypeInferenceProvider: program_types if program_types
+                                                 is not None else {'types': []}})
+
         # Resolves qualified names for a modules' type annotations
-        program_tqr = cst.metadata.MetadataWrapper(parsed_program).visit(TypeQualifierResolver())
+        tqr = TypeQualifierResolver()
+        program_tqr = mw.visit(tqr)
 
         v = Visitor()
-        if program_types is not None:
-            mw = cst.metadata.MetadataWrapper(program_tqr,
-                                             cache={cst.metadata.TypeInferenceProvider: program_types})
-            mw.visit(v)
-        else:
-            mw = cst.metadata.MetadataWrapper(program_tqr, cache={cst.metadata.TypeInferenceProvider: {'types':[]}})
-            mw.visit(v)
+        if tqr.resolved_type_annot:
+            # The metadata should be re-computed for the module with the resolved type annotations
+            mw = cst.metadata.MetadataWrapper(program_tqr, unsafe_skip_copy=True,
+                                              cache={cst.metadata.TypeInferenceProvider: program_types if
+                                                     program_types is not None else {'types': []}})
+        mw.visit(v)
 
         if include_seq2seq:
-            # Transformers
-            v_cm_doc = CommentAndDocStringRemover()
-            v_str = StringRemover()
-            v_num = NumberRemover()
-            v_type = TypeAnnotationRemover()
-            v_type_add = TypeAdder(v.module_all_annotations)
-            v_space = SpaceAdder()
-
-            v_untyped = parsed_program.visit(v_cm_doc)
-            v_untyped = v_untyped.visit(v_str)
-            v_untyped = v_untyped.visit(v_num)
-            v_untyped = v_untyped.visit(v_type)
-
-            # Replaces identifiers with their type annotations
-            v_typed = v_untyped.visit(v_type_add)
-
-            # Adding space for better tokenization
-            v_untyped = v_untyped.visit(v_space)
-            v_typed = v_typed.visit(v_space)
+            if Seq2SeqTransformer.can_transform(program):
+                untyped_code, typed_code = Seq2SeqTransformer(v.module_all_annotations).transform(parsed_program)
+            else:
+                untyped_code, typed_code = Extractor.transform_seq2seq(parsed_program, v.module_all_annotations)
 
             return ModuleInfo(v.imports, v.module_variables, v.module_variables_use, v.module_vars_ln, v.cls_list, v.fns,
-                              normalize_module_code(v_untyped.code), create_output_seq(normalize_module_code(v_typed.code)),
+                              normalize_module_code(untyped_code), create_output_seq(normalize_module_code(typed_code)),
                               v.module_no_types, v.module_type_annot_cove)
         else:
             return ModuleInfo(v.imports, v.module_variables, v.module_variables_use, v.module_vars_ln, v.cls_list,
                               v.fns, "", "", v.module_no_types, v.module_type_annot_cove)
+
+    @staticmethod
+    def transform_seq2seq(parsed_program: cst.Module, module_type_annot: dict) -> Tuple[str, str]:
+        """
+        Gives the untyped and typed code of a module by applying the seq2seq transformers one after another.
+        Seq2SeqTransformer produces the same code in a single pass.
+        """
+
+        # Transformers
+        v_cm_doc = CommentAndDocStringRemover()
+        v_str = StringRemover()
+        v_num = NumberRemover()
+        v_type = TypeAnnotationRemover()
+        v_type_add = TypeAdder(module_type_annot)
+        v_space = SpaceAdder()
+
+        v_untyped = parsed_program.visit(v_cm_doc)
+        v_untyped = v_untyped.visit(v_str)
+        v_untyped = v_untyped.visit(v_num)
+        v_untyped = v_untyped.visit(v_type)
+
+        # Replaces identifiers with their type annotations
+        v_typed = v_untyped.visit(v_type_add)
+
+        # Adding space for better tokenization
+        v_untyped = v_untyped.visit(v_space)
+        v_typed = v_typed.visit(v_space)
+
+        return v_untyped.code, v_typed.code
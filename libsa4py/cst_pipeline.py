@@ -1,24 +1,35 @@
 import os
+import copy
+import shutil
+import tempfile
 import traceback
 import random
 import csv
+import json
 import time
+import difflib
 
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional, Iterator, Callable
 from os.path import join
 from pathlib import Path
+from contextlib import nullcontext
 from datetime import timedelta
-from joblib import delayed
-from dpu_utils.utils.dataloading import load_jsonl_gz
+from itertools import chain
+from tqdm import tqdm
+from libcst.metadata.type_inference_provider import PyreData
 from libsa4py.cst_extractor import Extractor
 from libsa4py.cst_transformers import TypeApplier
 from libsa4py.exceptions import ParseError, NullProjectException
-from libsa4py.nl_preprocessing import NLPreprocessor
-from libsa4py.utils import read_file, list_files, ParallelExecutor, mk_dir_not_exist, save_json, load_json, write_file
-from libsa4py.pyre import pyre_server_init, pyre_query_types, pyre_server_shutdown, pyre_kill_all_servers, \
-    clean_pyre_config
+from libsa4py.nl_preprocessing import NLPreprocessor, compact_nlp_cache
+from libsa4py.module_cache import ModuleCache
+from libsa4py.type_normalizer import normalize_module_types
+from libsa4py.jsonl_output import ProjectJSONLWriter, iter_project_jsonl, list_processed_projects
+from libsa4py.utils import read_file, list_files, ParallelExecutor, mk_dir_not_exist, save_json, load_json, \
+    write_file_atomic
+from libsa4py.pyre import pyre_query_types_batch, PyreServerPool
+from libsa4py.pyre_snapshot import PyreSnapshotWriter, open_pyre_snapshot, get_pyre_snapshot_filename
 from libsa4py.type_check import MypyManager, type_check_single_file
-from libsa4py import MAX_TC_TIME
+from libsa4py import MAX_TC_TIME, PYRE_QUERY_BATCH_SIZE, FILE_TASK_BATCH_SIZE, FILE_TASK_BATCH_BYTES
 
 import libcst as cst
 import logging
@@ -32,7 +43,10 @@ class Pipeline:
 
     def __init__(self, projects_path, output_dir, nlp_transf: bool = True,
                  use_cache: bool = True, use_pyre: bool = False, use_tc: bool = False,
-                 dups_files_path=None, split_files_path=None):
+                 dups_files_path=None, split_files_path=None, scheduler: str = 'project',
+                 module_cache_dir: str = None, module_cache_size: int = 1024, output_format: str = 'json',
+                 normalize_types: bool = False, nlp_cache_size: int = 65536, nlp_cache_policy: str = 'lru',
+                 nlp_cache_file: str = None, pyre_servers: int = None, pyre_snapshot_dir: str = None):
         self.projects_path = projects_path
         self.output_dir = output_dir
         self.processed_projects = None
@@ -41,12 +55,30 @@ class Pipeline:
         self.nlp_transf = nlp_transf
         self.use_cache = use_cache
         self.use_pyre = use_pyre
+        # The maximum number of pyre servers running at the same time, which defaults to the number of workers
+        self.pyre_servers = pyre_servers
+        self.pyre_pool: Optional[PyreServerPool] = None
+        # Pyre's types of files are read from (or dumped to) the projects' snapshots, if given, rather than running pyre
+        self.pyre_snapshot_dir = pyre_snapshot_dir
         self.use_tc = use_tc
-        self.nlp_prep = NLPreprocessor()
-
-        self.__make_output_dirs()
+        # 'project' processes a whole project per worker, 'file' distributes single files over the workers
+        self.scheduler = scheduler
+        # Reuses the extracted output of files whose source code has not changed
+        self.module_cache = ModuleCache(module_cache_dir, module_cache_size) if module_cache_dir is not None else None
+        # 'json' saves a whole project at once, 'jsonl' streams a project's files as JSON lines
+        self.output_format = output_format
+        # Resolves the aliases of the extracted types, e.g., Dict[Any, Any] -> dict
+        self.normalize_types = normalize_types
+        # Identifiers and sentences are cached in every worker, and optionally persisted between runs
+        self.nlp_prep = NLPreprocessor(nlp_cache_size, nlp_cache_policy, nlp_cache_file)
+
+        # A pyre dump has no output_dir, since it only writes the projects' snapshots (see run_pyre_dump)
+        if self.output_dir is not None:
+            self.__make_output_dirs()
 
         if dups_files_path is not None:
+            # Imported here since dpu_utils imports numpy, which is slow
+            from dpu_utils.utils.dataloading import load_jsonl_gz
             clusters_rand_files = [l.pop(random.randrange(len(l))) for l in load_jsonl_gz(dups_files_path)]
             self.duplicate_files = [f for l in load_jsonl_gz(dups_files_path) for f in l]
             self.duplicate_files = set(self.duplicate_files).difference(set(clusters_rand_files))
@@ -63,7 +95,8 @@ class Pipeline:
         # logging.basicConfig(filename=join(self.err_log_dir, "pipeline_errors.log"), level=logging.DEBUG,
         #                     format='%(asctime)s %(name)s %(message)s')
         # self.logger = logging.getLogger(__name__)
-        self.logger = self.__setup_pipeline_logger(join(self.err_log_dir, "pipeline_errors.log"))
+        self.logger = self.__setup_pipeline_logger(join(self.err_log_dir, "pipeline_errors.log") if
+                                                   self.err_log_dir is not None else None)
 
     def __make_output_dirs(self):
         mk_dir_not_exist(self.output_dir)
@@ -75,22 +108,22 @@ class Pipeline:
         mk_dir_not_exist(self.avl_types_dir)
         mk_dir_not_exist(self.err_log_dir)
 
-    def __setup_pipeline_logger(self, log_dir: str):
+    def __setup_pipeline_logger(self, log_dir: Optional[str]):
         logger = logging.getLogger(__name__)
         logger.setLevel(logging.DEBUG)
 
         logger_ch = logging.StreamHandler()
         logger_ch.setLevel(logging.DEBUG)
     
-        logger_fh = logging.FileHandler(filename=log_dir)
-        logger_fh.setLevel(logging.DEBUG)
-    
         logger_formatter = logging.Formatter(fmt='%(asctime)s - %(name)s - %(message)s')
         logger_ch.setFormatter(logger_formatter)
-        logger_fh.setFormatter(logger_formatter)
-
         logger.addHandler(logger_ch)
-        logger.addHandler(logger_fh)
+
+        if log_dir is not None:
+            logger_fh = logging.FileHandler(filename=log_dir)
+            logger_fh.setLevel(logging.DEBUG)
+            logger_fh.setFormatter(logger_formatter)
+            logger.addHandler(logger_fh)
     
         return logger
 
@@ -100,183 +133,622 @@ class Pipeline:
         :param project: the project dict
         :return: return filename
         """
-        return join(self.processed_projects, f"{project['author']}{project['repo']}.json")
+        return join(self.processed_projects, f"{project['author']}{project['repo']}.{self.output_format}")
 
     def apply_nlp_transf(self, extracted_module: dict):
         """
         Applies NLP transformation to identifiers in a module
         """
 
-        def fn_nlp_transf(fn_d: dict, nlp_prep: NLPreprocessor):
-            fn_d['name'] = nlp_prep.process_identifier(fn_d['name'])
-            fn_d['params'] = {nlp_prep.process_identifier(p): t for p, t in fn_d['params'].items()}
-            fn_d['ret_exprs'] = [nlp_prep.process_identifier(r.replace('return ', '')) for r in fn_d['ret_exprs']]
-            fn_d['params_occur'] = {p: [nlp_prep.process_sentence(j) for i in o for j in i] for p, o in
-                                    fn_d['params_occur'].items()}
-            fn_d['variables'] = {nlp_prep.process_identifier(v): t for v, t in fn_d['variables'].items()}
-            fn_d['fn_var_occur'] = {v: [nlp_prep.process_sentence(j) for i in o for j in i] for v, o in
-                                    fn_d['fn_var_occur'].items()}
-            fn_d['params_descr'] = {nlp_prep.process_identifier(p): nlp_prep.process_sentence(fn_d['params_descr'][p]) \
-                                    for p in fn_d['params_descr'].keys()}
-            fn_d['docstring']['func'] = nlp_prep.process_sentence(fn_d['docstring']['func'])
-            fn_d['docstring']['ret'] = nlp_prep.process_sentence(fn_d['docstring']['ret'])
-            fn_d['docstring']['long_descr'] = nlp_prep.process_sentence(fn_d['docstring']['long_descr'])
-            return fn_d
+        # Collects the identifiers and sentences of the module first, so that they are processed in a single batch
+        identifiers, sentences = [], []
+        self.nlp_transf_module(extracted_module, lambda i: identifiers.append(i) or i,
+                               lambda s: sentences.append(s) or s)
 
-        extracted_module['variables'] = {self.nlp_prep.process_identifier(v): t for v, t in extracted_module['variables'].items()}
-        extracted_module['mod_var_occur'] = {v: [self.nlp_prep.process_sentence(j) for i in o for j in i] for v,
-                                             o in extracted_module['mod_var_occur'].items()}
+        identifiers = dict(zip(identifiers, self.nlp_prep.process_identifiers(identifiers)))
+        sentences = dict(zip(sentences, self.nlp_prep.process_sentences(sentences)))
+        return self.nlp_transf_module(extracted_module, identifiers.__getitem__,
+                                      lambda s: sentences[s] if s is not None else None)
 
-        for c in extracted_module['classes']:
-            c['variables'] = {self.nlp_prep.process_identifier(v): t for v, t in c['variables'].items()}
-            c['cls_var_occur'] = {v: [self.nlp_prep.process_sentence(j) for i in o for j in i] for v,
-                                  o in c['cls_var_occur'].items()}
-            c['funcs'] = [fn_nlp_transf(f, self.nlp_prep) for f in c['funcs']]
+    @staticmethod
+    def nlp_transf_module(extracted_module: dict, process_identifier: Callable[[str], str],
+                          process_sentence: Callable[[Optional[str]], Optional[str]]) -> dict:
+        """
+        Gives a copy of a module with its identifiers and sentences processed by the given functions
+        """
 
-        extracted_module['funcs'] = [fn_nlp_transf(f, self.nlp_prep) for f in extracted_module['funcs']]
+        def fn_nlp_transf(fn_d: dict) -> dict:
+            return {**fn_d,
+                    'name': process_identifier(fn_d['name']),
+                    'params': {process_identifier(p): t for p, t in fn_d['params'].items()},
+                    'ret_exprs': [process_identifier(r.replace('return ', '')) for r in fn_d['ret_exprs']],
+                    'params_occur': {p: [process_sentence(j) for i in o for j in i] for p, o in
+                                     fn_d['params_occur'].items()},
+                    'variables': {process_identifier(v): t for v, t in fn_d['variables'].items()},
+                    'fn_var_occur': {v: [process_sentence(j) for i in o for j in i] for v, o in
+                                     fn_d['fn_var_occur'].items()},
+                    'params_descr': {process_identifier(p): process_sentence(fn_d['params_descr'][p])
+                                     for p in fn_d['params_descr'].keys()},
+                    'docstring': {**fn_d['docstring'],
+                                  'func': process_sentence(fn_d['docstring']['func']),
+                                  'ret': process_sentence(fn_d['docstring']['ret']),
+                                  'long_descr': process_sentence(fn_d['docstring']['long_descr'])}}
+
+        return {**extracted_module,
+                'variables': {process_identifier(v): t for v, t in extracted_module['variables'].items()},
+                'mod_var_occur': {v: [process_sentence(j) for i in o for j in i] for v, o in
+                                  extracted_module['mod_var_occur'].items()},
+                'classes': [{**c,
+                             'variables': {process_identifier(v): t for v, t in c['variables'].items()},
+                             'cls_var_occur': {v: [process_sentence(j) for i in o for j in i] for v, o in
+                                               c['cls_var_occur'].items()},
+                             'funcs': [fn_nlp_transf(f) for f in c['funcs']]} for c in extracted_module['classes']],
+                'funcs': [fn_nlp_transf(f) for f in extracted_module['funcs']]}
+
+    def get_project_files(self, project: dict, deduplicate: bool = True) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Lists the source files of a project after deduplication.
+        :param project: the project dict
+        :param deduplicate: whether to remove the duplicate files
+        :return: a list of (file path, file path relative to the dataset, dataset split of the file)
+        """
 
-        return extracted_module
+        project_id = f'{project["author"]}/{project["repo"]}'
+        project_files = list_files(join(self.projects_path, project["author"], project["repo"]))
+        if deduplicate:
+            print(f"{project_id} has {len(project_files)} files before deduplication")
+            project_files = [f for f in project_files if not self.is_file_duplicate(f)]
+            print(f"{project_id} has {len(project_files)} files after deduplication")
 
-    def process_project(self, i, project):
+        project_files = [(f, str(Path(f).relative_to(Path(self.projects_path).parent))) for f in project_files]
+        return [(f, f_r, self.split_dataset_files[f_r] if f_r in self.split_dataset_files else None) for f,
+                f_r in project_files]
+
+    def process_file(self, project_id: str, filename: str, f_split: Optional[str],
+                     pyre_data_file: Optional[PyreData] = None) -> Optional[dict]:
+        """
+        Extracts the JSON representation of a single source file of a project.
+        :return: the extracted module dict or None if the file could not be processed
+        """
+
+        try:
+            program = read_file(filename)
+            if pyre_data_file is None and self.pyre_snapshot_dir is not None and not self.use_pyre:
+                pyre_data_file = self.get_pyre_snapshot_types(project_id, filename, program)
+            extracted_module = None
+            if self.module_cache is not None:
+                module_key = ModuleCache.make_key(program, self.nlp_transf, True, pyre_data_file)
+                extracted_module = self.module_cache.get(module_key)
+
+            if extracted_module is None:
+                if self.nlp_transf:
+                    extracted_module = self.apply_nlp_transf(Extractor().extract(program, pyre_data_file).to_dict())
+                else:
+                    extracted_module = Extractor.extract(program, pyre_data_file).to_dict()
+                if self.module_cache is not None:
+                    self.module_cache.put(module_key, extracted_module)
+
+            if self.normalize_types:
+                extracted_module = normalize_module_types(extracted_module)
+            extracted_module['set'] = f_split
+            if self.use_tc:
+                print(f"Running type checker for file: {filename}")
+                extracted_module['tc'] = type_check_single_file(filename, self.tc)
+
+            return extracted_module
+        except ParseError as err:
+            # print(f"Could not parse file {filename}")
+            traceback.print_exc()
+            self.logger.error("project: %s |file: %s |Exception: %s" % (project_id, filename, err))
+        except UnicodeDecodeError:
+            print(f"Could not read file {filename}")
+        except Exception as err:
+            # Other unexpected exceptions; Failure of single file should not
+            # fail the entire project processing.
+            # TODO: A better workaround would be to have a specialized exception thrown
+            # by the extractor, so that this exception is specialized.
+            #print(f"Could not process file {filename}")
+            traceback.print_exc()
+            self.logger.error("project: %s |file: %s |Exception: %s" % (project_id, filename, err))
+            #logging.error("project: %s |file: %s |Exception: %s" % (project_id, filename, err))
+
+    def get_pyre_snapshot_types(self, project_id: str, filename: str, program: str) -> Optional[PyreData]:
+        """
+        Gives the pyre types of a source file from its project's snapshot, if any
+        """
+
+        author, repo = project_id.split('/', 1)
+        pyre_snapshot = open_pyre_snapshot(get_pyre_snapshot_filename(self.pyre_snapshot_dir,
+                                                                      {'author': author, 'repo': repo}))
+        if pyre_snapshot is None:
+            return None
+        return pyre_snapshot.get(str(Path(filename).relative_to(Path(self.projects_path, author, repo))), program)
+
+    def save_project(self, project: dict, project_analyzed_files: dict):
+        """
+        Stores the available type hints and the JSON representation of a processed project.
+        """
+
+        project_id = f'{project["author"]}/{project["repo"]}'
+        src_files = project_analyzed_files[project_id]["src_files"]
+
+        print(f'Saving available type hints for {project_id}...')
+        if self.avl_types_dir is not None and len(src_files) != 0:
+            self.save_avl_types(project, src_files[list(src_files.keys())[-1]])
+
+        if len(src_files.keys()) != 0:
+            project_analyzed_files[project_id]["type_annot_cove"] = \
+                round(sum([src_files[s]["type_annot_cove"] for s in src_files.keys()]) / len(src_files.keys()), 2)
+
+            save_json(self.get_project_filename(project), project_analyzed_files)
+
+    def save_project_jsonl(self, project: dict, jsonl_writer: ProjectJSONLWriter, last_module: Optional[dict]):
+        """
+        Stores the available type hints of a processed project and completes its JSONL file.
+        """
+
+        print(f'Saving available type hints for {project["author"]}/{project["repo"]}...')
+        if self.avl_types_dir is not None and last_module is not None:
+            self.save_avl_types(project, last_module)
+        jsonl_writer.close()
+
+    def save_avl_types(self, project: dict, last_module: dict):
+        """
+        Stores the available type hints of a project, which are the ones of its last processed file.
+        """
+
+        extracted_avl_types = last_module['imports'] + [c['name'] for c in last_module['classes']]
+        if extracted_avl_types:
+            with open(join(self.avl_types_dir, f'{project["author"]}_{project["repo"]}_avltypes.txt'),
+                      'w') as f:
+                for t in extracted_avl_types:
+                    f.write("%s\n" % t)
+
+    def process_project(self, i, project) -> Optional[dict]:
+        """
+        Processes the source files of a project and stores its JSON representation.
+        :return: the stats of the project's pyre server, if pyre is used
+        """
 
         project_id = f'{project["author"]}/{project["repo"]}'
         project_analyzed_files: dict = {project_id: {"src_files": {}, "type_annot_cove": 0.0}}
+        pyre_stats = None
         try:
             print(f'Running pipeline for project {i} {project_id}')
             project['files'] = []
 
             print(f'Extracting for {project_id}...')
-            extracted_avl_types = None
-
-            project_files = list_files(join(self.projects_path, project["author"], project["repo"]))
-            print(f"{project_id} has {len(project_files)} files before deduplication")
-            project_files = [f for f in project_files if not self.is_file_duplicate(f)]
-            print(f"{project_id} has {len(project_files)} files after deduplication")
-
-            project_files = [(f, str(Path(f).relative_to(Path(self.projects_path).parent))) for f in project_files]
-            project_files = [(f, f_r, self.split_dataset_files[f_r] if f_r in self.split_dataset_files else None) for f,
-                             f_r in project_files]
+            project_files = self.get_project_files(project)
 
             if len(project_files) != 0:
+                project_path = join(self.projects_path, project["author"], project["repo"])
+                # Files are written as soon as they are extracted, rather than being kept in memory
+                jsonl_writer = ProjectJSONLWriter(self.get_project_filename(project), project_id) if \
+                    self.output_format == 'jsonl' else None
+                last_module = None
+
                 if self.use_pyre:
                     print(f"Running pyre for {project_id}")
-                    clean_pyre_config(join(self.projects_path, project["author"], project["repo"]))
-                    pyre_server_init(join(self.projects_path, project["author"], project["repo"]))
-
-                for filename, f_relative, f_split in project_files:
-                    try:
-                        pyre_data_file = pyre_query_types(join(self.projects_path, project["author"], project["repo"]),
-                                                          filename) if self.use_pyre else None
-
-                        project_analyzed_files[project_id]["src_files"][f_relative] = \
-                            self.apply_nlp_transf(
-                                Extractor().extract(read_file(filename), pyre_data_file).to_dict()) if self.nlp_transf \
-                                else Extractor.extract(read_file(filename), pyre_data_file).to_dict()
-
-                        project_analyzed_files[project_id]["src_files"][f_relative]['set'] = f_split
-                        if self.use_tc:
-                            print(f"Running type checker for file: {filename}")
-                            project_analyzed_files[project_id]["src_files"][f_relative]['tc'] = \
-                                type_check_single_file(filename, self.tc)
-
-                        extracted_avl_types = project_analyzed_files[project_id]["src_files"][f_relative]['imports'] + \
-                                              [c['name'] for c in
-                                               project_analyzed_files[project_id]["src_files"][f_relative]['classes']]
-                    except ParseError as err:
-                        # print(f"Could not parse file {filename}")
-                        traceback.print_exc()
-                        self.logger.error("project: %s |file: %s |Exception: %s" % (project_id, filename, err))
-                    except UnicodeDecodeError:
-                        print(f"Could not read file {filename}")
-                    except Exception as err:
-                        # Other unexpected exceptions; Failure of single file should not
-                        # fail the entire project processing.
-                        # TODO: A better workaround would be to have a specialized exception thrown
-                        # by the extractor, so that this exception is specialized.
-                        #print(f"Could not process file {filename}")
-                        traceback.print_exc()
-                        self.logger.error("project: %s |file: %s |Exception: %s" % (project_id, filename, err))
-                        #logging.error("project: %s |file: %s |Exception: %s" % (project_id, filename, err))
+                with self.pyre_pool.server(project_path) if self.use_pyre else nullcontext() as pyre_stats:
+                    pyre_data_files = {}
+                    for j, (filename, f_relative, f_split) in enumerate(project_files):
+                        if pyre_stats is not None and pyre_stats['healthy'] and j % PYRE_QUERY_BATCH_SIZE == 0:
+                            # The types of a batch of files are queried at once, as the files are processed
+                            query_t = time.perf_counter()
+                            pyre_data_files = pyre_query_types_batch(project_path, [f for f, _, _ in project_files[
+                                j:j + PYRE_QUERY_BATCH_SIZE]])
+                            pyre_stats['query'] += time.perf_counter() - query_t
+                        extracted_module = self.process_file(project_id, filename, f_split,
+                                                             pyre_data_files.get(filename))
+                        if extracted_module is not None:
+                            if jsonl_writer is not None:
+                                jsonl_writer.write_file(f_relative, extracted_module)
+                                last_module = extracted_module
+                            else:
+                                project_analyzed_files[project_id]["src_files"][f_relative] = extracted_module
+
+                if pyre_stats is not None:
+                    pyre_stats.update(project=project_id, files=len(project_files))
+                if jsonl_writer is not None:
+                    self.save_project_jsonl(project, jsonl_writer, last_module)
+                else:
+                    self.save_project(project, project_analyzed_files)
 
-                print(f'Saving available type hints for {project_id}...')
-                if self.avl_types_dir is not None:
-                    if extracted_avl_types:
-                        with open(join(self.avl_types_dir, f'{project["author"]}_{project["repo"]}_avltypes.txt'),
-                                  'w') as f:
-                            for t in extracted_avl_types:
-                                f.write("%s\n" % t)
+            else:
+                raise NullProjectException(project_id)
 
-                if len(project_analyzed_files[project_id]["src_files"].keys()) != 0:
-                    project_analyzed_files[project_id]["type_annot_cove"] = \
-                        round(sum([project_analyzed_files[project_id]["src_files"][s]["type_annot_cove"] for s in
-                                   project_analyzed_files[project_id]["src_files"].keys()]) / len(
-                            project_analyzed_files[project_id]["src_files"].keys()), 2)
+        except KeyboardInterrupt:
+            quit(1)
+        except NullProjectException as err:
+            self.logger.error(err)
+            print(err)
+        except Exception as err:
+            print(f'Running pipeline for project {i} failed')
+            traceback.print_exc()
+            self.logger.error("project: %s | Exception: %s" % (project_id, err))
+        finally:
+            # The new entries of the NLP cache are saved once per project rather than per file
+            if self.nlp_transf:
+                self.nlp_prep.save_cache()
 
-                    save_json(self.get_project_filename(project), project_analyzed_files)
+        return pyre_stats
 
-                if self.use_pyre:
-                    pyre_server_shutdown(join(self.projects_path, project["author"], project["repo"]))
+    def dump_project_pyre_types(self, i, project) -> Optional[dict]:
+        """
+        Queries pyre's types of a project's source files and stores them to the project's snapshot.
+        :return: the stats of the project's pyre server
+        """
 
-            else:
+        project_id = f'{project["author"]}/{project["repo"]}'
+        pyre_stats = None
+        try:
+            print(f'Dumping pyre types for project {i} {project_id}')
+            # All the files are dumped, since the file kept of a cluster of duplicates is chosen at random by every run
+            project_files = [f for f, _, _ in self.get_project_files(project, deduplicate=False)]
+            if len(project_files) == 0:
                 raise NullProjectException(project_id)
 
+            project_path = join(self.projects_path, project["author"], project["repo"])
+            snapshot_writer = PyreSnapshotWriter(get_pyre_snapshot_filename(self.pyre_snapshot_dir, project))
+            with self.pyre_pool.server(project_path) as pyre_stats:
+                for j in range(0, len(project_files) if pyre_stats['healthy'] else 0, PYRE_QUERY_BATCH_SIZE):
+                    query_t = time.perf_counter()
+                    pyre_data_files = pyre_query_types_batch(project_path, project_files[j:j + PYRE_QUERY_BATCH_SIZE])
+                    pyre_stats['query'] += time.perf_counter() - query_t
+                    for filename, pyre_data_file in pyre_data_files.items():
+                        if pyre_data_file is not None:
+                            try:
+                                snapshot_writer.write_file(str(Path(filename).relative_to(Path(project_path))),
+                                                           read_file(filename), pyre_data_file)
+                            except UnicodeDecodeError:
+                                print(f"Could not read file {filename}")
+
+            pyre_stats.update(project=project_id, files=len(project_files))
+            print(f"Stored pyre types of {snapshot_writer.close()} files of {project_id}")
         except KeyboardInterrupt:
             quit(1)
         except NullProjectException as err:
             self.logger.error(err)
             print(err)
         except Exception as err:
-            print(f'Running pipeline for project {i} failed')
+            print(f'Dumping pyre types for project {i} failed')
             traceback.print_exc()
             self.logger.error("project: %s | Exception: %s" % (project_id, err))
 
+        return pyre_stats
+
+    def save_pyre_stats(self, projects_pyre_stats: List[dict]):
+        """
+        Stores the latencies of the pyre server of every project, slowest first.
+        """
+
+        projects_pyre_stats = sorted(projects_pyre_stats, key=lambda s: s['start'] + s['query'] + s['shutdown'],
+                                     reverse=True)
+        with open(join(self.output_dir if self.output_dir is not None else self.pyre_snapshot_dir,
+                       'pyre_projects_time.csv'), 'w', newline='') as csv_f:
+            csv_w = csv.writer(csv_f)
+            csv_w.writerow(['project', 'files', 'healthy', 'reused', 'wait', 'start', 'query', 'shutdown'])
+            csv_w.writerows([s['project'], s['files'], s['healthy'], s['reused']] +
+                            [round(s[t], 4) for t in ('wait', 'start', 'query', 'shutdown')] for s in
+                            projects_pyre_stats)
+
+        if len(projects_pyre_stats) != 0:
+            print("Pyre servers of %d projects (%d reused, %d failed); mean latencies: start %.2fs, query %.2fs, "
+                  "shutdown %.2fs" % (len(projects_pyre_stats), sum(s['reused'] for s in projects_pyre_stats),
+                                      sum(not s['healthy'] for s in projects_pyre_stats),
+                                      *[sum(s[t] for s in projects_pyre_stats) / len(projects_pyre_stats) for t in
+                                        ('start', 'query', 'shutdown')]))
+
+    def get_file_task_pipeline(self) -> 'Pipeline':
+        """
+        Gives a copy of the pipeline to send with the tasks of single files, without the state that only listing the
+        projects' files needs, i.e., the duplicate files and the dataset split, which can be large
+        """
+
+        file_task_pipeline = copy.copy(self)
+        file_task_pipeline.duplicate_files = None
+        file_task_pipeline.is_file_duplicate = None
+        file_task_pipeline.split_dataset_files = {}
+        return file_task_pipeline
+
+    def __run_file_level(self, repos_list: List[Dict], jobs: int, start: int):
+        """
+        Schedules the source files of all the projects as independent tasks, i.e., small batches of a project's files,
+        over a shared pool of workers.
+        A project's JSON is assembled and saved as soon as all of its files are processed.
+        With the JSONL output, a project's files are written in the order that they are processed.
+        """
+
+        # Imported here since joblib imports numpy, which is slow
+        from joblib import delayed, Parallel
+
+        projects_files: Dict[int, List[Tuple[str, str, Optional[str]]]] = {}
+        projects_src_files: Dict[int, dict] = {}
+        projects_jsonl_writers: Dict[int, ProjectJSONLWriter] = {}
+        # The index and the dict of the last file of a project (in the project's files order) that is processed
+        projects_last_module: Dict[int, Tuple[int, dict]] = {}
+        for i, project in enumerate(repos_list, start=start):
+            project_id = f'{project["author"]}/{project["repo"]}'
+            try:
+                project_files = self.get_project_files(project)
+                if len(project_files) == 0:
+                    raise NullProjectException(project_id)
+                projects_files[i] = project_files
+                projects_src_files[i] = {}
+            except NullProjectException as err:
+                self.logger.error(err)
+                print(err)
+
+        projects_files_size = {i: [os.path.getsize(f) for f, _, _ in p_files] for i, p_files in projects_files.items()}
+        no_files = sum(len(p_files) for p_files in projects_files.values())
+        print(f"Number of files to be processed: {no_files}")
+
+        def iter_tasks():
+            # Projects go one after another, so that they are saved and freed as the run goes. The largest projects and
+            # the largest files of a project go first, so that a giant file does not end up as the last running task
+            file_task_pipeline = self.get_file_task_pipeline()
+            for i in sorted(projects_files, key=lambda i: sum(projects_files_size[i]), reverse=True):
+                project_id = f'{repos_list[i - start]["author"]}/{repos_list[i - start]["repo"]}'
+                # A task processes a small batch of consecutive files, so that its worker saves its NLP cache once
+                files_batch, files_batch_size = [], 0
+                for j in sorted(range(len(projects_files[i])), key=lambda j: projects_files_size[i][j], reverse=True):
+                    files_batch.append(projects_files[i][j])
+                    files_batch_size += projects_files_size[i][j]
+                    if len(files_batch) == FILE_TASK_BATCH_SIZE or files_batch_size >= FILE_TASK_BATCH_BYTES:
+                        yield delayed(process_files_task)(file_task_pipeline, i, project_id, files_batch)
+                        files_batch, files_batch_size = [], 0
+                if len(files_batch) != 0:
+                    yield delayed(process_files_task)(file_task_pipeline, i, project_id, files_batch)
+
+        projects_remaining_files = {i: len(p_files) for i, p_files in projects_files.items()}
+        projects_files_idx = {i: {f_r: j for j, (_, f_r, _) in enumerate(p_files)} for i, p_files in
+                              projects_files.items()} if self.output_format == 'jsonl' else {}
+        # The tasks are dispatched lazily, a bounded number of batches ahead of the running ones
+        for i, f_relative, extracted_module in tqdm(chain.from_iterable(Parallel(
+                n_jobs=jobs, return_as='generator_unordered', pre_dispatch='2*n_jobs')(iter_tasks())), total=no_files):
+            project = repos_list[i - start]
+            project_id = f'{project["author"]}/{project["repo"]}'
+            if extracted_module is not None:
+                if self.output_format == 'jsonl':
+                    if i not in projects_jsonl_writers:
+                        projects_jsonl_writers[i] = ProjectJSONLWriter(self.get_project_filename(project), project_id)
+                    projects_jsonl_writers[i].write_file(f_relative, extracted_module)
+                    if i not in projects_last_module or projects_files_idx[i][f_relative] > projects_last_module[i][0]:
+                        projects_last_module[i] = (projects_files_idx[i][f_relative], extracted_module)
+                else:
+                    projects_src_files[i][f_relative] = extracted_module
+            projects_remaining_files[i] -= 1
+
+            if projects_remaining_files[i] == 0 and self.output_format == 'jsonl':
+                if i in projects_jsonl_writers:
+                    try:
+                        self.save_project_jsonl(project, projects_jsonl_writers.pop(i),
+                                                projects_last_module.pop(i)[1])
+                    except Exception as err:
+                        traceback.print_exc()
+                        self.logger.error("project: %s | Exception: %s" % (project_id, err))
+            elif projects_remaining_files[i] == 0:
+                # Keeps the files' order of a project the same as the project-level scheduler
+                project_analyzed_files = {project_id: {"src_files": {f_r: projects_src_files[i][f_r] for _, f_r, _ in
+                                                                     projects_files[i] if f_r in
+                                                                     projects_src_files[i]},
+                                                       "type_annot_cove": 0.0}}
+                try:
+                    self.save_project(project, project_analyzed_files)
+                except Exception as err:
+                    traceback.print_exc()
+                    self.logger.error("project: %s | Exception: %s" % (project_id, err))
+                del projects_src_files[i]
+
     def run(self, repos_list: List[Dict], jobs, start=0):
+        # Imported here since joblib imports numpy, which is slow
+        from joblib import delayed
 
         print(f"Number of projects to be processed: {len(repos_list)}")
         repos_list = [p for p in repos_list if not (os.path.exists(self.get_project_filename(p)) and self.use_cache)]
         print(f"Number of projects to be processed after considering cache: {len(repos_list)}")
 
+        if self.use_pyre:
+            pyre_lock_dir = self.__start_pyre_pool(jobs)
+
         start_t = time.time()
-        ParallelExecutor(n_jobs=jobs)(total=len(repos_list))(
-            delayed(self.process_project)(i, project) for i, project in enumerate(repos_list, start=start))
+        if self.scheduler == 'file' and not self.use_pyre:
+            self.__run_file_level(repos_list, jobs, start)
+        else:
+            if self.scheduler == 'file':
+                print("The file-level scheduler does not support pyre; falling back to the project-level scheduler")
+            projects_pyre_stats = ParallelExecutor(n_jobs=jobs)(total=len(repos_list))(
+                delayed(self.process_project)(i, project) for i, project in enumerate(repos_list, start=start))
         print("Finished processing %d projects in %s " % (len(repos_list), str(timedelta(seconds=time.time()-start_t))))
 
+        if self.nlp_transf and self.nlp_prep.cache_file is not None:
+            nlp_cache_hits, nlp_cache_misses = compact_nlp_cache(self.nlp_prep.cache_file, self.nlp_prep.cache_size)
+            if nlp_cache_hits + nlp_cache_misses != 0:
+                print("NLP cache hit rate: %.2f%%" % (nlp_cache_hits / (nlp_cache_hits + nlp_cache_misses) * 100))
+
         if self.use_pyre:
-            pyre_kill_all_servers()
+            self.__stop_pyre_pool(pyre_lock_dir, projects_pyre_stats)
+        logging.shutdown()
+
+    def run_pyre_dump(self, repos_list: List[Dict], jobs, start=0):
+        """
+        Stores pyre's types of the projects to their snapshots, which `run` then reads instead of running pyre.
+        The snapshot folder only has the snapshots and the latencies of the pyre servers, and errors are only logged
+        to the console.
+        """
+
+        # Imported here since joblib imports numpy, which is slow
+        from joblib import delayed
+        mk_dir_not_exist(self.pyre_snapshot_dir)
+        print(f"Number of projects to be dumped: {len(repos_list)}")
+        repos_list = [p for p in repos_list if not (os.path.exists(get_pyre_snapshot_filename(self.pyre_snapshot_dir,
+                                                                                              p)) and self.use_cache)]
+        print(f"Number of projects to be dumped after considering cache: {len(repos_list)}")
+
+        pyre_lock_dir = self.__start_pyre_pool(jobs)
+        start_t = time.time()
+        projects_pyre_stats = ParallelExecutor(n_jobs=jobs)(total=len(repos_list))(
+            delayed(self.dump_project_pyre_types)(i, project) for i, project in enumerate(repos_list, start=start))
+        print("Finished dumping %d projects in %s " % (len(repos_list), str(timedelta(seconds=time.time()-start_t))))
+
+        self.__stop_pyre_pool(pyre_lock_dir, projects_pyre_stats)
         logging.shutdown()
 
+    def __start_pyre_pool(self, jobs: int) -> str:
+        """
+        :return: the lock folder of the pyre servers' slots, which are shared by the workers
+        """
+
+        pyre_lock_dir = tempfile.mkdtemp(prefix='libsa4py_pyre_')
+        self.pyre_pool = PyreServerPool(pyre_lock_dir, self.pyre_servers if self.pyre_servers is not None else
+                                        (jobs if jobs > 0 else os.cpu_count()))
+        return pyre_lock_dir
+
+    def __stop_pyre_pool(self, pyre_lock_dir: str, projects_pyre_stats: List[Optional[dict]]):
+        self.pyre_pool.shutdown_all()
+        shutil.rmtree(pyre_lock_dir)
+        self.save_pyre_stats([s for s in projects_pyre_stats if s is not None])
+
+
+def process_files_task(pipeline: Pipeline, i: int, project_id: str,
+                       files: List[Tuple[str, str, Optional[str]]]) -> List[Tuple[int, str, Optional[dict]]]:
+    """
+    Processes a batch of single files of the i-th project, as a task of the file-level scheduler.
+    :param files: a list of (file path, file path relative to the dataset, dataset split of the file)
+    :return: a list of (i, file path relative to the dataset, extracted module dict or None)
+    """
+
+    files_modules = [(i, f_relative, pipeline.process_file(project_id, filename, f_split)) for filename, f_relative,
+                     f_split in files]
+    if pipeline.nlp_transf:
+        pipeline.nlp_prep.save_cache()
+    return files_modules
+
 
 class TypeAnnotatingProjects:
     """
     It applies the inferred type annotations to the input dataset
     """
 
-    def __init__(self, projects_path: str, output_path: str, apply_nlp: bool = True):
+    def __init__(self, projects_path: str, output_path: str, apply_nlp: bool = True, scheduler: str = 'file',
+                 output_tree: Optional[str] = None, diff_path: Optional[str] = None):
         self.projects_path = projects_path
         self.output_path = output_path
         self.apply_nlp = apply_nlp
+        # 'file' distributes single files over the workers, 'project' applies a whole project per worker
+        self.scheduler = scheduler
+        # Annotated files are written to a separate tree or as diffs to a JSONL file, if given, rather than rewriting
+        # the source files of the dataset
+        self.output_tree = output_tree
+        self.diff_path = diff_path
+
+    @staticmethod
+    def iter_project_files(proj_json_path: str) -> Iterator[Tuple[str, dict]]:
+        """
+        Gives the processed source files of a project's JSON or JSONL file.
+        :return: an iterator over (file path relative to the dataset, module dict)
+        """
 
-    def process_project(self, proj_json_path: str):
-        proj_json = load_json(proj_json_path)
-        for p in proj_json.keys():
-            for i, (f, f_d) in enumerate(proj_json[p]['src_files'].items()):
-                f_read = read_file(join(self.projects_path, f))
-                if len(f_read) != 0:
-                    try:
-                        f_parsed = cst.parse_module(f_read)
-                        try:
-                            f_parsed = cst.metadata.MetadataWrapper(f_parsed).visit(TypeApplier(f_d, self.apply_nlp))
-                            write_file(join(self.projects_path, f), f_parsed.code)
-                        except KeyError as ke:
-                            print(f"A variable not found | project {proj_json_path} | file {f}", ke)
-                            traceback.print_exc()
-                        except TypeError as te:
-                            print(f"Project {proj_json_path} | file {f}", te)
-                            traceback.print_exc()
-                    except cst._exceptions.ParserSyntaxError as pse:
-                        print(f"Can't parsed file {f} in project {proj_json_path}", pse)
+        if proj_json_path.endswith('.jsonl'):
+            # The files of a JSONL project are read one at a time
+            return ((f, f_d) for _, f, f_d in iter_project_jsonl(proj_json_path))
+        else:
+            proj_json = load_json(proj_json_path)
+            return ((f, f_d) for p in proj_json.keys() for f, f_d in proj_json[p]['src_files'].items())
+
+    @staticmethod
+    def unified_diff(f: str, f_code: str, f_code_applied: str) -> str:
+        """
+        Gives the unified diff of a file's annotated code, which can be applied to the dataset with `patch -p1`
+        """
+
+        diff_lines = []
+        for l in difflib.unified_diff(f_code.splitlines(keepends=True), f_code_applied.splitlines(keepends=True),
+                                      fromfile='a/' + f, tofile='b/' + f):
+            diff_lines.append(l if l.endswith('\n') else l + '\n\\ No newline at end of file\n')
+        return ''.join(diff_lines)
+
+    def apply_file(self, proj_json_path: str, f: str, f_d: dict) -> Tuple[str, str, float, Optional[str]]:
+        """
+        Applies the types of a processed file to its source file.
+        :return: the file, whether its types are 'applied', or it is 'empty' or could not be parsed or applied, the
+        elapsed time in seconds, and the diff of the annotated file if the diffs are saved
+        """
+
+        start_t = time.time()
+        status = 'empty'
+        f_diff = None
+        f_read = read_file(join(self.projects_path, f))
+        if len(f_read) != 0:
+            try:
+                f_parsed = cst.parse_module(f_read)
+                try:
+                    f_parsed = cst.metadata.MetadataWrapper(f_parsed).visit(TypeApplier(f_d, self.apply_nlp))
+                    if self.diff_path is not None:
+                        f_diff = self.unified_diff(f, f_read, f_parsed.code)
+                    elif self.output_tree is not None:
+                        os.makedirs(os.path.dirname(join(self.output_tree, f)), exist_ok=True)
+                        write_file_atomic(join(self.output_tree, f), f_parsed.code)
+                    else:
+                        write_file_atomic(join(self.projects_path, f), f_parsed.code)
+                    status = 'applied'
+                except KeyError as ke:
+                    print(f"A variable not found | project {proj_json_path} | file {f}", ke)
+                    traceback.print_exc()
+                    status = 'apply_error'
+                except TypeError as te:
+                    print(f"Project {proj_json_path} | file {f}", te)
+                    traceback.print_exc()
+                    status = 'apply_error'
+            except cst._exceptions.ParserSyntaxError as pse:
+                print(f"Can't parsed file {f} in project {proj_json_path}", pse)
+                status = 'parse_error'
+
+        return f, status, time.time() - start_t, f_diff
+
+    def process_project(self, proj_json_path: str) -> List[Tuple[str, str, float, Optional[str]]]:
+        return [self.apply_file(proj_json_path, f, f_d) for f, f_d in self.iter_project_files(proj_json_path)]
+
+    def save_files_time(self, files_time: List[Tuple[str, str, float]]):
+        """
+        Stores the elapsed time of applying types to every file, slowest first.
+        """
+
+        with open(join(self.output_path, 'apply_files_time.csv'), 'w', newline='') as csv_f:
+            csv_w = csv.writer(csv_f)
+            csv_w.writerow(['file', 'status', 'time'])
+            csv_w.writerows((f, status, round(t, 4)) for f, status, t in sorted(files_time, key=lambda f_t: f_t[2],
+                                                                                   reverse=True))
 
     def run(self, jobs: int):
-        proj_jsons = list_files(join(self.output_path, 'processed_projects'), '.json')
+        # Imported here since joblib imports numpy, which is slow
+        from joblib import delayed, Parallel
+        proj_jsons = list_processed_projects(join(self.output_path, 'processed_projects'))
         proj_jsons.sort(key=lambda f: os.stat(f).st_size, reverse=True)
-        ParallelExecutor(n_jobs=jobs)(total=len(proj_jsons))(delayed(self.process_project)(p_j) for p_j in proj_jsons)
+
+        start_t = time.time()
+        if self.scheduler == 'file':
+            # The files of the projects are loaded lazily, as the workers take them
+            files_applied = tqdm(Parallel(n_jobs=jobs, return_as='generator_unordered')(
+                delayed(self.apply_file)(p_j, f, f_d) for p_j in proj_jsons for f, f_d in
+                self.iter_project_files(p_j)), desc="Applying types to files")
+        else:
+            files_applied = chain.from_iterable(ParallelExecutor(n_jobs=jobs)(total=len(proj_jsons))(
+                delayed(self.process_project)(p_j) for p_j in proj_jsons))
+
+        files_time = []
+        # The diffs are written to a temporary file, which is renamed once all the files are applied
+        diff_f = open(self.diff_path + '.tmp', 'w') if self.diff_path is not None else None
+        for f, status, t, f_diff in files_applied:
+            files_time.append((f, status, t))
+            if f_diff:
+                diff_f.write(json.dumps({"file": f, "diff": f_diff}) + '\n')
+        if diff_f is not None:
+            diff_f.close()
+            os.replace(self.diff_path + '.tmp', self.diff_path)
+
+        print("Applied types to %d files of %d projects in %s (%d files failed)" %
+              (sum(status == 'applied' for _, status, _ in files_time), len(proj_jsons),
+               str(timedelta(seconds=time.time() - start_t)),
+               sum(status.endswith('error') for _, status, _ in files_time)))
+        self.save_files_time(files_time)
@@ -1,10 +1,14 @@
-from typing import Union, Dict, Tuple, List, Optional
+from typing import Union, Dict, Tuple, List, Optional, Mapping
+from dataclasses import dataclass, field
 from collections import Counter
 from itertools import chain
 from libsa4py.nl_preprocessing import NLPreprocessor
+from libsa4py.type_normalizer import normalize_type
 from libsa4py import PY_TYPING_MOD, PY_COLLECTION_MOD
 import libcst as cst
 import libcst.matchers as match
+from libcst._nodes.internal import CodegenState
+import functools
 import re
 import regex
 
@@ -118,8 +122,7 @@ class TypeAdder(cst.CSTTransformer):
 
     def leave_FunctionDef(self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef):
 
-        ret_type = self.module_type_annot[(self.cls_stack[-1] if len(self.cls_stack) > 0 else None,
-                                           self.fn_stack[-1], None)][0]
+        ret_type = self.get_fn_ret_type()
         self.fn_stack.pop()
         if ret_type != '':
             return updated_node.with_changes(name=cst.Name(value=f"${ret_type}$"))
@@ -127,29 +130,43 @@ class TypeAdder(cst.CSTTransformer):
             return updated_node
 
     def leave_Name(self, original_node: cst.Name, updated_node: cst.Name):
+        name_type = self.get_name_type(original_node.value)
+        return updated_node.with_changes(value=f"${name_type}$") if name_type is not None else updated_node
+
+    def get_fn_ret_type(self) -> str:
+        """
+        Gives the return type of the function that is currently visited
+        """
+        return self.module_type_annot[(self.cls_stack[-1] if len(self.cls_stack) > 0 else None,
+                                       self.fn_stack[-1], None)][0]
+
+    def get_name_type(self, name: str) -> Optional[str]:
+        """
+        Gives the type of an identifier in the current scope or None if it has no type
+        """
 
         def extract_module_var_type(module_type_annot: Dict[Tuple, Tuple[str, str]]):
-            if (None, None, original_node.value) in module_type_annot:  # Skips imported module names
-                if module_type_annot[(None, None, original_node.value)][0] != '':
-                    return module_type_annot[(None, None, original_node.value)][0]
+            if (None, None, name) in module_type_annot:  # Skips imported module names
+                if module_type_annot[(None, None, name)][0] != '':
+                    return module_type_annot[(None, None, name)][0]
 
         name_type = None
 
         # Adds types of class variables, function parameters and function variables
         if len(self.cls_stack) > 0:
-            if (self.cls_stack[-1], self.fn_stack[-1] if len(self.fn_stack) > 0 else None, original_node.value) in \
+            if (self.cls_stack[-1], self.fn_stack[-1] if len(self.fn_stack) > 0 else None, name) in \
                     self.module_type_annot:  # skips classes' identifiers
                 if self.module_type_annot[(self.cls_stack[-1], self.fn_stack[-1] if len(self.fn_stack) > 0 else None,
-                                           original_node.value)][0] != '':
+                                           name)][0] != '':
                     name_type = self.module_type_annot[(self.cls_stack[-1],
                                                         self.fn_stack[-1] if len(self.fn_stack) > 0 else None,
-                                                        original_node.value)][0]
+                                                        name)][0]
             else:  # module-level variables (constants) in a function
                 name_type = extract_module_var_type(self.module_type_annot)
         else:  # module-level variables (constants)
             name_type = extract_module_var_type(self.module_type_annot)
 
-        return updated_node.with_changes(value=f"${name_type}$") if name_type is not None else updated_node
+        return name_type
 
 
 # This class is written by Georgios Gousios (GitHub: @gousiosg)
@@ -722,6 +739,278 @@ class SpaceAdder(cst.CSTTransformer):
             return original_node
 
 
+# The whitespace fields of nodes that SpaceAdder replaces with a single space
+SPACED_WHITESPACE: Dict[type, Tuple[str, ...]] = {
+    cst.Annotation: ('whitespace_before_indicator', 'whitespace_after_indicator'),
+    cst.Arg: ('whitespace_after_arg', 'whitespace_after_star'),
+    cst.Asynchronous: ('whitespace_after',),
+    cst.Await: ('whitespace_after_await',),
+    cst.Call: ('whitespace_after_func', 'whitespace_before_args'),
+    cst.CompFor: ('whitespace_before', 'whitespace_after_for', 'whitespace_before_in', 'whitespace_after_in'),
+    cst.CompIf: ('whitespace_before', 'whitespace_before_test'),
+    cst.ConcatenatedString: ('whitespace_between',),
+    cst.DictComp: ('whitespace_before_colon', 'whitespace_after_colon'),
+    cst.DictElement: ('whitespace_before_colon', 'whitespace_after_colon'),
+    cst.FormattedStringExpression: ('whitespace_before_expression', 'whitespace_after_expression'),
+    cst.LeftCurlyBrace: ('whitespace_after',),
+    cst.LeftParen: ('whitespace_after',),
+    cst.LeftSquareBracket: ('whitespace_after',),
+    cst.Param: ('whitespace_after_param', 'whitespace_after_star'),
+    cst.RightCurlyBrace: ('whitespace_before',),
+    cst.RightParen: ('whitespace_before',),
+    cst.RightSquareBracket: ('whitespace_before',),
+    cst.StarredDictElement: ('whitespace_before_value',),
+    cst.StarredElement: ('whitespace_before_value',),
+    cst.Subscript: ('whitespace_after_value',),
+    **{op: ('whitespace_before', 'whitespace_after') for op in (
+        cst.Add, cst.AddAssign, cst.AssignEqual, cst.BitAnd, cst.BitAndAssign, cst.BitOr, cst.BitOrAssign, cst.BitXor,
+        cst.BitXorAssign, cst.Colon, cst.Comma, cst.Divide, cst.DivideAssign, cst.Dot, cst.Equal, cst.FloorDivide,
+        cst.FloorDivideAssign, cst.GreaterThan, cst.GreaterThanEqual, cst.In, cst.Is, cst.IsNot, cst.LeftShift,
+        cst.LeftShiftAssign, cst.LessThan, cst.LessThanEqual, cst.MatrixMultiply, cst.MatrixMultiplyAssign, cst.Modulo,
+        cst.ModuloAssign, cst.Multiply, cst.MultiplyAssign, cst.NotEqual, cst.Or, cst.Power, cst.PowerAssign,
+        cst.RightShift, cst.RightShiftAssign, cst.Semicolon, cst.Subtract, cst.SubtractAssign)},
+    **{op: ('whitespace_after',) for op in (cst.BitInvert, cst.Minus, cst.Not, cst.And, cst.Plus)},
+    cst.NotIn: ('whitespace_before', 'whitespace_between', 'whitespace_after'),
+    cst.AsName: ('whitespace_before_as', 'whitespace_after_as'),
+    cst.Assert: ('whitespace_after_assert',),
+    cst.AssignTarget: ('whitespace_before_equal', 'whitespace_after_equal'),
+    cst.ClassDef: ('whitespace_after_class', 'whitespace_after_name', 'whitespace_before_colon'),
+    cst.Decorator: ('whitespace_after_at', 'trailing_whitespace'),
+    cst.Del: ('whitespace_after_del',),
+    cst.Else: ('whitespace_before_colon',),
+    cst.ExceptHandler: ('whitespace_after_except', 'whitespace_before_colon'),
+    cst.Finally: ('whitespace_before_colon',),
+    cst.For: ('whitespace_after_for', 'whitespace_before_in', 'whitespace_after_in', 'whitespace_before_colon'),
+    cst.FunctionDef: ('whitespace_after_def', 'whitespace_after_name', 'whitespace_before_params',
+                      'whitespace_before_colon'),
+    cst.Global: ('whitespace_after_global',),
+    cst.If: ('whitespace_before_test', 'whitespace_after_test'),
+    cst.Import: ('whitespace_after_import',),
+    cst.ImportFrom: ('whitespace_after_from', 'whitespace_before_import', 'whitespace_after_import'),
+    cst.Nonlocal: ('whitespace_after_nonlocal',),
+    cst.Raise: ('whitespace_after_raise',),
+    cst.Return: ('whitespace_after_return',),
+    cst.Try: ('whitespace_before_colon',),
+    cst.While: ('whitespace_after_while', 'whitespace_before_colon'),
+    cst.With: ('whitespace_after_with', 'whitespace_before_colon'),
+}
+
+TYPED_NAME_REGEX = re.compile(r"^\$.+\$$")
+
+
+@dataclass(frozen=False)
+class SpacedCodegenState(CodegenState):
+    """
+    It adds the spaces of SpaceAdder to the token stream while the code of a module is generated.
+    That is, a whitespace node in SPACED_WHITESPACE is emitted as a single space, without re-creating the module.
+    """
+
+    nodes_stack: List[cst.CSTNode] = field(default_factory=list)
+    spaced_node: Optional[cst.CSTNode] = None
+    typed_name: Optional[cst.Name] = None
+
+    def before_codegen(self, node: cst.CSTNode) -> None:
+        if self.spaced_node is None and len(self.nodes_stack) != 0:
+            parent = self.nodes_stack[-1]
+            spaced_fields = SPACED_WHITESPACE.get(type(parent))
+            if spaced_fields is not None and any(getattr(parent, f) is node for f in spaced_fields):
+                # Same as SpaceAdder, the parentheses of an identifier are spaced only if it is a type
+                if not (type(parent) in (cst.LeftParen, cst.RightParen) and type(self.nodes_stack[-2]) is cst.Name
+                        and self.nodes_stack[-2] is not self.typed_name):
+                    self.tokens.append(' ')
+                    self.spaced_node = node
+
+        if type(node) is cst.Name and TYPED_NAME_REGEX.match(node.value):
+            self.typed_name = node
+        self.nodes_stack.append(node)
+
+    def after_codegen(self, node: cst.CSTNode) -> None:
+        self.nodes_stack.pop()
+        if node is self.spaced_node:
+            self.spaced_node = None
+
+    def add_token(self, value: str) -> None:
+        if self.spaced_node is None:
+            if self.typed_name is not None and self.nodes_stack[-1] is self.typed_name:
+                value = value.replace(" ", "")
+            self.tokens.append(value)
+            # SpaceAdder also adds a space after a bare raise statement, whose whitespace is a MaybeSentinel
+            if value == "raise" and type(self.nodes_stack[-1]) is cst.Raise and self.nodes_stack[-1].exc is None \
+                    and isinstance(self.nodes_stack[-1].whitespace_after_raise, cst.MaybeSentinel):
+                self.tokens.append(' ')
+
+    def add_indent_tokens(self) -> None:
+        if self.spaced_node is None:
+            self.tokens.extend(self.indent_tokens)
+
+
+def code_with_spaces(module: cst.Module) -> str:
+    """
+    Gives the code of a module with spaces around all possible tokens.
+    It produces the same code as `module.visit(SpaceAdder()).code` in a single codegen pass.
+    """
+
+    state = SpacedCodegenState(default_indent=module.default_indent, default_newline=module.default_newline)
+    module._codegen(state)
+    return "".join(state.tokens)
+
+
+class Seq2SeqTransformer(cst.CSTTransformer):
+    """
+    It produces the untyped and typed code of a module for the seq2seq representation in a single pass.
+    That is, it fuses CommentAndDocStringRemover, StringRemover, NumberRemover, TypeAnnotationRemover, TypeAdder, and
+    SpaceAdder. An identifier with a type is replaced by a marker that holds both its untyped and typed code.
+    """
+
+    MARKER_START = '\x1f'
+    MARKER_SEP = '\x1e'
+    MARKER_REGEX = re.compile('\x1f([^\x1e]*)\x1e([^\x1f]*)\x1f')
+
+    def __init__(self, module_type_annot: Dict[Tuple, Tuple[str, str]]):
+        self.type_adder = TypeAdder(module_type_annot)
+        self.module: cst.Module = None
+        self.block_indents: List[Optional[str]] = []
+
+    def transform(self, module: cst.Module) -> Tuple[str, str]:
+        """
+        Gives the untyped and typed code of the given module
+        """
+        self.module = module
+        # Spaces are added while generating the code of the transformed module
+        m_code = code_with_spaces(module.visit(self))
+        return self.MARKER_REGEX.sub(r'\1', m_code), self.MARKER_REGEX.sub(r'\2', m_code)
+
+    @staticmethod
+    def can_transform(program: str) -> bool:
+        """
+        The markers are not distinguishable in a program that already contains the marker characters
+        """
+        return Seq2SeqTransformer.MARKER_START not in program and Seq2SeqTransformer.MARKER_SEP not in program
+
+    def __add_marker(self, untyped_code: str, typed_code: str) -> cst.Name:
+        return cst.Name(value=self.MARKER_START + untyped_code + self.MARKER_SEP + typed_code + self.MARKER_START)
+
+    def __code_for_node(self, node: cst.CSTNode) -> str:
+        """
+        Generates the code for a node at the current indentation level, which is needed for parenthesized newlines
+        """
+        state = CodegenState(default_indent=self.module.default_indent, default_newline=self.module.default_newline,
+                             indent_tokens=[self.module.default_indent if i is None else i for i in
+                                            self.block_indents])
+        node._codegen(state)
+        return "".join(state.tokens)
+
+    def visit_IndentedBlock(self, node: cst.IndentedBlock):
+        self.block_indents.append(node.indent)
+
+    def leave_IndentedBlock(self, original_node: cst.IndentedBlock, updated_node: cst.IndentedBlock):
+        self.block_indents.pop()
+        return updated_node
+
+    def leave_Expr(self, original_node: cst.Expr, updated_node: cst.Expr):
+        if isinstance(original_node.value, cst.SimpleString):
+            return updated_node.with_changes(value=cst.SimpleString(value='"""[docstring]"""'))
+        else:
+            return updated_node
+
+    def leave_Comment(self, original_node: cst.Comment, updated_node: cst.Comment):
+        return updated_node.with_changes(value="#[comment]")
+
+    def leave_SimpleString(self, original_node: cst.SimpleString, updated_node: cst.SimpleString):
+        return updated_node.with_changes(
+            value="\"[string]\"") if updated_node.value != '"""[docstring]"""' else updated_node
+
+    def leave_FormattedStringText(self, original_node: cst.FormattedString, updated_node: cst.FormattedString):
+        return updated_node.with_changes(value=" [string] ")
+
+    def leave_Float(self, original_node: cst.Float, updated_node: cst.Float):
+        return cst.SimpleString(value="\"[number]\"")
+
+    def leave_Integer(self, original_node: cst.Integer, updated_node: cst.Integer):
+        return cst.SimpleString(value="\"[number]\"")
+
+    def leave_Imaginary(self, original_node: cst.Imaginary, updated_node: cst.Imaginary):
+        return cst.SimpleString(value="\"[number]\"")
+
+    def visit_Annotation(self, node: cst.Annotation):
+        # Type annotations are removed, so there is no need to visit them
+        return False
+
+    def leave_Param(self, original_node: cst.Param, updated_node: cst.Param):
+        return updated_node.with_changes(annotation=None)
+
+    def leave_AnnAssign(self, original_node: cst.AnnAssign, updated_node: cst.AnnAssign):
+        # Same as TypeAnnotationRemover, uninitialized variables are converted to foo = ...
+        if original_node.value is None and isinstance(original_node.target, (cst.Name, cst.Attribute)):
+            return cst.Assign(targets=[cst.AssignTarget(target=updated_node.target)], value=cst.Ellipsis())
+        else:
+            return cst.Assign(targets=[cst.AssignTarget(target=updated_node.target)], value=updated_node.value)
+
+    def visit_ClassDef(self, node: cst.ClassDef):
+        self.type_adder.visit_ClassDef(node)
+
+    def leave_ClassDef(self, original_node: cst.ClassDef, updated_node: cst.ClassDef):
+        self.type_adder.cls_stack.pop()
+        return updated_node
+
+    def visit_FunctionDef(self, node: cst.FunctionDef):
+        self.type_adder.visit_FunctionDef(node)
+
+    def leave_FunctionDef(self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef):
+        ret_type = self.type_adder.get_fn_ret_type()
+        self.type_adder.fn_stack.pop()
+
+        updated_node = updated_node.with_changes(returns=None)
+        if ret_type != '':
+            return updated_node.with_changes(name=self.__add_marker(original_node.name.value,
+                                                                    f"${ret_type}$".replace(" ", "")))
+        else:
+            return updated_node
+
+    def leave_Name(self, original_node: cst.Name, updated_node: cst.Name):
+        name_type = self.type_adder.get_name_type(original_node.value)
+        if name_type is None:
+            return updated_node
+
+        typed_name = f"${name_type}$".replace(" ", "")
+        # Same as SpaceAdder, the parentheses of an identifier are spaced only in the typed code
+        if len(updated_node.lpar) == 0 and len(updated_node.rpar) == 0:
+            return self.__add_marker(original_node.value, typed_name)
+        else:
+            typed_node = updated_node.with_changes(
+                value=typed_name,
+                lpar=[p.with_changes(whitespace_after=cst.SimpleWhitespace(' ')) for p in updated_node.lpar],
+                rpar=[p.with_changes(whitespace_before=cst.SimpleWhitespace(' ')) for p in updated_node.rpar])
+            return self.__add_marker(self.__code_for_node(updated_node), self.__code_for_node(typed_node))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_type_annotation(type_name: str) -> Optional[cst.Annotation]:
+    """
+    Parses the annotation node of a type, or gives None if the type is not a valid annotation.
+    The same types recur a lot in projects, so the nodes are cached by their type rather than parsed every time. The
+    cache's hits and misses are given by `parse_type_annotation.cache_info()`.
+    """
+
+    try:
+        return match.extract(cst.parse_module("x: %s=None" % type_name).body[0].body[0],
+                             match.AnnAssign(target=match.Name(value=match.DoNotCare()),
+                                             annotation=match.SaveMatchedNode(match.DoNotCare(), "type")))['type']
+    except cst._exceptions.ParserSyntaxError:
+        return None
+
+
+def type_annotation_node(type_name: str) -> Optional[cst.Annotation]:
+    """
+    Gives a new annotation node of a type, or None if the type is not a valid annotation.
+    The cached node is cloned, since a tree must not have the same node in several places: LibCST's metadata is keyed
+    by nodes, and the rewritten modules are wrapped without copying them (see `Extractor.extract`).
+    """
+
+    type_annot = parse_type_annotation(type_name)
+    return type_annot.deep_clone() if type_annot is not None else None
+
+
 class TypeQualifierResolver(cst.CSTTransformer):
     """
     It resolves qualified names for types, e.g. t.List -> typing.List
@@ -734,6 +1023,8 @@ class TypeQualifierResolver(cst.CSTTransformer):
         self.parametric_type_annot_visited: bool = False
         self.last_visited_name: cst.Name = None
         self.q_names_cache: Dict[Tuple[str, cst.metadata.QualifiedNameSource]] = {}
+        # Whether any type annotation is rewritten. If not, the output is identical to the input module.
+        self.resolved_type_annot: bool = False
 
     def visit_Annotation(self, node: cst.Annotation):
         if not match.matches(node, match.Annotation(annotation=match.OneOf(
@@ -747,11 +1038,13 @@ class TypeQualifierResolver(cst.CSTTransformer):
                 self.parametric_type_annot_visited = False
                 q_name, _ = self.__get_qualified_name(original_node.annotation.value)
                 if q_name is not None:
+                    self.resolved_type_annot = True
                     return updated_node.with_changes(annotation=cst.Subscript(value=self.__name2annotation(q_name).annotation,
                                              slice=updated_node.annotation.slice))
             else:
                 q_name, _ = self.__get_qualified_name(original_node.annotation)
                 if q_name is not None:
+                    self.resolved_type_annot = True
                     return updated_node.with_changes(annotation=self.__name2annotation(q_name).annotation)
 
         return original_node
@@ -766,20 +1059,25 @@ class TypeQualifierResolver(cst.CSTTransformer):
             if match.matches(original_node, match.SubscriptElement(slice=match.Index(value=match.Subscript()))):
                 q_name, _ = self.__get_qualified_name(original_node.slice.value.value)
                 if q_name is not None:
+                    self.resolved_type_annot = True
                     return updated_node.with_changes(slice=cst.Index(value=cst.Subscript(value=self.__name2annotation(q_name).annotation,
                                                                  slice=updated_node.slice.value.slice)))
             elif match.matches(original_node, match.SubscriptElement(slice=match.Index(value=match.Ellipsis()))):
                 # TODO: Should the original node be returned?!
+                self.resolved_type_annot = True
                 return updated_node.with_changes(slice=cst.Index(value=cst.Ellipsis()))
             elif match.matches(original_node, match.SubscriptElement(slice=match.Index(value=match.SimpleString(value=match.DoNotCare())))):
+                self.resolved_type_annot = True
                 return updated_node.with_changes(slice=cst.Index(value=updated_node.slice.value))
             elif match.matches(original_node, match.SubscriptElement(slice=match.Index(value=match.Name(value='None')))):
                 return original_node
             elif match.matches(original_node, match.SubscriptElement(slice=match.Index(value=match.List()))):
+                self.resolved_type_annot = True
                 return updated_node.with_changes(slice=cst.Index(value=updated_node.slice.value))
             else:
                 q_name, _ = self.__get_qualified_name(original_node.slice.value)
                 if q_name is not None:
+                    self.resolved_type_annot = True
                     return updated_node.with_changes(slice=cst.Index(value=self.__name2annotation(q_name).annotation))
 
         return original_node
@@ -787,6 +1085,7 @@ class TypeQualifierResolver(cst.CSTTransformer):
     def leave_Element(self, original_node: cst.Element, updated_node: cst.Element):
         if self.type_annot_visited:
             q_name, _ = self.__get_qualified_name(original_node.value)
+            self.resolved_type_annot = True
             return updated_node.with_changes(value=self.__name2annotation(q_name).annotation)
         else:
             return original_node
@@ -813,21 +1112,15 @@ class TypeQualifierResolver(cst.CSTTransformer):
         """
         Converts Name nodes to valid annotation nodes
         """
-        try:
-            return match.extract(cst.parse_module("x: %s=None" % type_name).body[0].body[0],
-                         match.AnnAssign(target=match.Name(value=match.DoNotCare()),
-                                         annotation=match.SaveMatchedNode(match.DoNotCare(), "type")))['type']
-        except cst._exceptions.ParserSyntaxError:
-            # To handle a bug in LibCST's scope provider where a local name shadows a type annotation with the same name
-            if (self.last_visited_name.value, cst.metadata.QualifiedNameSource.IMPORT) in self.q_names_cache:
-                return match.extract(cst.parse_module("x: %s=None" % self.q_names_cache[(self.last_visited_name.value,
-                                cst.metadata.QualifiedNameSource.IMPORT)]).body[0].body[0],
-                                 match.AnnAssign(target=match.Name(value=match.DoNotCare()),
-                                             annotation=match.SaveMatchedNode(match.DoNotCare(), "type")))['type']
-            else:
-                return match.extract(cst.parse_module("x: %s=None" % self.last_visited_name.value).body[0].body[0],
-                                 match.AnnAssign(target=match.Name(value=match.DoNotCare()),
-                                                 annotation=match.SaveMatchedNode(match.DoNotCare(), "type")))['type']
+        type_annot = type_annotation_node(type_name)
+        if type_annot is not None:
+            return type_annot
+        # To handle a bug in LibCST's scope provider where a local name shadows a type annotation with the same name
+        if (self.last_visited_name.value, cst.metadata.QualifiedNameSource.IMPORT) in self.q_names_cache:
+            return type_annotation_node(self.q_names_cache[(self.last_visited_name.value,
+                                                            cst.metadata.QualifiedNameSource.IMPORT)])
+        else:
+            return type_annotation_node(self.last_visited_name.value)
 
 
 class ParametricTypeDepthReducer(cst.CSTTransformer):
@@ -853,6 +1146,53 @@ class ParametricTypeDepthReducer(cst.CSTTransformer):
             return updated_node
 
 
+class VarNamesCounter(cst.CSTVisitor):
+    """
+    It counts the names of assigned variables in classes and functions in a single pass over a module.
+    The counter of a class (function) includes the class (function) variables of its nested classes (functions).
+    """
+
+    def __init__(self, scopes: Mapping[cst.CSTNode, Optional[cst.metadata.Scope]]):
+        self.scopes = scopes
+        self.cls_visited: List[Counter] = []
+        self.fn_visited: List[Counter] = []
+        self.var_names_counters: Dict[cst.CSTNode, Counter] = {}
+
+    def visit_ClassDef(self, node: cst.ClassDef):
+        self.cls_visited.append(Counter())
+
+    def leave_ClassDef(self, original_node: cst.ClassDef):
+        self.var_names_counters[original_node] = self.__leave_scope(self.cls_visited)
+
+    def visit_FunctionDef(self, node: cst.FunctionDef):
+        self.fn_visited.append(Counter())
+
+    def leave_FunctionDef(self, original_node: cst.FunctionDef):
+        self.var_names_counters[original_node] = self.__leave_scope(self.fn_visited)
+
+    def visit_AssignTarget(self, node: cst.AssignTarget):
+        self.__count_var_name(node.target)
+
+    def visit_AnnAssign(self, node: cst.AnnAssign):
+        self.__count_var_name(node.target)
+
+    def __count_var_name(self, target: cst.BaseExpression):
+        if isinstance(target, cst.Name):
+            scope = self.scopes[target]
+            if isinstance(scope, cst.metadata.ClassScope):
+                self.cls_visited[-1][target.value] += 1
+            elif isinstance(scope, cst.metadata.FunctionScope):
+                self.fn_visited[-1][target.value] += 1
+
+    @staticmethod
+    def __leave_scope(visited: List[Counter]) -> Counter:
+        # The names of a nested class (function) are also counted for its enclosing class (function)
+        var_names = visited.pop()
+        if len(visited) != 0:
+            visited[-1].update(var_names)
+        return var_names
+
+
 class TypeApplier(cst.CSTTransformer):
     """
     It applies (inferred) type annotations to a source code file.
@@ -869,6 +1209,8 @@ class TypeApplier(cst.CSTTransformer):
         self.last_visited_assign_t_name = None
         self.last_visited_assign_t_count = 0
         self.lambda_d = 0
+        # The counters of assigned variables' names of classes and functions, set when visiting the module
+        self.var_names_counters: Dict[cst.CSTNode, Counter] = {}
 
         self.all_applied_types = set()
 
@@ -877,16 +1219,26 @@ class TypeApplier(cst.CSTTransformer):
         else:
             self.nlp_p = lambda x: x
 
-    def __get_fn(self, f_node: cst.FunctionDef) -> dict:
-        if len(self.cls_visited) != 0:
-            fns = self.cls_visited[-1][0]['funcs']
-        else:
-            fns = self.f_processed_dict['funcs']
-
+        # Indexes the classes by their qualified name and the functions by their qualified name and parameters, so that
+        # visited nodes are looked up in constant time. The first one is kept for duplicate definitions.
+        self.cls_index: Dict[str, dict] = {}
+        for c in self.f_processed_dict['classes']:
+            self.cls_index.setdefault(c['q_name'], c)
+        self.fns_index: Dict[Optional[str], Dict[Tuple[str, frozenset], dict]] = \
+            {None: self.__index_fns(self.f_processed_dict['funcs'])}
+        for c_q_name, c in self.cls_index.items():
+            self.fns_index[c_q_name] = self.__index_fns(c['funcs'])
+
+    @staticmethod
+    def __index_fns(fns: List[dict]) -> Dict[Tuple[str, frozenset], dict]:
+        fns_index = {}
         for fn in fns:
-            if fn['q_name'] == self.__get_qualified_name(f_node.name) and \
-                    set(list(fn['params'].keys())) == set(self.__get_fn_params(f_node.params)):
-                return fn
+            fns_index.setdefault((fn['q_name'], frozenset(fn['params'].keys())), fn)
+        return fns_index
+
+    def __get_fn(self, f_node: cst.FunctionDef) -> dict:
+        fns_index = self.fns_index[self.cls_visited[-1][0]['q_name'] if len(self.cls_visited) != 0 else None]
+        return fns_index.get((self.__get_qualified_name(f_node.name), frozenset(self.__get_fn_params(f_node.params))))
 
     def __get_fn_param_type(self, param_name: str):
         fn_param_type = self.fn_visited[-1][0]['params'][self.nlp_p(param_name)]
@@ -898,9 +1250,7 @@ class TypeApplier(cst.CSTTransformer):
                 return fn_param_type
 
     def __get_cls(self, cls: cst.ClassDef) -> dict:
-        for c in self.f_processed_dict['classes']:
-            if c['q_name'] == self.__get_qualified_name(cls.name):
-                return c
+        return self.cls_index.get(self.__get_qualified_name(cls.name))
 
     def __get_fn_vars(self, var_name: str) -> dict:
         if var_name in self.fn_visited[-1][0]['variables']:
@@ -959,24 +1309,20 @@ class TypeApplier(cst.CSTTransformer):
             t = self.__get_mod_vars()[self.nlp_p(var_name)]
         return t
 
-    def __get_var_names_counter(self, node, scope):
-        vars_name = match.extractall(node, match.OneOf(match.AssignTarget(target=match.SaveMatchedNode(
-            match.Name(value=match.DoNotCare()), "name")), match.AnnAssign(target=match.SaveMatchedNode(
-            match.Name(value=match.DoNotCare()), "name"))))
-        return Counter([n['name'].value for n in vars_name if isinstance(self.get_metadata(cst.metadata.ScopeProvider,
-                                                                                           n['name']), scope)])
+    def visit_Module(self, node: cst.Module):
+        var_names_counter = VarNamesCounter(self.metadata[cst.metadata.ScopeProvider])
+        node.visit(var_names_counter)
+        self.var_names_counters = var_names_counter.var_names_counters
 
     def visit_ClassDef(self, node: cst.ClassDef):
-        self.cls_visited.append((self.__get_cls(node),
-                                 self.__get_var_names_counter(node, cst.metadata.ClassScope)))
+        self.cls_visited.append((self.__get_cls(node), self.var_names_counters[node]))
 
     def leave_ClassDef(self, original_node: cst.ClassDef, updated_node: cst.ClassDef):
         self.cls_visited.pop()
         return updated_node
 
     def visit_FunctionDef(self, node: cst.FunctionDef):
-        self.fn_visited.append((self.__get_fn(node),
-                                self.__get_var_names_counter(node, cst.metadata.FunctionScope)))
+        self.fn_visited.append((self.__get_fn(node), self.var_names_counters[node]))
 
     def leave_FunctionDef(self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef):
         fn_ret_type = self.fn_visited[-1][0]['ret_type']
@@ -1066,8 +1412,9 @@ class TypeApplier(cst.CSTTransformer):
         all_req_mods = find_required_modules(self.all_applied_types)
         all_type_names = set(chain.from_iterable(map(lambda t: regex.findall(r"\w+", t[0]), self.all_applied_types)))
 
-        typing_imports = PY_TYPING_MOD & all_type_names
-        collection_imports = PY_COLLECTION_MOD & all_type_names
+        # Sorted so that the added imports do not depend on the hash seed, e.g., to compare the diffs of runs
+        typing_imports = sorted(PY_TYPING_MOD & all_type_names)
+        collection_imports = sorted(PY_COLLECTION_MOD & all_type_names)
 
         if len(typing_imports) > 0:
             req_imports.append(cst.SimpleStatementLine(body=[cst.ImportFrom(module=cst.Name(value="typing"),
@@ -1079,43 +1426,18 @@ class TypeApplier(cst.CSTTransformer):
                                                        names=[cst.ImportAlias(name=cst.Name(value=t), asname=None) \
                                                               for t in collection_imports]),]))
         if len(all_req_mods) > 0:
-            for mod_name in all_req_mods:
+            for mod_name in sorted(all_req_mods):
                 req_imports.append(cst.SimpleStatementLine(body=[cst.Import(names=[cst.ImportAlias(name=cst.Name(value=mod_name),
                                                                                     asname=None)])]))
 
         return req_imports
 
     def __name2annotation(self, type_name: str):
-        ext_annot = lambda t: match.extract(cst.parse_module("x: %s=None" % t).body[0].body[0],
-                                            match.AnnAssign(target=match.Name(value=match.DoNotCare()),
-                                                            annotation=match.SaveMatchedNode(match.DoNotCare(), "type")))['type']
-        try:
-            return ext_annot(type_name)
-        except cst._exceptions.ParserSyntaxError:
-            return None
+        return type_annotation_node(type_name)
 
     def __get_qualified_name(self, node) -> Optional[str]:
         q_name = list(self.get_metadata(cst.metadata.QualifiedNameProvider, node))
         return q_name[0].name if len(q_name) != 0 else None
 
     def resolve_type_alias(self, t: str):
-        type_aliases = {'^{}$|^Dict$|(?<=.*)Dict\[\](?<=.*)|(?<=.*)Dict\[Any, *?Any\](?=.*)|^Dict\[unknown, *Any\]$': 'dict',
-                        '^Set$|(?<=.*)Set\[\](?<=.*)|^Set\[Any\]$': 'set',
-                        '^Tuple$|(?<=.*)Tuple\[\](?<=.*)|^Tuple\[Any\]$|(?<=.*)Tuple\[Any, *?\.\.\.\](?=.*)|^Tuple\[unknown, *?unknown\]$|^Tuple\[unknown, *?Any\]$|(?<=.*)tuple\[\](?<=.*)': 'tuple',
-                        '^Tuple\[(.+), *?\.\.\.\]$': r'Tuple[\1]',
-                        '\\bText\\b': 'str',
-                        '^\[\]$|(?<=.*)List\[\](?<=.*)|^List\[Any\]$|^List$': 'list',
-                        '^\[{}\]$': 'List[dict]',
-                        '(?<=.*)Literal\[\'.*?\'\](?=.*)': 'Literal',
-                        '(?<=.*)Literal\[\d+\](?=.*)': 'Literal',  # Maybe int?!
-                        '^Callable\[\.\.\., *?Any\]$|^Callable\[\[Any\], *?Any\]$|^Callable[[Named(x, Any)], Any]$': 'Callable',
-                        '^Iterator[Any]$': 'Iterator',
-                        '^OrderedDict[Any, *?Any]$': 'OrderedDict',
-                        '^Counter[Any]$': 'Counter',
-                        '(?<=.*)Match[Any](?<=.*)': 'Match',
-                        '^\.(.+)': r'\1',
-                        '(?<=.*)Optional\[\](?<=.*)': 'Optional'}
-        for t_alias in type_aliases:
-            if regex.search(regex.compile(t_alias), t):
-                t = regex.sub(regex.compile(t_alias), type_aliases[t_alias], t)
-        return t
+        return normalize_type(t)
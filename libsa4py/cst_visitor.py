@@ -5,6 +5,41 @@ from libsa4py import DEV_TYPE_ANNOT, INF_TYPE_ANNOT, UNK_TYPE_ANNOT
 import libcst as cst
 import libcst.matchers as match
 import re
+from bisect import bisect_left
+
+
+class StatementNamesIndex:
+    """
+    The names of visited statements with an inverted index from a name to the statements in which it occurs.
+    Hence, the usage of a variable is found by a lookup rather than by scanning all the statements.
+    """
+
+    def __init__(self):
+        self.statements: List[list] = []
+        self.name_statements: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self.statements)
+
+    def add(self, names: list):
+        smt_id = len(self.statements)
+        self.statements.append(names)
+        for n in set(names):
+            if n in self.name_statements:
+                self.name_statements[n].append(smt_id)
+            else:
+                self.name_statements[n] = [smt_id]
+
+    def find(self, name: str, start: int = 0) -> List[list]:
+        """
+        Gives the statements in which the name occurs, in the order of their visit
+        :param start: the index of the first statement to consider
+        """
+
+        if name not in self.name_statements:
+            return []
+        smt_ids = self.name_statements[name]
+        return [self.statements[i] for i in smt_ids[bisect_left(smt_ids, start):]]
 
 
 class Visitor(cst.CSTVisitor):
@@ -24,15 +59,18 @@ class Visitor(cst.CSTVisitor):
 
         self.fns = []  # List of functions in a module
         # Statements in which a function's arguments may occur
-        self.fn_may_args_var_use: List[list] = []
+        self.fn_may_args_var_use = StatementNamesIndex()
 
         # self.visited_class = False
         self.cls_stack: List[ClassInfo] = []
         self.cls_list: List[ClassInfo] = []
-        self.cls_may_vars_use: List[list] = []
+        self.cls_may_vars_use = StatementNamesIndex()
 
         self.module_variables: Dict[str, str] = {}
         self.module_variables_use: Dict[str, List[list]] = {}
+        # Statements in which module variables may occur, and the first statement after a variable's last definition
+        self.module_may_vars_use = StatementNamesIndex()
+        self.module_vars_use_start: Dict[str, int] = {}
         self.module_vars_ln: Dict[str, Tuple[Tuple[int, int], Tuple[int, int]]] = {}
         self.module_all_annotations: Dict[Tuple, Tuple[str, str]] = {}
         #self.module_pyre_inferred_types: List[str] = []
@@ -43,6 +81,10 @@ class Visitor(cst.CSTVisitor):
         self.class_defs = []
         self.imports = []  # Names of imports
 
+        # Names of the statement being visited, in which variables may occur
+        self.smt_names: Optional[List[str]] = None
+        self.with_first_item: Optional[cst.WithItem] = None
+
         # Current stack depth specific variables for a function
         self.last_annotation = None  # Annotation for the previous parameter
         # Keep track of lambda depth in order not to assign parameters from lambda to outer function
@@ -64,7 +106,7 @@ class Visitor(cst.CSTVisitor):
         cls.variables_use_occur = self.__find_args_vars_use(list(cls.variables.keys()), self.cls_may_vars_use)
         cls.q_name = self.__get_qualified_name(node.name)
         cls.ln_col = self.__get_line_column_no(node)
-        self.cls_may_vars_use = []
+        self.cls_may_vars_use = StatementNamesIndex()
         self.cls_list.append(cls)
 
     def visit_FunctionDef(self, node: cst.FunctionDef):
@@ -100,7 +142,7 @@ class Visitor(cst.CSTVisitor):
         fn.parameters_occur = self.__find_args_vars_use(list(fn.parameters.keys()), self.fn_may_args_var_use, True)
         fn.variables_occur = self.__find_args_vars_use(list(fn.variables.keys()), self.fn_may_args_var_use)
 
-        self.fn_may_args_var_use = []
+        self.fn_may_args_var_use = StatementNamesIndex()
 
         # Retrieve & update return type from returns annotation (if it exists)
         # If return annotation does not exist, it will resolve to 'None' and then an empty
@@ -214,8 +256,7 @@ class Visitor(cst.CSTVisitor):
             import_name = self.__clean_string_whitespace(import_info["alias"])
             self.imports.append(import_name)
 
-        # No need to traverse children, as we already performed the matching.
-        return False
+        # The children are still traversed to collect the names of the import statement
 
     def visit_ImportFrom(self, node: cst.ImportFrom):
         if node.module is not None:
@@ -264,15 +305,16 @@ class Visitor(cst.CSTVisitor):
                 # Adds module-level variables
                 if 'name' in extracted_names:
                     self.module_variables[extracted_names['name']] = extracted_names['type'][0]
-                    self.module_variables_use[extracted_names['name']] = []
+                    self.module_vars_use_start[extracted_names['name']] = self.__next_module_smt()
                     self.module_vars_ln[extracted_names['name']] = self.__get_line_column_no(node.target)
                     self.module_all_annotations[(None, None, extracted_names['name'])] = extracted_names['type']
                 else:
                     ext_names_type = self.__get_type_for_names(extracted_names['names'])
                     self.module_variables = {**self.module_variables,
                                              **{n.value: t for n, t, i in ext_names_type}}
-                    self.module_variables_use = {**self.module_variables_use,
-                                                 **{n.value: [] for n, t, i in ext_names_type}}
+                    self.module_vars_use_start = {**self.module_vars_use_start,
+                                                  **{n.value: self.__next_module_smt()
+                                                     for n, t, i in ext_names_type}}
                     self.module_vars_ln = {**self.module_vars_ln,
                                            **{n.value: self.__get_line_column_no(n) for n, t, i in ext_names_type}}
                     self.module_all_annotations = {**self.module_all_annotations,
@@ -298,7 +340,7 @@ class Visitor(cst.CSTVisitor):
                     (extracted_assign['type'], DEV_TYPE_ANNOT if extracted_assign["type"] else UNK_TYPE_ANNOT)
             else:
                 self.module_variables[extracted_assign['name']] = extracted_assign['type']
-                self.module_variables_use[extracted_assign['name']] = []
+                self.module_vars_use_start[extracted_assign['name']] = self.__next_module_smt()
                 self.module_vars_ln[extracted_assign['name']] = self.__get_line_column_no(node.target)
                 self.module_all_annotations[(None, None, extracted_assign['name'])] = \
                     (extracted_assign['type'], DEV_TYPE_ANNOT if extracted_assign["type"] else UNK_TYPE_ANNOT)
@@ -310,96 +352,47 @@ class Visitor(cst.CSTVisitor):
         self.lambda_depth -= 1
 
     def visit_SimpleStatementLine(self, node: cst.SimpleStatementLine):
-        smt_names = [n.value for n in match.findall(node, match.Name(
-                value=match.SaveMatchedNode(
-                    match.DoNotCare(),
-                    'name'
-                )
-            ))]
+        self.smt_names = []
 
-        if len(self.stack) > 0:
-            self.fn_may_args_var_use.append(smt_names)
+    def leave_SimpleStatementLine(self, original_node: cst.SimpleStatementLine):
+        self.__add_statement_names()
 
-        if len(self.cls_stack) > 0:
-            if self.cls_stack[0].name in smt_names:
-                self.cls_may_vars_use.append(smt_names)
+    def visit_If_test(self, node: cst.If):
+        self.smt_names = []
 
-        self.__find_module_vars_use(smt_names)
+    def leave_If_test(self, node: cst.If):
+        self.__add_statement_names()
 
-    def visit_If(self, node: cst.If):
-        if_names = [n.value for n in match.findall(node.test, match.Name(
-                value=match.SaveMatchedNode(
-                    match.DoNotCare(),
-                    'name'
-                )
-            ))]
+    def visit_While_test(self, node: cst.While):
+        self.smt_names = []
 
-        if len(self.cls_stack) > 0:
-            if self.cls_stack[0].name in if_names:
-                self.cls_may_vars_use.append(if_names)
-
-        if len(self.stack) > 0:
-            self.fn_may_args_var_use.append(if_names)
+    def leave_While_test(self, node: cst.While):
+        self.__add_statement_names()
 
-        self.__find_module_vars_use(if_names)
+    def visit_For_iter(self, node: cst.For):
+        self.smt_names = []
 
-    def visit_While(self, node: cst.While):
-
-        while_names = [n.value for n in match.findall(node.test, match.Name(
-                value=match.SaveMatchedNode(
-                    match.DoNotCare(),
-                    'name'
-                )
-            ))]
-
-        if len(self.stack) > 0:
-            self.fn_may_args_var_use.append(while_names)
-
-        if len(self.cls_stack) > 0:
-            if self.cls_stack[0].name in while_names:
-                self.cls_may_vars_use.append(while_names)
-
-        self.__find_module_vars_use(while_names)
-
-    def visit_For(self, node: cst.For):
-
-        for_names = [n.value for n in match.findall(node.iter, match.Name(
-                value=match.SaveMatchedNode(
-                    match.DoNotCare(),
-                    'name'
-                )
-            ))]
-
-        if len(self.cls_stack) > 0:
-            if self.cls_stack[0].name in for_names:
-                self.cls_may_vars_use.append(for_names)
-
-        if len(self.stack) > 0:
-            self.fn_may_args_var_use.append(for_names)
-
-        self.__find_module_vars_use(for_names)
+    def leave_For_iter(self, node: cst.For):
+        self.__add_statement_names()
 
     def visit_With(self, node: cst.With):
-        with_names = [n.value for n in match.findall(match.extract(node, match.With( items=match.SaveMatchedNode(
-                                                                                              match.DoNotCare(),
-                                                                                              'with_items'
-                                                                                          )))['with_items'][0],
-                                                                        match.Name(
-                                                                            value=match.SaveMatchedNode(
-                                                                                match.DoNotCare(),
-                                                                                'name'
-                                                                            )
-                                                                        ))]
-        if len(self.stack) > 0:
-            self.fn_may_args_var_use.append(with_names)
+        # Only the names of the first item of a with statement are collected
+        self.with_first_item = node.items[0]
 
-        if len(self.cls_stack) > 0:
-            if self.cls_stack[0].name in with_names:
-                self.cls_may_vars_use.append(with_names)
+    def visit_WithItem(self, node: cst.WithItem):
+        if node is self.with_first_item:
+            self.smt_names = []
+
+    def leave_WithItem(self, original_node: cst.WithItem):
+        if original_node is self.with_first_item:
+            self.__add_statement_names()
 
-        self.__find_module_vars_use(with_names)
+    def visit_Name(self, node: cst.Name):
+        if self.smt_names is not None:
+            self.smt_names.append(node.value)
 
     def leave_Module(self, node):
+        self.module_variables_use = self.__find_module_vars_use()
         try:
             # Calculating the type annotation coverage of the module.
             all_annot_filtered = {k: v for k, v in self.module_all_annotations.items() if k[2] != 'self'}
@@ -628,7 +621,31 @@ class Visitor(cst.CSTVisitor):
                                              self.stack[-1].name, name)] = \
                     (name_type, INF_TYPE_ANNOT if name_type else UNK_TYPE_ANNOT)
 
-    def __find_args_vars_use(self, vars_name: list, may_vars_use: List[list], is_var_arg: bool=False) -> dict:
+    def __add_statement_names(self):
+        """
+        Adds the collected names of a statement to the statements in which variables may occur
+        """
+
+        smt_names, self.smt_names = self.smt_names, None
+        if len(self.stack) > 0:
+            self.fn_may_args_var_use.add(smt_names)
+
+        if len(self.cls_stack) > 0:
+            if self.cls_stack[0].name in smt_names:
+                self.cls_may_vars_use.add(smt_names)
+
+        self.module_may_vars_use.add(smt_names)
+
+    def __next_module_smt(self) -> int:
+        """
+        Gives the index of the next statement in which module variables may occur.
+        A variable defined in a statement is not used by the statement itself, which is added after its names.
+        """
+
+        return len(self.module_may_vars_use) + (1 if self.smt_names is not None else 0)
+
+    def __find_args_vars_use(self, vars_name: list, may_vars_use: StatementNamesIndex,
+                             is_var_arg: bool=False) -> dict:
         """
         Finds usage of variables or functions' arguments in a context
         """
@@ -640,26 +657,16 @@ class Visitor(cst.CSTVisitor):
         #         # TODO: Do not exclude non-assign statements like x+= smt
         #         return a in mu[0] or ('self' in mu[0] and a in mu[1])
 
-        fn_args_use = {}
-        for arg in vars_name:
-            arg_use = []
-            for may_use in may_vars_use:
-                if arg in may_use and len(may_use) > 1:
-                    # Excludes variable definition itself from the context hints
-                    arg_use.append(may_use)
-            fn_args_use[arg] = arg_use
-
-        return fn_args_use
+        # Excludes variable definition itself from the context hints
+        return {arg: [may_use for may_use in may_vars_use.find(arg) if len(may_use) > 1] for arg in vars_name}
 
-    def __find_module_vars_use(self, may_vars_use: list):
+    def __find_module_vars_use(self) -> Dict[str, List[list]]:
         """
-        Finds usage of module variables in a context
+        Finds usage of module variables in the statements after their last definition
         """
 
-        for v in self.module_variables.keys():
-            # TODO: To be more exact, the variable can be checked whether it's in functions' vars or class vars
-            if v in may_vars_use:
-                self.module_variables_use[v].append(may_vars_use)
+        # TODO: To be more exact, the variable can be checked whether it's in functions' vars or class vars
+        return {v: self.module_may_vars_use.find(v, start) for v, start in self.module_vars_use_start.items()}
 
     def __convert_node_to_code(self, node) -> str:
         """
@@ -0,0 +1,101 @@
+"""
+The JSONL output format of processed projects.
+Each line of a project's JSONL file is either a processed source file or the project's summary, which is the last line:
+    {"project": "author/repo", "file": "repo/path/to/file.py", "module": {...}}
+    {"project": "author/repo", "type_annot_cove": 0.5, "no_files": 10}
+"""
+
+from typing import Iterator, Tuple, Optional, List
+from libsa4py.utils import list_files
+import json
+import os
+
+
+class ProjectJSONLWriter:
+    """
+    It streams the processed files of a project to a JSONL file as soon as they are extracted.
+    The lines are written to a temporary file, which is renamed once the project's summary is written. Hence, a
+    partially-processed project is never mistaken for a processed one.
+    """
+
+    def __init__(self, filename: str, project_id: str):
+        self.filename = filename
+        self.tmp_filename = filename + '.tmp'
+        self.project_id = project_id
+        self.no_files = 0
+        self.type_annot_cove_sum = 0.0
+
+        open(self.tmp_filename, 'w').close()
+
+    def write_file(self, f_relative: str, extracted_module: dict):
+        # The file is re-opened for every line, since the file-level scheduler writes to many projects at once
+        with open(self.tmp_filename, 'a') as jsonl_f:
+            jsonl_f.write(json.dumps({"project": self.project_id, "file": f_relative, "module": extracted_module},
+                                     separators=(',', ':')) + '\n')
+        self.no_files += 1
+        self.type_annot_cove_sum += extracted_module['type_annot_cove']
+
+    def close(self) -> Optional[float]:
+        """
+        Writes the project's summary and gives its type annotation coverage.
+        A project without any processed file is not saved.
+        """
+
+        if self.no_files == 0:
+            os.remove(self.tmp_filename)
+            return None
+
+        type_annot_cove = round(self.type_annot_cove_sum / self.no_files, 2)
+        with open(self.tmp_filename, 'a') as jsonl_f:
+            jsonl_f.write(json.dumps({"project": self.project_id, "type_annot_cove": type_annot_cove,
+                                      "no_files": self.no_files}, separators=(',', ':')) + '\n')
+        os.replace(self.tmp_filename, self.filename)
+        return type_annot_cove
+
+
+def iter_project_jsonl(filename: str) -> Iterator[Tuple[str, str, dict]]:
+    """
+    Reads the processed files of a project's JSONL file one by one.
+    :return: an iterator over (project id, file path relative to the dataset, module dict)
+    """
+
+    with open(filename, 'r') as jsonl_f:
+        for line in jsonl_f:
+            line_d = json.loads(line)
+            if 'file' in line_d:
+                yield line_d['project'], line_d['file'], line_d['module']
+
+
+def load_project_jsonl(filename: str) -> dict:
+    """
+    Loads a project's JSONL file into the same dictionary as the project's JSON file
+    """
+
+    project_dict = {}
+    with open(filename, 'r') as jsonl_f:
+        for line in jsonl_f:
+            line_d = json.loads(line)
+            if line_d['project'] not in project_dict:
+                project_dict[line_d['project']] = {"src_files": {}, "type_annot_cove": 0.0}
+            if 'file' in line_d:
+                project_dict[line_d['project']]['src_files'][line_d['file']] = line_d['module']
+            else:
+                project_dict[line_d['project']]['type_annot_cove'] = line_d['type_annot_cove']
+
+    return project_dict
+
+
+def list_processed_projects(processed_projects_path: str) -> List[str]:
+    """
+    Lists the JSON and JSONL files of processed projects. A project that is processed in both output formats, e.g., by
+    re-running the pipeline with another `--of`, is only listed with its JSON file, so that it is not read twice.
+    """
+
+    json_files = list_files(processed_projects_path, ".json")
+    json_projects = {os.path.splitext(f)[0] for f in json_files}
+    jsonl_files = list_files(processed_projects_path, ".jsonl")
+    dup_jsonl_files = [f for f in jsonl_files if os.path.splitext(f)[0] in json_projects]
+    if len(dup_jsonl_files) != 0:
+        print(f"Ignoring the JSONL files of {len(dup_jsonl_files)} projects that also have a JSON file:",
+              dup_jsonl_files)
+    return json_files + [f for f in jsonl_files if os.path.splitext(f)[0] not in json_projects]
@@ -2,37 +2,275 @@
 This module contains a set of helper functions to merge processed projects into a Dataframe or a single JSON
 """
 
-from libsa4py.utils import list_files, save_json
+from typing import Iterator, Tuple, List
+from libsa4py.utils import mk_dir_not_exist, ParallelExecutor
+from libsa4py.jsonl_output import load_project_jsonl, list_processed_projects
 from libsa4py.nl_preprocessing import NLPreprocessor
 from tqdm import tqdm
 from os.path import join
+import os
+import math
 import json
-import numpy as np
-import pandas as pd
+import shutil
 
 NLP_P = NLPreprocessor()
 
+FNS_COLUMNS = ['author', 'repo', 'file', 'name', 'set', 'has_type', 'docstring', 'func_descr', 'arg_names',
+               'arg_types', 'arg_descrs', 'return_type', 'return_expr', 'args_occur', 'return_descr', 'variables',
+               'variables_types', 'aval_types', 'arg_names_len', 'arg_types_len']
+VARS_COLUMNS = ['author', 'repo', 'file', 'set', 'cls_name', 'fn_name', 'var_name', 'var_type', 'var_occur',
+                'aval_types']
+# Max. number of rows that are kept in memory before being appended to a dataframe's file
+DF_CHUNK_SIZE = 10000
+# Number of shards per worker for a parallel merge, so that the workers stay busy with projects of different sizes
+SHARDS_PER_WORKER = 4
+MERGED_JSON_START = '{\n    "projects": {\n'
+MERGED_JSON_END = '\n    }\n}'
 
-def merge_jsons_to_dict(json_files: list, limit: int = None) -> dict:
+
+def load_project(filename: str) -> Tuple[str, dict]:
+    """
+    Loads a project's JSON (or JSONL) file
+    :return: the project's id and its dictionary
+    """
+
+    if filename.endswith('.jsonl'):
+        d = load_project_jsonl(filename)
+    else:
+        with open(filename, 'r') as json_f:
+            d = json.load(json_f)
+    p = list(d.keys())[0]
+    return p, d[p]
+
+
+def iter_projects(json_files: list, limit: int = None, progress_bar: bool = True) -> Iterator[Tuple[str, dict]]:
     """
-    Merges all the JSON files of projects into a dictionary
+    Reads the JSON (or JSONL) files of projects one at a time, so that only one project is kept in memory
     """
 
     if limit is not None:
         json_files = json_files[:limit]
 
+    for f in tqdm(json_files, total=len(json_files), desc="Merging JSONs", disable=not progress_bar):
+        try:
+            yield load_project(f)
+        except json.JSONDecodeError as err:
+            print("Could not parse file: ", f)
+
+
+def merge_jsons_to_dict(json_files: list, limit: int = None) -> dict:
+    """
+    Merges all the JSON (or JSONL) files of projects into a dictionary
+    """
+
     all_projects_dict = {'projects': {}}
-    for f in tqdm(json_files, total=len(json_files), desc="Merging JSONs"):
-        with open(f, 'r') as json_f:
-            try:
-                d = json.load(json_f)
-                all_projects_dict['projects'][list(d.keys())[0]] = d[list(d.keys())[0]]
-            except json.JSONDecodeError as err:
-                print("Could not parse file: ", f)
+    for p, p_dict in iter_projects(json_files, limit):
+        all_projects_dict['projects'][p] = p_dict
 
     return all_projects_dict
 
 
+class MergedJSONWriter:
+    """
+    It writes projects to a single merged JSON file one by one.
+    The file is identical to saving the dictionary of all the merged projects with `save_json`.
+    A shard only holds its projects, without the merged dictionary around them, so that it can be appended to the
+    merged JSON file.
+    """
+
+    def __init__(self, filename: str, is_shard: bool = False):
+        self.json_f = open(filename, 'w')
+        self.is_shard = is_shard
+        self.is_empty = True
+
+    def __write_separator(self):
+        if self.is_empty:
+            if not self.is_shard:
+                self.json_f.write(MERGED_JSON_START)
+            self.is_empty = False
+        else:
+            self.json_f.write(',\n')
+
+    def write_project(self, project_id: str, project_dict: dict):
+        # The project is dumped inside the merged dict so that it is indented just like in the whole dict
+        p_json = json.dumps({'projects': {project_id: project_dict}}, indent=4)
+        self.__write_separator()
+        self.json_f.write(p_json[len(MERGED_JSON_START):-len(MERGED_JSON_END)])
+
+    def append_shard(self, shard_filename: str):
+        if os.path.getsize(shard_filename) > 0:
+            self.__write_separator()
+            with open(shard_filename, 'r') as shard_f:
+                shutil.copyfileobj(shard_f, self.json_f)
+
+    def close(self):
+        if not self.is_shard:
+            self.json_f.write('{\n    "projects": {}\n}' if self.is_empty else MERGED_JSON_END)
+        self.json_f.close()
+
+
+class CSVChunkWriter:
+    """
+    It appends the rows of a dataframe to a CSV file in chunks of at most `chunk_size` rows.
+    A shard is written without the header so that it can be appended to another CSV file.
+    """
+
+    encode_rows = True
+
+    def __init__(self, filename: str, columns: List[str], chunk_size: int = DF_CHUNK_SIZE, header: bool = True):
+        self.csv_f = open(filename, 'w')
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.write_header = header
+
+    def write_rows(self, rows: list):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        import pandas as pd
+        if self.rows or self.write_header:
+            pd.DataFrame(self.rows, columns=self.columns).to_csv(self.csv_f, header=self.write_header, index=False)
+        self.write_header = False
+        self.rows = []
+
+    def append_shard(self, shard_filename: str):
+        self.flush()
+        with open(shard_filename, 'r') as shard_f:
+            shutil.copyfileobj(shard_f, self.csv_f)
+
+    def close(self):
+        self.flush()
+        self.csv_f.close()
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Writing Parquet files requires pyarrow: pip install libsa4py[parquet]")
+    return pyarrow, pyarrow.parquet
+
+
+def fns_parquet_schema():
+    """
+    The schema of the functions' dataframe as a Parquet file.
+    Unlike the CSV file, lists are stored as list columns, and strings that repeat a lot are dictionary-encoded.
+    The occurrences of an argument are always a list of tokens, whether or not the NLP preprocessing was applied.
+    """
+
+    pa, _ = import_pyarrow()
+    category = pa.dictionary(pa.int32(), pa.string())
+    str_list = pa.list_(pa.string())
+    return pa.schema([('author', category), ('repo', category), ('file', category), ('name', pa.string()),
+                      ('set', category), ('has_type', pa.bool_()), ('docstring', pa.string()),
+                      ('func_descr', pa.string()), ('arg_names', str_list), ('arg_types', str_list),
+                      ('arg_descrs', str_list), ('return_type', category), ('return_expr', str_list),
+                      ('args_occur', pa.list_(str_list)), ('return_descr', pa.string()),
+                      ('variables', str_list), ('variables_types', str_list), ('aval_types', str_list),
+                      ('arg_names_len', pa.int64()), ('arg_types_len', pa.int64())])
+
+
+def vars_parquet_schema():
+    """
+    The schema of the variables' dataframe as a Parquet file
+    """
+
+    pa, _ = import_pyarrow()
+    category = pa.dictionary(pa.int32(), pa.string())
+    str_list = pa.list_(pa.string())
+    return pa.schema([('author', category), ('repo', category), ('file', category), ('set', category),
+                      ('cls_name', category), ('fn_name', pa.string()), ('var_name', pa.string()),
+                      ('var_type', category), ('var_occur', str_list), ('aval_types', str_list)])
+
+
+class ParquetChunkWriter:
+    """
+    It appends the rows of a dataframe to a Parquet file, where every chunk of at most `chunk_size` rows is a row group
+    """
+
+    encode_rows = False
+
+    def __init__(self, filename: str, schema, chunk_size: int = DF_CHUNK_SIZE):
+        self.pa, self.pq = import_pyarrow()
+        self.schema = schema
+        self.pq_writer = self.pq.ParquetWriter(filename, schema)
+        self.chunk_size = chunk_size
+        self.rows = []
+
+    def write_rows(self, rows: list):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.pq_writer.write_table(self.pa.Table.from_arrays([self.pa.array(c, type=t) for c, t in
+                                                                  zip(zip(*self.rows), self.schema.types)],
+                                                                 schema=self.schema))
+        self.rows = []
+
+    def append_shard(self, shard_filename: str):
+        self.flush()
+        shard_f = self.pq.ParquetFile(shard_filename)
+        for i in range(shard_f.num_row_groups):
+            self.pq_writer.write_table(shard_f.read_row_group(i))
+
+    def close(self):
+        self.flush()
+        self.pq_writer.close()
+
+
+def flatten_occur(occur: list) -> list:
+    """
+    Flattens the occurrences of an identifier into a list of tokens, as the NLP preprocessing of the pipeline does
+    """
+
+    return [t for o in occur for t in o] if len(occur) > 0 and isinstance(occur[0], list) else occur
+
+
+def extract_project_fns(p: str, project: dict, encode: bool = True) -> list:
+    """
+    Extracts all the functions of a project's dictionary in a format that can be converted to a dataframe
+    :param encode: whether lists are encoded as strings and missing values as NaN, as in the CSV dataframe
+    """
+
+    enc = str if encode else lambda l: l
+    # NaN, same as np.nan, without importing numpy
+    missing = float('nan') if encode else None
+    fns = []
+    p_fns = {'author': '', 'repo': '', 'files': {}}
+    p_fns['author'], p_fns['repo'] = p.split("/")
+    for f in project['src_files'].keys():
+        p_fns['files'][f] = {}
+        p_fns['files'][f]['set'] = project['src_files'][f]['set']
+        p_fns['files'][f]['imports'] = [NLP_P.process_identifier(i) for i in project['src_files'][f]['imports']]
+        cls_fns = [f for c in project['src_files'][f]['classes'] for f in c['funcs']]
+        f_fns = project['src_files'][f]['funcs']
+        p_fns['files'][f]['fns'] = f_fns + cls_fns
+    for f in p_fns['files']:
+        for fn in p_fns['files'][f]['fns']:
+            fns.append([p_fns['author'], p_fns['repo'], f, fn['name'], p_fns['files'][f]['set'],
+                        any(t for t in list(fn['params'].values())) or fn['ret_type'] != '',
+                        fn['docstring']['long_descr'] if fn['docstring']['long_descr'] is not None else missing,
+                        fn['docstring']['func'] if fn['docstring']['func'] is not None else missing,
+                        enc(list(fn['params'].keys())), enc(list(fn['params'].values())),
+                        enc(list(fn['params_descr'].values())),
+                        fn['ret_type'] if fn['ret_type'] != '' else missing,
+                        enc(fn['ret_exprs']),
+                        str(list(fn['params_occur'].values())) if encode else
+                        [flatten_occur(o) for o in fn['params_occur'].values()],
+                        fn['docstring']['ret'] if fn['docstring']['ret'] is not None else missing,
+                        list(fn['variables'].keys()), list(fn['variables'].values()),
+                        enc(p_fns['files'][f]['imports']), len(list(fn['params'].keys())),
+                        len([t for t in list(fn['params'].values()) if t != ''])])
+
+    return fns
+
+
 def extract_fns(projects: dict) -> list:
     """
     Extracts all the functions from the projects' dictionary in a format that can be converted to a dataframe
@@ -40,34 +278,56 @@ def extract_fns(projects: dict) -> list:
 
     fns = []
     for p in tqdm(list(projects['projects'].keys()), total=len(projects['projects'].keys()), desc="Extracting all functions"):
-        p_fns = {'author': '', 'repo': '', 'files': {}}
-        p_fns['author'], p_fns['repo'] = p.split("/")
-        for f in projects['projects'][p]['src_files'].keys():
-            p_fns['files'][f] = {}
-            p_fns['files'][f]['set'] = projects['projects'][p]['src_files'][f]['set']
-            p_fns['files'][f]['imports'] = [NLP_P.process_identifier(i) for i in
-                                            projects['projects'][p]['src_files'][f]['imports']]
-            cls_fns = [f for c in projects['projects'][p]['src_files'][f]['classes'] for f in c['funcs']]
-            f_fns = projects['projects'][p]['src_files'][f]['funcs']
-            p_fns['files'][f]['fns'] = f_fns + cls_fns
-        for f in p_fns['files']:
-            for fn in p_fns['files'][f]['fns']:
-                fns.append([p_fns['author'], p_fns['repo'], f, fn['name'], p_fns['files'][f]['set'],
-                            any(t for t in list(fn['params'].values())) or fn['ret_type'] != '',
-                            fn['docstring']['long_descr'] if fn['docstring']['long_descr'] is not None else np.NaN,
-                            fn['docstring']['func'] if fn['docstring']['func'] is not None else np.NaN,
-                            str(list(fn['params'].keys())), str(list(fn['params'].values())),
-                            str(list(fn['params_descr'].values())),
-                            fn['ret_type'] if fn['ret_type'] != '' else np.NaN,
-                            str(fn['ret_exprs']), str(list(fn['params_occur'].values())),
-                            fn['docstring']['ret'] if fn['docstring']['ret'] is not None else np.NaN,
-                            list(fn['variables'].keys()), list(fn['variables'].values()),
-                            str(p_fns['files'][f]['imports']), len(list(fn['params'].keys())),
-                            len([t for t in list(fn['params'].values()) if t != ''])])
+        fns.extend(extract_project_fns(p, projects['projects'][p]))
 
     return fns
 
 
+def extract_project_vars(p: str, project: dict, encode: bool = True) -> list:
+    """
+    Extracts all the variables of a project's dictionary in a format that can be converted to a dataframe
+    :param encode: whether lists are encoded as strings, as in the CSV dataframe
+    """
+
+    enc = str if encode else lambda l: l
+    enc_occur = (lambda o: o) if encode else flatten_occur
+    vars = []
+    p_vars = {'author': '', 'repo': ''}
+    p_vars['author'], p_vars['repo'] = p.split("/")
+    for f in project['src_files'].keys():
+        # module vars
+        m_v_occur = list(project['src_files'][f]['mod_var_occur'].values())
+        for i, m_v in enumerate(project['src_files'][f]['variables'].keys()):
+            vars.append([p_vars['author'], p_vars['repo'], f, project['src_files'][f]['set'],
+                         None, None, m_v, project['src_files'][f]['variables'][m_v], enc_occur(m_v_occur[i]),
+                         enc(project['src_files'][f]['imports'])])
+
+        for c in project['src_files'][f]['classes']:
+            # class vars
+            c_v_occur = list(c['cls_var_occur'].values())
+            for i, c_v in enumerate(c['variables'].keys()):
+                vars.append([p_vars['author'], p_vars['repo'], f, project['src_files'][f]['set'],
+                             c['name'], None, c_v, c['variables'][c_v], enc_occur(c_v_occur[i]),
+                             enc(project['src_files'][f]['imports'])])
+
+            for c_fn in c['funcs']:
+                # class functions vars
+                c_fn_occur = list(c_fn['fn_var_occur'].values())
+                for i, fn_v in enumerate(c_fn['variables'].keys()):
+                    vars.append([p_vars['author'], p_vars['repo'], f, project['src_files'][f]['set'],
+                                 c['name'], c_fn['name'], fn_v, c_fn['variables'][fn_v], enc_occur(c_fn_occur[i]),
+                                 enc(project['src_files'][f]['imports'])])
+
+        for fn in project['src_files'][f]['funcs']:
+            # module functions vars
+            fn_v_occur = list(fn['fn_var_occur'].values())
+            for i, fn_v in enumerate(fn['variables'].keys()):
+                vars.append([p_vars['author'], p_vars['repo'], f, project['src_files'][f]['set'],
+                             None, fn['name'], fn_v, fn['variables'][fn_v], enc_occur(fn_v_occur[i]),
+                             enc(project['src_files'][f]['imports'])])
+    return vars
+
+
 def extract_vars(projects: dict) -> list:
     """
     Extracts all the variables from the projects' dictionary in a format that can be converted to a dataframe
@@ -75,39 +335,7 @@ def extract_vars(projects: dict) -> list:
 
     vars = []
     for p in tqdm(list(projects['projects'].keys()), total=len(projects['projects'].keys()), desc="Extracting all variables"):
-        p_vars = {'author': '', 'repo': ''}
-        p_vars['author'], p_vars['repo'] = p.split("/")
-        for f in projects['projects'][p]['src_files'].keys():
-            # module vars
-            m_v_occur = list(projects['projects'][p]['src_files'][f]['mod_var_occur'].values())
-            for i, m_v in enumerate(projects['projects'][p]['src_files'][f]['variables'].keys()):
-                vars.append([p_vars['author'], p_vars['repo'], f, projects['projects'][p]['src_files'][f]['set'], 
-                             None, None, m_v, projects['projects'][p]['src_files'][f]['variables'][m_v], m_v_occur[i],
-                             str(projects['projects'][p]['src_files'][f]['imports'])])
-
-            for c in projects['projects'][p]['src_files'][f]['classes']:
-                # class vars
-                c_v_occur = list(c['cls_var_occur'].values())
-                for i, c_v in enumerate(c['variables'].keys()):
-                    vars.append([p_vars['author'], p_vars['repo'], f, projects['projects'][p]['src_files'][f]['set'], 
-                                 c['name'], None, c_v, c['variables'][c_v], c_v_occur[i],
-                                 str(projects['projects'][p]['src_files'][f]['imports'])])
-                
-                for c_fn in c['funcs']:
-                    # class functions vars
-                    c_fn_occur = list(c_fn['fn_var_occur'].values())
-                    for i, fn_v in enumerate(c_fn['variables'].keys()):
-                        vars.append([p_vars['author'], p_vars['repo'], f, projects['projects'][p]['src_files'][f]['set'], 
-                                     c['name'], c_fn['name'], fn_v, c_fn['variables'][fn_v], c_fn_occur[i],
-                                     str(projects['projects'][p]['src_files'][f]['imports'])])
-
-            for fn in projects['projects'][p]['src_files'][f]['funcs']:
-                # module functions vars
-                fn_v_occur = list(fn['fn_var_occur'].values())
-                for i, fn_v in enumerate(fn['variables'].keys()):
-                    vars.append([p_vars['author'], p_vars['repo'], f, projects['projects'][p]['src_files'][f]['set'], 
-                                 None, fn['name'], fn_v, fn['variables'][fn_v], fn_v_occur[i],
-                                 str(projects['projects'][p]['src_files'][f]['imports'])])
+        vars.extend(extract_project_vars(p, projects['projects'][p]))
     return vars
 
 def create_dataframe_vars(output_path: str, merged_jsons: dict):
@@ -115,9 +343,9 @@ def create_dataframe_vars(output_path: str, merged_jsons: dict):
     Creates a single dataframe that contains all the extracted variables and type hints for further processing
     """
 
+    import pandas as pd
     vars = extract_vars(merged_jsons)
-    df_vars = pd.DataFrame(vars, columns=['author', 'repo', 'file', 'set', 'cls_name', 'fn_name', 'var_name', 'var_type',
-                                          'var_occur', 'aval_types'])
+    df_vars = pd.DataFrame(vars, columns=VARS_COLUMNS)
     df_vars.to_csv(join(output_path, 'all_vars.csv'), index=False)
 
 def create_dataframe_fns(output_path: str, merged_jsons: dict):
@@ -125,18 +353,95 @@ def create_dataframe_fns(output_path: str, merged_jsons: dict):
     Creates a single dataframe that contains all the extracted functions and type hints for further processing
     """
 
+    import pandas as pd
     fns = extract_fns(merged_jsons)
-    df_fns = pd.DataFrame(fns, columns=['author', 'repo', 'file', 'name', 'set', 'has_type', 'docstring', 'func_descr',
-                                        'arg_names', 'arg_types', 'arg_descrs', 'return_type', 'return_expr',
-                                        'args_occur', 'return_descr', 'variables', 'variables_types', 'aval_types',
-                                        'arg_names_len', 'arg_types_len'])
+    df_fns = pd.DataFrame(fns, columns=FNS_COLUMNS)
     df_fns.to_csv(join(output_path, 'all_fns.csv'), index=False)
 
 
+# The dataframes of merged projects with their columns, Parquet schema, and the extractor of a project's rows
+DATAFRAMES = {'fns': (FNS_COLUMNS, fns_parquet_schema, extract_project_fns),
+              'vars': (VARS_COLUMNS, vars_parquet_schema, extract_project_vars)}
+
+
+def create_df_writers(path_prefix: str, dfs: List[str], df_format: str, is_shard: bool = False) -> dict:
+    """
+    Creates the writers of the given dataframes, e.g., `{path_prefix}_fns.csv` for the functions' dataframe
+    :param dfs: names of the dataframes, i.e., fns and/or vars
+    :param df_format: either csv or parquet
+    """
+
+    df_writers = {}
+    for df in dfs:
+        columns, parquet_schema, _ = DATAFRAMES[df]
+        if df_format == 'parquet':
+            df_writers[df] = ParquetChunkWriter('%s_%s.parquet' % (path_prefix, df), parquet_schema())
+        else:
+            df_writers[df] = CSVChunkWriter('%s_%s.csv' % (path_prefix, df), columns, header=not is_shard)
+    return df_writers
+
+
+def write_merged_projects(json_files: list, json_writer: MergedJSONWriter, df_writers: dict,
+                          progress_bar: bool = True):
+    """
+    Writes the given projects to the merged JSON file and the dataframes one at a time
+    """
+
+    for p, p_dict in iter_projects(json_files, progress_bar=progress_bar):
+        json_writer.write_project(p, p_dict)
+        for df, df_writer in df_writers.items():
+            df_writer.write_rows(DATAFRAMES[df][2](p, p_dict, df_writer.encode_rows))
+    json_writer.close()
+    for df_writer in df_writers.values():
+        df_writer.close()
+
+
+def merge_projects_shard(json_files: list, shard_path: str, dfs: List[str], df_format: str):
+    """
+    Merges a shard of projects into a part of the merged JSON file and a part of each dataframe
+    """
+
+    write_merged_projects(json_files, MergedJSONWriter(shard_path + '.json', is_shard=True),
+                          create_df_writers(shard_path, dfs, df_format, is_shard=True), progress_bar=False)
+
+
 def merge_projects(args):
     """
-    Saves merged projects into a single JSON file and a Dataframe
+    Saves merged projects into a single JSON file and the dataframes of functions and, optionally, variables.
+    Projects are read, written, and converted to the dataframes' rows one at a time, so the memory usage does not
+    grow with the number of projects.
+    With more than one worker, consecutive projects are merged into shards in parallel, which are then concatenated
+    in order. Hence, the output does not depend on the number of workers.
     """
-    merged_jsons = merge_jsons_to_dict(list_files(join(args.o, 'processed_projects'), ".json"), args.l)
-    save_json(join(args.o, 'merged_%s_projects.json' % (str(args.l) if args.l is not None else 'all')), merged_jsons)
-    create_dataframe_fns(args.o, merged_jsons)
+
+    # Imported here since joblib imports numpy, which is slow
+    from joblib import delayed
+    json_files = list_processed_projects(join(args.o, 'processed_projects'))
+    if args.l is not None:
+        json_files = json_files[:args.l]
+    dfs = ['fns', 'vars'] if args.vars else ['fns']
+
+    json_writer = MergedJSONWriter(join(args.o, 'merged_%s_projects.json' % (str(args.l) if args.l is not None
+                                                                               else 'all')))
+    df_writers = create_df_writers(join(args.o, 'all'), dfs, args.df_format)
+
+    if args.j == 1:
+        write_merged_projects(json_files, json_writer, df_writers)
+        return
+
+    shards_path = join(args.o, 'merge_shards')
+    mk_dir_not_exist(shards_path)
+    shard_size = max(1, math.ceil(len(json_files) / (args.j * SHARDS_PER_WORKER)))
+    shards = [json_files[i:i + shard_size] for i in range(0, len(json_files), shard_size)]
+    ParallelExecutor(n_jobs=args.j)(total=len(shards), desc="Merging shards")(
+        delayed(merge_projects_shard)(s, join(shards_path, 'shard_%d' % i), dfs, args.df_format)
+        for i, s in enumerate(shards))
+
+    for i in range(len(shards)):
+        json_writer.append_shard(join(shards_path, 'shard_%d.json' % i))
+        for df, df_writer in df_writers.items():
+            df_writer.append_shard(join(shards_path, 'shard_%d_%s.%s' % (i, df, args.df_format)))
+    json_writer.close()
+    for df_writer in df_writers.values():
+        df_writer.close()
+    shutil.rmtree(shards_path)
@@ -0,0 +1,129 @@
+"""
+A persistent cache for the extracted representation of source code files.
+"""
+
+from typing import Optional
+from os.path import join, exists
+from libcst.metadata.type_inference_provider import PyreData
+from libsa4py import __version__
+import hashlib
+import json
+import os
+import tempfile
+
+
+class ModuleCache:
+    """
+    It stores the output of `ModuleInfo.to_dict()` on disk, keyed by a hash of a file's source code and the
+    extraction options. Hence, unchanged files and files shared across projects (e.g. vendored files in forks) are
+    extracted only once. The least recently used entries are evicted when the cache exceeds its maximum size.
+    """
+
+    # Number of stored entries after which the actual size of the cache on disk is re-calculated.
+    # Workers share the cache directory, so a worker's own estimate of the cache size falls behind.
+    SIZE_RECOUNT_INTERVAL = 256
+
+    def __init__(self, cache_dir: str, max_size_mb: int = 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.__no_puts = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.__size = sum(s for _, s, _ in self.__list_entries())
+
+    @staticmethod
+    def make_key(program: str, nlp_transf: bool, include_seq2seq: bool,
+                 program_types: Optional[PyreData] = None) -> str:
+        """
+        Creates the cache key of a source file given the extraction options.
+        """
+
+        pyre_hash = hashlib.sha256(json.dumps(program_types, sort_keys=True).encode()).hexdigest() \
+            if program_types is not None else 'none'
+        options = "v=%s;nlp=%d;seq2seq=%d;pyre=%s" % (__version__, nlp_transf, include_seq2seq, pyre_hash)
+        key_hash = hashlib.sha256(options.encode())
+        key_hash.update(program.encode('utf-8', 'surrogatepass'))
+        return key_hash.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the cached module dict of the given key or None if it is not cached.
+        """
+
+        entry_path = self.__entry_path(key)
+        try:
+            with open(entry_path, 'r') as entry_f:
+                module_dict = json.load(entry_f)
+            # Updating the modification time marks the entry as recently used
+            os.utime(entry_path)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return module_dict
+
+    def put(self, key: str, module_dict: dict):
+        """
+        Stores a module dict in the cache and evicts the least recently used entries if the cache is full.
+        """
+
+        entry_dir = join(self.cache_dir, key[:2])
+        os.makedirs(entry_dir, exist_ok=True)
+
+        # Writes to a temporary file first so that concurrent workers never read a partially-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as entry_f:
+            json.dump(module_dict, entry_f, separators=(',', ':'))
+        self.__size += os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.__entry_path(key))
+
+        self.__no_puts += 1
+        if self.__no_puts % self.SIZE_RECOUNT_INTERVAL == 0:
+            self.__size = sum(s for _, s, _ in self.__list_entries())
+
+        if self.__size > self.max_size:
+            self.evict()
+
+    def evict(self, target_ratio: float = 0.9):
+        """
+        Removes the least recently used entries until the cache size drops below `target_ratio` of its maximum size.
+        """
+
+        entries = sorted(self.__list_entries(), key=lambda e: e[2])
+        self.__size = sum(s for _, s, _ in entries)
+
+        for entry_path, entry_size, _ in entries:
+            if self.__size <= self.max_size * target_ratio:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                # Already evicted by another worker
+                pass
+            self.__size -= entry_size
+
+    def __entry_path(self, key: str) -> str:
+        return join(self.cache_dir, key[:2], key + '.json')
+
+    def __list_entries(self) -> list:
+        """
+        Lists the (path, size, modification time) of all the cache entries.
+        """
+
+        entries = []
+        if not exists(self.cache_dir):
+            return entries
+
+        for entry_dir in os.scandir(self.cache_dir):
+            if entry_dir.is_dir():
+                for entry in os.scandir(entry_dir.path):
+                    if entry.name.endswith('.json'):
+                        try:
+                            entry_stat = entry.stat()
+                            entries.append((entry.path, entry_stat.st_size, entry_stat.st_mtime))
+                        except OSError:
+                            pass
+        return entries
@@ -1,15 +1,13 @@
 from __future__ import unicode_literals
-from functools import reduce
-from typing import Optional, Tuple, List, Pattern, Match
+from typing import Optional, Tuple, List, Dict, FrozenSet, Pattern, Match
+from collections import OrderedDict
+from libsa4py.utils import write_file_atomic
 
 import docstring_parser
 import re
+import os
+import json
 import functools
-import nltk
-
-NLTK_STOP_WORDS = nltk.corpus.stopwords.words('english')
-LEMMATIZER = nltk.WordNetLemmatizer()
-LEMMATIZER.lemmatize("warm up")  # Loads lemmatizer corpus
 
 # nltk.download('averaged_perceptron_tagger')
 # nltk.download('stopwords')
@@ -18,11 +16,207 @@ LEMMATIZER.lemmatize("warm up")  # Loads lemmatizer corpus
 # Precompile often used regex
 first_cap_regex = re.compile('(.)([A-Z][a-z]+)')
 all_cap_regex = re.compile('([a-z0-9])([A-Z])')
+whitespace_regex = re.compile(r"[ \t\n]+")
+digits_regex = re.compile('[0-9]+')
+punctuation_regex = re.compile('[^A-Za-z0-9 ]+')
+# Digits, punctuation, underscores, and whitespace all become word separators, which is done in one pass
+non_letters_regex = re.compile('[^A-Za-z]+')
+special_tks = {"#[comment]": "[comment]", "\"\"\"[docstring]\"\"\"": "[docstring]", "\"[string]\"": "[string]",
+               "\"[number]\"": "[number]"}
+special_tks_regex = re.compile("(%s)" % "|".join(map(re.escape, special_tks.keys())))
+
+
+# NLTK and its corpora are loaded on first use rather than on import, which is slow and not needed without NLP
+@functools.lru_cache(maxsize=None)
+def get_stop_words() -> FrozenSet[str]:
+    import nltk
+    return frozenset(nltk.corpus.stopwords.words('english'))
+
+
+@functools.lru_cache(maxsize=None)
+def get_lemmatizer():
+    import nltk
+    lemmatizer = nltk.WordNetLemmatizer()
+    lemmatizer.lemmatize("warm up")  # Loads lemmatizer corpus
+    return lemmatizer
+
+
+def __getattr__(name: str):
+    # NLTK_STOP_WORDS and LEMMATIZER are module attributes for backward compatibility
+    if name == 'NLTK_STOP_WORDS':
+        return get_stop_words()
+    elif name == 'LEMMATIZER':
+        return get_lemmatizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class NLPCache:
+    """
+    A bounded cache of processed identifiers or sentences. When full, it evicts its least recently used ('lru') or
+    oldest ('fifo') entries. If `track_new_entries` is set, the entries put and the hits and misses since the last
+    `pop_new_entries` are kept to be persisted.
+    """
+
+    def __init__(self, max_size: int = 65536, policy: str = 'lru', track_new_entries: bool = False):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError("Value %s not supported as eviction policy" % policy)
+        self.max_size = max_size
+        self.policy = policy
+        self.track_new_entries = track_new_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.new_entries: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.new_hits = 0
+        self.new_misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            self.new_misses += 1
+        else:
+            self.hits += 1
+            self.new_hits += 1
+            if self.policy == 'lru':
+                self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.track_new_entries:
+            self.new_entries[key] = value
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def update(self, entries: Dict[str, str]):
+        """
+        Pre-warms the cache with the given entries, which are not tracked as new
+        """
+        for key, value in entries.items():
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop_new_entries(self) -> Tuple[Dict[str, str], int, int]:
+        """
+        :return: the new entries, hits, and misses since the last call
+        """
+        new_entries, new_hits, new_misses = self.new_entries, self.new_hits, self.new_misses
+        self.new_entries, self.new_hits, self.new_misses = {}, 0, 0
+        return new_entries, new_hits, new_misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses != 0 else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# The caches of a process, shared by all of its NLPreprocessor instances with the same cache configuration
+NLP_CACHES: Dict[Tuple[int, str, Optional[str]], Dict[str, NLPCache]] = {}
+
+
+def nlp_cache_files(cache_file: str) -> List[str]:
+    """
+    Gives the persisted cache file and the files of the entries that processes appended to it, which are not compacted
+    """
+    cache_dir, cache_name = os.path.split(os.path.abspath(cache_file))
+    parts = sorted(os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.startswith(cache_name + '.') and
+                   f.endswith('.part')) if os.path.isdir(cache_dir) else []
+    return ([cache_file] if os.path.exists(cache_file) else []) + parts
+
+
+def load_nlp_cache(cache_file: str) -> Tuple[Dict[str, Dict[str, str]], int, int]:
+    """
+    Loads the persisted entries of the caches of identifiers and sentences.
+    :return: the entries per cache, and the total hits and misses of the processes that appended entries
+    """
+    entries = {'identifiers': {}, 'sentences': {}}
+    hits, misses = 0, 0
+    for f in nlp_cache_files(cache_file):
+        with open(f) as cache_f:
+            for line in cache_f:
+                try:
+                    line = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partially-written line of an interrupted process
+                    continue
+                for c in entries:
+                    entries[c].update(line[c])
+                hits += line.get('hits', 0)
+                misses += line.get('misses', 0)
+    return entries, hits, misses
+
+
+def compact_nlp_cache(cache_file: str, max_size: int) -> Tuple[int, int]:
+    """
+    Merges the entries that processes appended to a persisted cache into it, keeping at most `max_size` entries per
+    cache.
+    :return: the total hits and misses of the processes that appended entries
+    """
+    cache_files = nlp_cache_files(cache_file)
+    entries, hits, misses = load_nlp_cache(cache_file)
+    entries = {c: dict(list(c_entries.items())[-max_size:]) for c, c_entries in entries.items()}
+    write_file_atomic(cache_file, json.dumps(entries) + '\n')
+    for f in cache_files:
+        if f != cache_file:
+            os.remove(f)
+    return hits, misses
 
 
 class NLPreprocessor:
+    """
+    It processes identifiers and natural language sentences.
+    The processed identifiers and sentences are cached in every process. Given a cache file, the caches are
+    pre-warmed from it in every process, and `save_cache` appends their new entries to it.
+    """
+
+    def __init__(self, cache_size: int = 65536, cache_policy: str = 'lru', cache_file: Optional[str] = None):
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.cache_file = cache_file
+        self.__caches: Optional[Dict[str, NLPCache]] = None
+
+    def __getstate__(self):
+        # The caches are not sent to the workers, which get the caches of their own process
+        state = self.__dict__.copy()
+        state['_NLPreprocessor__caches'] = None
+        return state
+
+    @property
+    def caches(self) -> Dict[str, NLPCache]:
+        if self.__caches is None:
+            cache_config = (self.cache_size, self.cache_policy, self.cache_file)
+            if cache_config not in NLP_CACHES:
+                caches = {c: NLPCache(self.cache_size, self.cache_policy, self.cache_file is not None) for c in
+                          ('identifiers', 'sentences')}
+                if self.cache_file is not None:
+                    for c, c_entries in load_nlp_cache(self.cache_file)[0].items():
+                        caches[c].update(c_entries)
+                NLP_CACHES[cache_config] = caches
+            self.__caches = NLP_CACHES[cache_config]
+        return self.__caches
+
+    def save_cache(self):
+        """
+        Appends the new entries of the caches of this process to the cache file, if given
+        """
+        if self.cache_file is None:
+            return
+
+        new_entries = {'hits': 0, 'misses': 0}
+        for c, cache in self.caches.items():
+            new_entries[c], c_hits, c_misses = cache.pop_new_entries()
+            new_entries['hits'] += c_hits
+            new_entries['misses'] += c_misses
+        if new_entries['hits'] + new_entries['misses'] != 0:
+            with open("%s.%d.part" % (self.cache_file, os.getpid()), 'a') as cache_f:
+                cache_f.write(json.dumps(new_entries) + '\n')
 
-    @functools.lru_cache(maxsize=2048)
     def process_sentence(self, sentence: str) -> Optional[str]:
         """
         Process a natural language sentence
@@ -31,31 +225,66 @@ class NLPreprocessor:
         if sentence is None:
             return None
 
-        pipeline = [
-            SentenceProcessor.replace_digits_with_space,
-            SentenceProcessor.remove_punctuation_and_linebreaks,
-            SentenceProcessor.tokenize,
-            SentenceProcessor.lemmatize,
-            SentenceProcessor.remove_stop_words
-        ]
-
-        return reduce(lambda s, action: action(s), pipeline, sentence)
+        processed = self.caches['sentences'].get(sentence)
+        if processed is None:
+            processed = SentenceProcessor.process_sentence(sentence)
+            self.caches['sentences'].put(sentence, processed)
+        return processed
 
-    @functools.lru_cache(maxsize=2048)
     def process_identifier(self, sentence: str) -> str:
         """
         Process a sentence mainly consisting of identifiers
 
         Similar to process_sentence, but does not remove stop words.
         """
-        pipeline = [
-            SentenceProcessor.replace_digits_with_space,
-            SentenceProcessor.remove_punctuation_and_linebreaks,
-            SentenceProcessor.tokenize,
-            SentenceProcessor.lemmatize
-        ]
+        processed = self.caches['identifiers'].get(sentence)
+        if processed is None:
+            import nltk
+            words = SentenceProcessor.split_words(sentence)
+            processed = ' '.join(SentenceProcessor.lemmatize_words(nltk.pos_tag(words)))
+            self.caches['identifiers'].put(sentence, processed)
+        return processed
+
+    def process_sentences(self, sentences: List[Optional[str]]) -> List[Optional[str]]:
+        """
+        Process natural language sentences at once, same as process_sentence.
+        The words of all the sentences are POS-tagged in a single call.
+        """
+        return self.__process_batch(sentences, self.caches['sentences'], remove_stop_words=True)
 
-        return reduce(lambda s, action: action(s), pipeline, sentence)
+    def process_identifiers(self, sentences: List[str]) -> List[str]:
+        """
+        Process sentences mainly consisting of identifiers at once, same as process_identifier.
+        The words of all the sentences are POS-tagged in a single call.
+        """
+        return self.__process_batch(sentences, self.caches['identifiers'], remove_stop_words=False)
+
+    @staticmethod
+    def __process_batch(sentences: List[Optional[str]], cache: NLPCache,
+                        remove_stop_words: bool) -> List[Optional[str]]:
+        processed = {}
+        for s in dict.fromkeys(s for s in sentences if s is not None):
+            processed[s] = cache.get(s)
+        uncached_sentences = [s for s, p in processed.items() if p is None]
+        sentences_words = [SentenceProcessor.split_words(s) for s in uncached_sentences]
+        stop_words = get_stop_words() if remove_stop_words else frozenset()
+        import nltk
+        for s, tagged_words in zip(uncached_sentences, nltk.pos_tag_sents(sentences_words)):
+            processed[s] = ' '.join([w for w in SentenceProcessor.lemmatize_words(tagged_words) if w not in stop_words])
+            cache.put(s, processed[s])
+
+        return [processed[s] if s is not None else None for s in sentences]
+
+
+@functools.lru_cache(maxsize=65536)
+def lemmatize_word(word: str, word_pos: str) -> str:
+    """
+    Lemmatizes a word given its WordNet part-of-speech. Words recur a lot, so their lemmas are cached.
+    """
+    if word_pos != '':
+        return get_lemmatizer().lemmatize(word, pos=word_pos)
+    else:
+        return get_lemmatizer().lemmatize(word)
 
 
 class SentenceProcessor:
@@ -74,22 +303,29 @@ class SentenceProcessor:
         if sentence is None:
             return None
 
-        pipeline = [
-            SentenceProcessor.replace_digits_with_space,
-            SentenceProcessor.remove_punctuation_and_linebreaks,
-            SentenceProcessor.tokenize,
-            SentenceProcessor.lemmatize,
-            SentenceProcessor.remove_stop_words
-        ]
+        import nltk
+        stop_words = get_stop_words()
+        words = SentenceProcessor.split_words(sentence)
+        return ' '.join([w for w in SentenceProcessor.lemmatize_words(nltk.pos_tag(words)) if w not in stop_words])
 
-        return reduce(lambda s, action: action(s), pipeline, sentence)
+    @staticmethod
+    def split_words(sentence: str) -> List[str]:
+        """
+        Gives the lower-cased words of a sentence, same as the words of replace_digits_with_space,
+        remove_punctuation_and_linebreaks, and tokenize, but with a single regex pass for the first two steps
+        """
+        sentence = non_letters_regex.sub(' ', sentence)
+        # Without capital letters, there is no camel case to split
+        if not sentence.islower():
+            sentence = all_cap_regex.sub(r'\1 \2', first_cap_regex.sub(r'\1 \2', sentence)).lower()
+        return sentence.split()
 
     @staticmethod
     def replace_digits_with_space(sentence: str) -> str:
         """
         Replaces digits with a space
         """
-        return re.sub('[0-9]+', ' ', sentence)
+        return digits_regex.sub(' ', sentence)
 
     @staticmethod
     def remove_punctuation_and_linebreaks(sentence: str) -> str:
@@ -100,9 +336,8 @@ class SentenceProcessor:
         a space. Full stops that are not followed by a space are also replaced with a space, e.g. object.property ->
         object property.
         """
-        return re.sub('[^A-Za-z0-9 ]+', ' ', sentence) \
-            .replace('\n', '') \
-            .replace('\r', '')
+        # Line breaks are replaced with a space as well
+        return punctuation_regex.sub(' ', sentence)
 
     @staticmethod
     def tokenize(sentence: str) -> str:
@@ -119,33 +354,48 @@ class SentenceProcessor:
         """
         Lemmatize a sentence (e.g. running -> run)
         """
+        import nltk
         words = [word for word in sentence.split(' ') if word != '']
 
+        return SentenceProcessor.lemmatize_tagged(nltk.pos_tag(words))
+
+    @staticmethod
+    def lemmatize_tagged(tagged_words: List[Tuple[str, str]]) -> str:
+        """
+        Lemmatize the POS-tagged words of a sentence
+        """
+        return ' '.join(SentenceProcessor.lemmatize_words(tagged_words))
+
+    @staticmethod
+    def lemmatize_words(tagged_words: List[Tuple[str, str]]) -> List[str]:
+        """
+        Lemmatize POS-tagged words
+        """
         lemmatized = []
-        for token, tag in nltk.pos_tag(words):
+        for token, tag in tagged_words:
             word_pos = SentenceProcessor.get_wordnet_pos(tag)
             try:
-                if word_pos != '':
-                    lemmatized.append(LEMMATIZER.lemmatize(token, pos=word_pos))
-                else:
-                    lemmatized.append(LEMMATIZER.lemmatize(token))
+                lemmatized.append(lemmatize_word(token, word_pos))
             except UnicodeDecodeError:
                 print(f'Lemmatization failed for {token}, tag: {tag}, word pos: {word_pos}')
 
-        return ' '.join(lemmatized)
+        return lemmatized
 
     @staticmethod
     def remove_stop_words(sentence: str) -> str:
         """
         Remove stop words from a sentence
         """
-        return ' '.join([word for word in sentence.split(' ') if word not in NLTK_STOP_WORDS])
+        stop_words = get_stop_words()
+        return ' '.join([word for word in sentence.split(' ') if word not in stop_words])
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def get_wordnet_pos(treebank_tag: str) -> str:
         """
         Get the WordNet part-of-speech constant for the treebank tag
         """
+        import nltk
         if treebank_tag.startswith('J'):
             return nltk.corpus.wordnet.ADJ
         elif treebank_tag.startswith('V'):
@@ -253,14 +503,11 @@ def __check_func_docstring(self, docstring: str) -> Optional[str]:
 
 def normalize_module_code(m_code: str) -> str:
     # New lines
-    m_code = re.compile(r"\n").sub(r" [EOL] ", m_code)
+    m_code = m_code.replace("\n", " [EOL] ")
     # white spaces
-    m_code = re.compile(r"[ \t\n]+").sub(" ", m_code)
+    m_code = whitespace_regex.sub(" ", m_code)
 
     # Replace comments, docstrings, numeric literals and string literals with special tokens
-    special_tks = {"#[comment]": "[comment]", "\"\"\"[docstring]\"\"\"": "[docstring]", "\"[string]\"": "[string]",
-                   "\"[number]\"": "[number]"}
-    regex = re.compile("(%s)" % "|".join(map(re.escape, special_tks.keys())))
-    m_code = regex.sub(lambda mo: special_tks[mo.string[mo.start():mo.end()]], m_code)
+    m_code = special_tks_regex.sub(lambda mo: special_tks[mo.group(0)], m_code)
 
     return m_code.strip()
@@ -2,30 +2,84 @@
 Helper functions to use pyre in the pipeline
 """
 
-from typing import Optional
+from typing import Optional, List, Dict, Tuple, Iterator, IO
 from pathlib import Path
 from subprocess import TimeoutExpired
-from os.path import join, exists
-from libcst.metadata.type_inference_provider import run_command, PyreData
+from contextlib import contextmanager
+from os.path import join, exists, realpath
+from libcst.metadata.type_inference_provider import PyreData
+from libsa4py import PYRE_QUERY_BATCH_SIZE
 import os
 import shutil
 import signal
+import subprocess
+import fcntl
+import time
 import json
 
 
-def pyre_server_init(project_path: str):
-    stdout, stderr, r_code = run_command("cd %s; echo -ne '.\n' | pyre init; pyre start" % project_path)
-    print(f"[PYRE_SERVER] initialized at {project_path} ", stdout, stderr)
-    #TODO: Raise an exception if the pyre server has not been started
+def run_pyre_command(project_path: str, args: List[str], timeout: Optional[int] = None,
+                     stdin: Optional[str] = None) -> Tuple[str, str, int]:
+    """
+    Runs a pyre command in a project's folder
+    """
+    process = subprocess.run(['pyre'] + args, cwd=project_path, input=stdin, capture_output=True, text=True,
+                             timeout=timeout)
+    return process.stdout, process.stderr, process.returncode
+
+
+def pyre_server_init(project_path: str, server_workers: Optional[int] = None, timeout: int = 600) -> bool:
+    """
+    Initializes pyre's config of a project and starts its server.
+    :param server_workers: the number of workers of the pyre server, or pyre's default if not given
+    :return: whether pyre's start command succeeded
+    """
+    try:
+        # Answers the prompt of `pyre init` for the source directory
+        run_pyre_command(project_path, ['init'], timeout, stdin='.\n')
+        stdout, stderr, r_code = run_pyre_command(project_path, (['--number-of-workers', str(server_workers)] if
+                                                                 server_workers is not None else []) + ['start'],
+                                                  timeout)
+        print(f"[PYRE_SERVER] initialized at {project_path} ", stdout, stderr)
+        return r_code == 0
+    except TimeoutExpired as te:
+        print(f"[PYRE_TIMEOUT] p: {project_path}", te)
+        return False
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
 
 
 def find_pyre_server(project_path: str) -> Optional[int]:
+    """
+    Gives the pid of the running pyre server of a project, if any
+    """
     try:
+        # Older versions of pyre write the server's pid to the project's .pyre folder
         with open(join(project_path, '.pyre', "server", "server.pid")) as pid_file:
-            return int(pid_file.read())
+            server_pid = int(pid_file.read())
     except (OSError, ValueError):
-        print("Didn't find the pyre server in ", project_path)
-        return None
+        server_pid = None
+        try:
+            stdout, _, r_code = run_pyre_command(project_path, ['--output', 'json', 'servers', 'list'], timeout=60)
+            if r_code == 0:
+                server_pid = next((s['pid'] for s in json.loads(stdout) if s.get('status') == 'running' and
+                                   realpath(s['global_root']) == realpath(project_path)), None)
+        except (TimeoutExpired, ValueError, KeyError, TypeError):
+            pass
+
+    if server_pid is not None and is_process_alive(server_pid):
+        return server_pid
+    print("Didn't find the pyre server in ", project_path)
+    return None
 
 
 def clean_pyre_config(project_path: str):
@@ -39,30 +93,168 @@ def clean_pyre_config(project_path: str):
 
 
 def pyre_server_shutdown(project_path: str):
-    server_pid = find_pyre_server(project_path)
-    if server_pid is not None:
-        os.kill(server_pid, signal.SIGKILL)
-        print("Stopped pyre server with pid ", server_pid)
+    """
+    Stops the pyre server of a project, or kills it if it does not stop
+    """
+    try:
+        _, _, r_code = run_pyre_command(project_path, ['stop'], timeout=60)
+    except TimeoutExpired:
+        r_code = -1
+    if r_code == 0:
+        print("Stopped pyre server of ", project_path)
+    else:
+        server_pid = find_pyre_server(project_path)
+        if server_pid is not None:
+            os.kill(server_pid, signal.SIGKILL)
+            print("Stopped pyre server with pid ", server_pid)
+
+
+class PyreServerPool:
+    """
+    It starts and stops the pyre servers of projects, while bounding the number of servers that run at the same time
+    over all the processes sharing its lock folder. Every server holds the lock file of a slot, from its start until
+    it is shut down. A running server of a project, e.g., of an interrupted run, is reused if it is healthy rather
+    than cold-starting a new one.
+    """
+
+    def __init__(self, lock_dir: str, max_servers: int, server_workers: Optional[int] = None,
+                 start_timeout: int = 600, poll_interval: float = 0.5):
+        self.lock_dir = lock_dir
+        self.max_servers = max_servers
+        # The workers of every pyre server, so that the servers running at the same time do not oversubscribe the CPUs
+        self.server_workers = server_workers if server_workers is not None else \
+            max(1, (os.cpu_count() or 1) // max_servers)
+        self.start_timeout = start_timeout
+        self.poll_interval = poll_interval
 
+    def __slot_files(self) -> List[str]:
+        return [join(self.lock_dir, "pyre_server_%d.lock" % s) for s in range(self.max_servers)]
 
-def pyre_kill_all_servers():
-    run_command("pyre kill")
-    print("Killed all instances of pyre's servers")
+    def __acquire_slot(self, project_path: str) -> IO:
+        while True:
+            for slot_file in self.__slot_files():
+                slot_f = open(slot_file, 'a+')
+                try:
+                    fcntl.flock(slot_f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    slot_f.close()
+                    continue
+                # The project of a slot is kept until its server is shut down, to stop the servers of crashed workers
+                slot_f.truncate(0)
+                slot_f.write(project_path)
+                slot_f.flush()
+                return slot_f
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def __release_slot(slot_f: IO):
+        slot_f.truncate(0)
+        fcntl.flock(slot_f, fcntl.LOCK_UN)
+        slot_f.close()
+
+    @contextmanager
+    def server(self, project_path: str) -> Iterator[dict]:
+        """
+        Runs the pyre server of a project, once a slot is free.
+        :return: the stats of the server, i.e., whether it is healthy or reused, and the latencies (in seconds) of
+                 waiting for a slot, starting, and shutting down the server. The time of querying it is to be added to
+                 the stats by the caller.
+        """
+
+        start_t = time.perf_counter()
+        slot_f = self.__acquire_slot(project_path)
+        server_stats = {'wait': time.perf_counter() - start_t, 'start': 0.0, 'query': 0.0, 'shutdown': 0.0,
+                        'reused': False, 'healthy': False}
+        try:
+            start_t = time.perf_counter()
+            if exists(join(project_path, '.pyre')) and find_pyre_server(project_path) is not None:
+                server_stats['reused'] = server_stats['healthy'] = True
+            else:
+                # A server that fails to start is retried once from a clean state
+                for _ in range(2):
+                    clean_pyre_config(project_path)
+                    if pyre_server_init(project_path, self.server_workers, self.start_timeout) and \
+                            find_pyre_server(project_path) is not None:
+                        server_stats['healthy'] = True
+                        break
+                    print(f"[PYRE_SERVER] failed to start at {project_path}")
+            server_stats['start'] = time.perf_counter() - start_t
+            yield server_stats
+        finally:
+            start_t = time.perf_counter()
+            pyre_server_shutdown(project_path)
+            server_stats['shutdown'] = time.perf_counter() - start_t
+            self.__release_slot(slot_f)
+
+    def shutdown_all(self):
+        """
+        Shuts down the servers of the slots that are not released, e.g., by crashed workers
+        """
+        for slot_file in self.__slot_files():
+            if exists(slot_file):
+                with open(slot_file, 'a+') as slot_f:
+                    fcntl.flock(slot_f, fcntl.LOCK_EX)
+                    slot_f.seek(0)
+                    project_path = slot_f.read()
+                    if project_path != '':
+                        pyre_server_shutdown(project_path)
+                        slot_f.truncate(0)
 
 
 def pyre_query_types(project_path: str, file_path: str, timeout: int = 600) -> Optional[PyreData]:
+    return pyre_query_types_batch(project_path, [file_path], timeout=timeout)[file_path]
+
+
+def pyre_query_types_batch(project_path: str, file_paths: List[str], batch_size: int = PYRE_QUERY_BATCH_SIZE,
+                           timeout: int = 600) -> Dict[str, Optional[PyreData]]:
+    """
+    Queries the types of many files of a project, with a single `types` query per batch of files.
+    Pyre fails a whole query if it cannot type one of its files, so a failed batch is split in halves until the
+    files that fail are queried on their own.
+    :return: the types of the files by their path, which are None for the files that pyre failed to type
+    """
+
+    files_types = {}
+    # Pyre's queries have no escaping of quotes in paths, so such files are not queried rather than breaking a batch
+    quoted_files = [f for f in file_paths if "'" in str(Path(f).relative_to(Path(project_path)))]
+    if len(quoted_files) != 0:
+        print(f"[PYRE_ERROR] p: {project_path} cannot query the paths with quotes", quoted_files)
+        files_types.update(dict.fromkeys(quoted_files))
+        file_paths = [f for f in file_paths if f not in files_types]
+
+    batches = [file_paths[i:i + batch_size] for i in range(0, len(file_paths), batch_size)]
+    while len(batches) != 0:
+        batch = batches.pop()
+        batch_types, is_query_error = _query_types(project_path, batch, timeout)
+        if batch_types is None and is_query_error and len(batch) > 1:
+            batches += [batch[len(batch) // 2:], batch[:len(batch) // 2]]
+        else:
+            files_types.update(batch_types if batch_types is not None else dict.fromkeys(batch))
+    return files_types
+
+
+def _query_types(project_path: str, file_paths: List[str],
+                 timeout: int) -> Tuple[Optional[Dict[str, Optional[PyreData]]], bool]:
+    """
+    :return: the types of the files by their path, or None if the query failed, and whether pyre failed to answer
+             the query, as opposed to not running
+    """
+
+    files_rel_path = {f: str(Path(f).relative_to(Path(project_path))) for f in file_paths}
     try:
-        file_types = None
-        stdout, stderr, r_code = run_command('''cd %s; pyre query "types(path='%s')"''' % (project_path,
-                                             str(Path(file_path).relative_to(Path(project_path)))),
-                                             timeout=timeout)
+        stdout, stderr, r_code = run_pyre_command(project_path, ['query', "types(%s)" % ", ".join(
+            "path='%s'" % f for f in files_rel_path.values())], timeout=timeout)
         if r_code == 0:
-            file_types = json.loads(stdout)["response"][0]
+            response = json.loads(stdout)
+            if 'response' in response:
+                types_by_path = {f_types['path']: f_types for f_types in response['response']}
+                return {f: types_by_path.get(f_r) for f, f_r in files_rel_path.items()}, False
+            print(f"[PYRE_ERROR] p: {project_path}", response.get('error'))
+            return None, True
         else:
             print(f"[PYRE_ERROR] p: {project_path}", stderr)
-    except KeyError:
-        print(f"[PYRE_ERROR] p: {project_path}", json.loads(stdout)['error'])
+    except ValueError as err:
+        print(f"[PYRE_ERROR] p: {project_path}", err)
     except TimeoutExpired as te:
         print(f"[PYRE_TIMEOUT] p: {project_path}", te)
-    finally:
-        return file_types
+    return None, False
@@ -0,0 +1,97 @@
+"""
+The snapshot format of pyre's inferred types, which lets projects be extracted with pyre's types without running pyre.
+A project's snapshot is a ZIP archive with a compressed JSON member per source file, named by the file's path relative
+to the project:
+    {"sha256": "<hash of the file's source code>", "types": {...}}
+where "types" is the file's `PyreData` from `pyre_query_types`.
+"""
+
+from typing import Optional
+from os.path import join
+from libcst.metadata.type_inference_provider import PyreData
+import functools
+import hashlib
+import zipfile
+import json
+import os
+
+
+def get_pyre_snapshot_filename(snapshot_dir: str, project: dict) -> str:
+    return join(snapshot_dir, f"{project['author']}{project['repo']}.zip")
+
+
+def hash_program(program: str) -> str:
+    return hashlib.sha256(program.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class PyreSnapshotWriter:
+    """
+    It stores the pyre types of a project's files to its snapshot.
+    The files are written to a temporary archive, which is renamed once it is closed. Hence, an interrupted dump never
+    leaves a partial snapshot.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.tmp_filename = filename + '.tmp'
+        self.no_files = 0
+        self.zip_f = zipfile.ZipFile(self.tmp_filename, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def write_file(self, f_relative: str, program: str, pyre_data_file: PyreData):
+        self.zip_f.writestr(f_relative, json.dumps({"sha256": hash_program(program), "types": pyre_data_file},
+                                                   separators=(',', ':')))
+        self.no_files += 1
+
+    def close(self) -> int:
+        """
+        Completes the snapshot and gives its number of files. A snapshot without any file is not saved.
+        """
+
+        self.zip_f.close()
+        if self.no_files == 0:
+            os.remove(self.tmp_filename)
+        else:
+            os.replace(self.tmp_filename, self.filename)
+        return self.no_files
+
+
+class PyreSnapshotReader:
+    """
+    It reads the pyre types of single files from a project's snapshot
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.zip_f = zipfile.ZipFile(filename, 'r')
+
+    def get(self, f_relative: str, program: str) -> Optional[PyreData]:
+        """
+        Gives the pyre types of a file, or None if the snapshot does not have them or the file has changed since
+        """
+
+        try:
+            f_snapshot = json.loads(self.zip_f.read(f_relative))
+        except KeyError:
+            return None
+
+        if f_snapshot['sha256'] != hash_program(program):
+            print(f"[PYRE_SNAPSHOT] {f_relative} has changed since its snapshot")
+            return None
+        return f_snapshot['types']
+
+
+@functools.lru_cache(maxsize=8)
+def __open_pyre_snapshot(filename: str, mtime_ns: int) -> PyreSnapshotReader:
+    return PyreSnapshotReader(filename)
+
+
+def open_pyre_snapshot(filename: str) -> Optional[PyreSnapshotReader]:
+    """
+    Opens a project's snapshot, if it exists. The snapshots recently opened by a process are kept open, since the
+    file-level scheduler reads the files of a project one at a time.
+    """
+
+    try:
+        return __open_pyre_snapshot(filename, os.stat(filename).st_mtime_ns)
+    except FileNotFoundError:
+        return None
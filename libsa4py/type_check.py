@@ -12,7 +12,6 @@ from collections import Counter, namedtuple
 import toml
 import os
 import subprocess
-import pkg_resources
 
 
 fields = ("no_type_errs", "no_files", "no_ignored_errs", "no_warnings", "err_breakdown")
@@ -46,6 +45,7 @@ class TCManager(ABC):
     def __init__(self, tc, timeout):
         self._timeout = timeout
         #self._logger = logging.getLogger(__name__)
+        import pkg_resources
         errcodes = toml.load(pkg_resources.resource_filename(__name__, 'tc_errcodes.toml'))[tc]
         self._all_errcodes = errcodes["all"]
         self._inc_errcodes = errcodes["included"]
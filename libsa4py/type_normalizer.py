@@ -0,0 +1,63 @@
+"""
+Normalizes type annotations by resolving their aliases, e.g., Dict[Any, Any] -> dict and Text -> str
+"""
+
+from typing import List, Tuple
+import functools
+import regex
+
+# The alias rules are applied in order. The `regex` module is needed for variable-length lookbehinds.
+TYPE_ALIASES: List[Tuple[regex.Pattern, str]] = [(regex.compile(p), r) for p, r in [
+    (r'^{}$|^Dict$|(?<=.*)Dict\[\](?<=.*)|(?<=.*)Dict\[Any, *?Any\](?=.*)|^Dict\[unknown, *Any\]$', 'dict'),
+    (r'^Set$|(?<=.*)Set\[\](?<=.*)|^Set\[Any\]$', 'set'),
+    (r'^Tuple$|(?<=.*)Tuple\[\](?<=.*)|^Tuple\[Any\]$|(?<=.*)Tuple\[Any, *?\.\.\.\](?=.*)|^Tuple\[unknown, *?unknown\]$|'
+     r'^Tuple\[unknown, *?Any\]$|(?<=.*)tuple\[\](?<=.*)', 'tuple'),
+    (r'^Tuple\[(.+), *?\.\.\.\]$', r'Tuple[\1]'),
+    (r'\bText\b', 'str'),
+    (r'^\[\]$|(?<=.*)List\[\](?<=.*)|^List\[Any\]$|^List$', 'list'),
+    (r'^\[{}\]$', 'List[dict]'),
+    (r"(?<=.*)Literal\['.*?'\](?=.*)", 'Literal'),
+    (r'(?<=.*)Literal\[\d+\](?=.*)', 'Literal'),  # Maybe int?!
+    (r'^Callable\[\.\.\., *?Any\]$|^Callable\[\[Any\], *?Any\]$|^Callable[[Named(x, Any)], Any]$', 'Callable'),
+    (r'^Iterator[Any]$', 'Iterator'),
+    (r'^OrderedDict[Any, *?Any]$', 'OrderedDict'),
+    (r'^Counter[Any]$', 'Counter'),
+    (r'(?<=.*)Match[Any](?<=.*)', 'Match'),
+    (r'^\.(.+)', r'\1'),
+    (r'(?<=.*)Optional\[\](?<=.*)', 'Optional')]]
+
+
+@functools.lru_cache(maxsize=8192)
+def normalize_type(t: str) -> str:
+    """
+    Resolves the aliases of a type.
+    The same types recur a lot, so the normalized types are cached.
+    """
+
+    for t_alias, t_resolved in TYPE_ALIASES:
+        t = t_alias.sub(t_resolved, t)
+    return t
+
+
+def normalize_module_types(extracted_module: dict) -> dict:
+    """
+    Normalizes the types of variables, functions' parameters, and return types in a module's extracted dict
+    """
+
+    def normalize_types(types: dict) -> dict:
+        return {n: normalize_type(t) if t else t for n, t in types.items()}
+
+    def normalize_fn_types(fn_d: dict):
+        fn_d['params'] = normalize_types(fn_d['params'])
+        fn_d['ret_type'] = normalize_type(fn_d['ret_type']) if fn_d['ret_type'] else fn_d['ret_type']
+        fn_d['variables'] = normalize_types(fn_d['variables'])
+
+    extracted_module['variables'] = normalize_types(extracted_module['variables'])
+    for c in extracted_module['classes']:
+        c['variables'] = normalize_types(c['variables'])
+        for fn_d in c['funcs']:
+            normalize_fn_types(fn_d)
+    for fn_d in extracted_module['funcs']:
+        normalize_fn_types(fn_d)
+
+    return extracted_module
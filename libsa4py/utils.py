@@ -1,11 +1,12 @@
 from typing import List
 from tqdm import tqdm
-from joblib import Parallel
 from os.path import join, isdir
 from pathlib import Path
 import time
 import os
+import shutil
 import signal
+import tempfile
 import json
 
 
@@ -36,6 +37,8 @@ def ParallelExecutor(use_bar='tqdm', **joblib_args):
                 bar_func = all_bar_funcs[str(bar)](tq_args)
             else:
                 raise ValueError("Value %s not supported as bar type" % bar)
+            # Imported here since joblib imports numpy, which is slow and not needed to extract single files
+            from joblib import Parallel
             return Parallel(**joblib_args)(bar_func(op_iter))
 
         return tmp
@@ -79,6 +82,21 @@ def write_file(filename: str, content: str):
     with open(filename, 'w') as file:
         file.write(content)
 
+def write_file_atomic(filename: str, content: str):
+    """
+    Writes to a temporary file that replaces the given file, so that an interrupted write never leaves it truncated
+    """
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp_filename)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
 def save_json(filename: str, dict_obj: dict):
     """
     Dumps a dict object into a JSON file
@@ -20,7 +20,6 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Environment :: Console',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
         'Operating System :: Unix',
@@ -30,9 +29,12 @@ setup(
     ],
     keywords='libsa4py static analysis features type hints type inference machine learning python pipeline light-weight',
     packages=['libsa4py'],
-    python_requries='>=3.5',
-    install_requires=['libcst', 'numpy', 'pandas', 'nltk', 'joblib', 'tqdm', 'docstring_parser', 'dpu_utils',
+    python_requires='>=3.8',
+    install_requires=['libcst', 'numpy', 'pandas', 'nltk', 'joblib>=1.4.0', 'tqdm', 'docstring_parser', 'dpu_utils',
                       'pyre-check', 'toml', 'mypy'],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'libsa4py = libsa4py.__main__:main',
@@ -2,8 +2,10 @@ from libsa4py.cst_lenient_parser import lenient_parse_module
 from libsa4py.cst_visitor import Visitor
 from libsa4py.cst_transformers import SpaceAdder, TypeAdder,\
     CommentAndDocStringRemover, StringRemover, NumberRemover, \
-    TypeAnnotationRemover, ParametricTypeDepthReducer
-from libsa4py.utils import read_file
+    TypeAnnotationRemover, ParametricTypeDepthReducer, TypeQualifierResolver, Seq2SeqTransformer, code_with_spaces, \
+    type_annotation_node, parse_type_annotation, VarNamesCounter
+from libsa4py.cst_extractor import Extractor
+from libsa4py.utils import read_file, list_files
 import unittest
 import libcst as cst
 
@@ -37,6 +39,21 @@ class TestSpaceAdder(unittest.TestCase):
     def test_removed_space_from_types(self):
         self.assertFalse("$List[ int ]$" in self.out_typed_s.code)
 
+    def test_code_with_spaces(self):
+        self.assertMultiLineEqual(self.exp_p, code_with_spaces(self.out_p))
+
+    def test_code_with_spaces_same_as_space_adder(self):
+        for f in list_files('examples'):
+            with self.subTest(file=f):
+                program = cst.parse_module(read_file(f))
+                v = Visitor()
+                mw = cst.metadata.MetadataWrapper(program, cache={cst.metadata.TypeInferenceProvider: {'types': []}})
+                mw.visit(v)
+                typed_program = program.visit(TypeAdder(v.module_all_annotations))
+
+                self.assertMultiLineEqual(program.visit(SpaceAdder()).code, code_with_spaces(program))
+                self.assertMultiLineEqual(typed_program.visit(SpaceAdder()).code, code_with_spaces(typed_program))
+
 
 class TestCommentAndDocStringRemover(unittest.TestCase):
     """
@@ -124,6 +141,123 @@ class TestTypeAdder(unittest.TestCase):
         self.assertMultiLineEqual(read_file('exp_outputs/propagated_types.py'), self.out_p.code)
 
 
+class TestSeq2SeqTransformer(unittest.TestCase):
+    """
+    It tests that the fused Seq2SeqTransformer produces the same code as the chain of seq2seq transformers.
+    """
+
+    def test_same_code_as_transformers_chain(self):
+        for f in list_files('examples'):
+            with self.subTest(file=f):
+                program = cst.parse_module(read_file(f))
+                v = Visitor()
+                mw = cst.metadata.MetadataWrapper(program, cache={cst.metadata.TypeInferenceProvider: {'types': []}})
+                mw.visit(v)
+
+                self.assertEqual(Extractor.transform_seq2seq(program, v.module_all_annotations),
+                                 Seq2SeqTransformer(v.module_all_annotations).transform(program))
+
+    def test_parenthesized_typed_name(self):
+        program = cst.parse_module("class A:\n    def __init__(self, f: int):\n        self.f: int = (\n"
+                                   "            f  # foo\n        )\n")
+        v = Visitor()
+        mw = cst.metadata.MetadataWrapper(program, cache={cst.metadata.TypeInferenceProvider: {'types': []}})
+        mw.visit(v)
+
+        self.assertEqual(Extractor.transform_seq2seq(program, v.module_all_annotations),
+                         Seq2SeqTransformer(v.module_all_annotations).transform(program))
+
+    def test_marker_chars_in_program(self):
+        self.assertTrue(Seq2SeqTransformer.can_transform(read_file('examples/representations.py')))
+        self.assertFalse(Seq2SeqTransformer.can_transform("x = '\x1f'"))
+
+
+class NodesCollector(cst.CSTVisitor):
+    def __init__(self):
+        self.nodes = []
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        self.nodes.append(node)
+        return True
+
+
+class TestTypeQualifierResolver(unittest.TestCase):
+    """
+    It tests whether the TypeQualifierResolver reports the modules in which it resolves type annotations.
+    """
+
+    def test_resolved_type_annot(self):
+        tqr = TypeQualifierResolver()
+        cst.metadata.MetadataWrapper(cst.parse_module(read_file('examples/qualified_types.py'))).visit(tqr)
+        self.assertTrue(tqr.resolved_type_annot)
+
+    def test_no_resolved_type_annot(self):
+        tqr = TypeQualifierResolver()
+        program = read_file('examples/no_typeslots.py')
+        out_p = cst.metadata.MetadataWrapper(cst.parse_module(program)).visit(tqr)
+        self.assertFalse(tqr.resolved_type_annot)
+        self.assertMultiLineEqual(program, out_p.code)
+
+    def test_no_duplicate_annot_nodes(self):
+        tqr = TypeQualifierResolver()
+        out_p = cst.metadata.MetadataWrapper(cst.parse_module("import typing as t\nx: t.List[int] = []\n"
+                                                              "y: t.List[int] = []\n")).visit(tqr)
+        nodes_collector = NodesCollector()
+        out_p.visit(nodes_collector)
+        # LibCST's metadata is keyed by nodes, so a tree must not have the same node in several places
+        self.assertTrue(tqr.resolved_type_annot)
+        self.assertEqual(len(nodes_collector.nodes), len(set(map(id, nodes_collector.nodes))))
+
+
+class TestTypeAnnotationNode(unittest.TestCase):
+    """
+    It tests the cache of annotation nodes shared by TypeQualifierResolver and TypeApplier
+    """
+
+    def test_type_annotation_node(self):
+        self.assertEqual(cst.Module([]).code_for_node(type_annotation_node('typing.List[str]').annotation),
+                         'typing.List[str]')
+        self.assertIsNone(type_annotation_node('List[str'))
+
+    def test_type_annotation_node_cache(self):
+        parse_type_annotation.cache_clear()
+        annot = type_annotation_node('builtins.int')
+        # Every position of a type gets its own node, which is cloned from the cached one
+        self.assertIsNot(annot, type_annotation_node('builtins.int'))
+        self.assertTrue(annot.deep_equals(type_annotation_node('builtins.int')))
+        self.assertEqual(parse_type_annotation.cache_info().hits, 2)
+        self.assertEqual(parse_type_annotation.cache_info().misses, 1)
+
+
+class TestVarNamesCounter(unittest.TestCase):
+    """
+    It tests counting the names of assigned variables in classes and functions
+    """
+
+    def test_var_names_counters(self):
+        mod = cst.metadata.MetadataWrapper(cst.parse_module("""x = 1
+class A:
+    a = 1
+    a: int = 2
+    class B:
+        a = b = 3
+    def f(self):
+        x = 1
+        def g():
+            x: int = 2
+            y, z = 3, 4
+        return x
+"""))
+        var_names_counter = VarNamesCounter(mod.resolve(cst.metadata.ScopeProvider))
+        mod.module.visit(var_names_counter)
+        counters = {n.name.value: c for n, c in var_names_counter.var_names_counters.items()}
+
+        self.assertDictEqual({'a': 3, 'b': 1}, counters['A'])
+        self.assertDictEqual({'a': 1, 'b': 1}, counters['B'])
+        self.assertDictEqual({'x': 2}, counters['f'])
+        self.assertDictEqual({'x': 1}, counters['g'])
+
+
 class TestParametricTypeDepthReducer(unittest.TestCase):
     """
     It tests reducing the depth of parametric types.
@@ -0,0 +1,142 @@
+from libsa4py.merge import merge_projects, merge_jsons_to_dict, create_dataframe_fns, create_dataframe_vars, \
+    CSVChunkWriter, FNS_COLUMNS, VARS_COLUMNS, flatten_occur
+from libsa4py.jsonl_output import ProjectJSONLWriter
+from libsa4py.utils import list_files, save_json, load_json, read_file
+from argparse import Namespace
+import importlib.util
+import unittest
+import ast
+import shutil
+import os
+import pandas as pd
+
+
+class TestMerge(unittest.TestCase):
+    """
+    It tests merging processed projects into a single JSON file and a dataframe
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # The outputs of a run whose setUpClass failed, which are not removed by tearDownClass
+        for tmp_dir in ('tmp_merge', 'tmp_merge_exp', 'tmp_merge_parallel'):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs('tmp_merge/processed_projects', exist_ok=True)
+        os.makedirs('tmp_merge_exp', exist_ok=True)
+        save_json('tmp_merge/processed_projects/testsexamples.json', load_json('exp_outputs/testsexamples.json'))
+        p_nonlp = load_json('exp_outputs/testsexamples_nonlp.json')['tests/examples']
+        jsonl_writer = ProjectJSONLWriter('tmp_merge/processed_projects/testsexamples_nonlp.jsonl',
+                                          'tests/examples_nonlp')
+        for f, m in p_nonlp['src_files'].items():
+            jsonl_writer.write_file(f, m)
+        jsonl_writer.close()
+
+        # The whole corpus in memory, i.e., the merge before streaming projects
+        processed_projects = list_files('tmp_merge/processed_projects', '.json') + \
+                             list_files('tmp_merge/processed_projects', '.jsonl')
+        merged_jsons = merge_jsons_to_dict(processed_projects)
+        save_json('tmp_merge_exp/merged_all_projects.json', merged_jsons)
+        create_dataframe_fns('tmp_merge_exp', merged_jsons)
+        create_dataframe_vars('tmp_merge_exp', merged_jsons)
+
+        merge_projects(Namespace(o='tmp_merge', l=1, j=1, df_format='csv', vars=False))
+        merge_projects(Namespace(o='tmp_merge', l=None, j=1, df_format='csv', vars=True))
+
+        shutil.copytree('tmp_merge/processed_projects', 'tmp_merge_parallel/processed_projects')
+        merge_projects(Namespace(o='tmp_merge_parallel', l=None, j=2, df_format='csv', vars=True))
+
+    def test_merged_json(self):
+        self.assertEqual(read_file('tmp_merge_exp/merged_all_projects.json'),
+                         read_file('tmp_merge/merged_all_projects.json'))
+        self.assertEqual(len(load_json('tmp_merge/merged_all_projects.json')['projects']), 2)
+
+    def test_merged_fns_df(self):
+        self.assertEqual(read_file('tmp_merge_exp/all_fns.csv'), read_file('tmp_merge/all_fns.csv'))
+
+    def test_merged_vars_df(self):
+        self.assertEqual(read_file('tmp_merge_exp/all_vars.csv'), read_file('tmp_merge/all_vars.csv'))
+        self.assertGreater(len(pd.read_csv('tmp_merge/all_vars.csv')), 0)
+
+    def test_parallel_merge(self):
+        self.assertEqual(read_file('tmp_merge/merged_all_projects.json'),
+                         read_file('tmp_merge_parallel/merged_all_projects.json'))
+        self.assertEqual(read_file('tmp_merge/all_fns.csv'), read_file('tmp_merge_parallel/all_fns.csv'))
+        self.assertEqual(read_file('tmp_merge/all_vars.csv'), read_file('tmp_merge_parallel/all_vars.csv'))
+        self.assertFalse(os.path.exists('tmp_merge_parallel/merge_shards'))
+
+    def test_merge_limit(self):
+        self.assertEqual(len(load_json('tmp_merge/merged_1_projects.json')['projects']), 1)
+
+    def test_csv_chunk_writer(self):
+        rows = [[str(i)] * len(FNS_COLUMNS) for i in range(5)]
+        csv_writer = CSVChunkWriter('tmp_merge/chunks.csv', FNS_COLUMNS, chunk_size=2)
+        for r in rows:
+            csv_writer.write_rows([r])
+        csv_writer.close()
+        pd.DataFrame(rows, columns=FNS_COLUMNS).to_csv('tmp_merge_exp/chunks.csv', index=False)
+
+        self.assertEqual(read_file('tmp_merge_exp/chunks.csv'), read_file('tmp_merge/chunks.csv'))
+
+    def test_empty_merge(self):
+        shutil.rmtree('tmp_merge_empty', ignore_errors=True)
+        os.makedirs('tmp_merge_empty/processed_projects', exist_ok=True)
+        for j in (1, 2):
+            merge_projects(Namespace(o='tmp_merge_empty', l=None, j=j, df_format='csv', vars=True))
+            self.assertDictEqual(load_json('tmp_merge_empty/merged_all_projects.json'), {'projects': {}})
+            self.assertListEqual(list(pd.read_csv('tmp_merge_empty/all_fns.csv').columns), FNS_COLUMNS)
+            self.assertListEqual(list(pd.read_csv('tmp_merge_empty/all_vars.csv').columns), VARS_COLUMNS)
+        shutil.rmtree('tmp_merge_empty')
+
+    def test_merge_both_formats(self):
+        # A project processed with both output formats is only merged once, from its JSON file
+        shutil.rmtree('tmp_merge_both', ignore_errors=True)
+        shutil.copytree('tmp_merge/processed_projects', 'tmp_merge_both/processed_projects')
+        jsonl_writer = ProjectJSONLWriter('tmp_merge_both/processed_projects/testsexamples.jsonl', 'tests/examples')
+        for f, m in load_json('tmp_merge/processed_projects/testsexamples.json')['tests/examples']['src_files'].items():
+            jsonl_writer.write_file(f, m)
+        jsonl_writer.close()
+        for j in (1, 2):
+            merge_projects(Namespace(o='tmp_merge_both', l=None, j=j, df_format='csv', vars=True))
+            self.assertEqual(read_file('tmp_merge/merged_all_projects.json'),
+                             read_file('tmp_merge_both/merged_all_projects.json'))
+            self.assertEqual(read_file('tmp_merge/all_fns.csv'), read_file('tmp_merge_both/all_fns.csv'))
+            self.assertEqual(read_file('tmp_merge/all_vars.csv'), read_file('tmp_merge_both/all_vars.csv'))
+        shutil.rmtree('tmp_merge_both')
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow is not installed")
+    def test_merged_fns_parquet(self):
+        df_fns_csv = pd.read_csv('tmp_merge/all_fns.csv', keep_default_na=False)
+        for j in (1, 2):
+            merge_projects(Namespace(o='tmp_merge_parallel', l=None, j=j, df_format='parquet', vars=True))
+            df_fns = pd.read_parquet('tmp_merge_parallel/all_fns.parquet')
+
+            self.assertListEqual(list(df_fns.columns), FNS_COLUMNS)
+            self.assertEqual(len(df_fns), len(df_fns_csv))
+            self.assertEqual(df_fns['author'].dtype, 'category')
+            for c in ['arg_names', 'arg_types', 'arg_descrs', 'return_expr', 'variables', 'aval_types']:
+                self.assertListEqual([list(v) for v in df_fns[c]], [ast.literal_eval(v) for v in df_fns_csv[c]])
+            self.assertListEqual([[list(a_o) for a_o in args_o] for args_o in df_fns['args_occur']],
+                                 [[flatten_occur(a_o) for a_o in ast.literal_eval(v)] for v in df_fns_csv['args_occur']])
+            for c in ['name', 'docstring', 'func_descr', 'return_type', 'return_descr']:
+                self.assertListEqual(df_fns[c].astype(object).fillna('').tolist(), df_fns_csv[c].tolist())
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow is not installed")
+    def test_merged_vars_parquet(self):
+        df_vars_csv = pd.read_csv('tmp_merge/all_vars.csv', keep_default_na=False)
+        for j in (1, 2):
+            merge_projects(Namespace(o='tmp_merge_parallel', l=None, j=j, df_format='parquet', vars=True))
+            df_vars = pd.read_parquet('tmp_merge_parallel/all_vars.parquet')
+
+            self.assertListEqual(list(df_vars.columns), VARS_COLUMNS)
+            self.assertListEqual([list(v) for v in df_vars['var_occur']],
+                                 [flatten_occur(ast.literal_eval(v)) for v in df_vars_csv['var_occur']])
+            self.assertListEqual([list(v) for v in df_vars['aval_types']],
+                                 [ast.literal_eval(v) for v in df_vars_csv['aval_types']])
+            for c in ['cls_name', 'fn_name', 'var_name', 'var_type']:
+                self.assertListEqual(df_vars[c].astype(object).fillna('').tolist(), df_vars_csv[c].tolist())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree('tmp_merge')
+        shutil.rmtree('tmp_merge_exp')
+        shutil.rmtree('tmp_merge_parallel')
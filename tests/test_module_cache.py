@@ -0,0 +1,85 @@
+from libsa4py.module_cache import ModuleCache
+from libsa4py.cst_extractor import Extractor
+from libsa4py.cst_pipeline import Pipeline
+from libsa4py.utils import read_file
+from pathlib import Path
+from os.path import join
+import unittest
+import json
+import os
+import shutil
+import time
+
+
+class TestModuleCache(unittest.TestCase):
+    """
+    It tests the persistent cache of extracted files
+    """
+
+    def setUp(self):
+        self.cache = ModuleCache('./tmp_module_cache', max_size_mb=1)
+
+    def test_cache_get_put(self):
+        program = read_file('./examples/representations.py')
+        key = ModuleCache.make_key(program, False, True)
+        self.assertIsNone(self.cache.get(key))
+
+        extracted_module = Extractor.extract(program).to_dict()
+        self.cache.put(key, extracted_module)
+
+        self.assertEqual(json.loads(json.dumps(extracted_module)), self.cache.get(key))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_cache_key_options(self):
+        program = read_file('./examples/representations.py')
+        keys = {ModuleCache.make_key(program, False, True), ModuleCache.make_key(program, True, True),
+                ModuleCache.make_key(program, False, False), ModuleCache.make_key(program, False, True, {'types': []}),
+                ModuleCache.make_key(program + "\n", False, True)}
+
+        self.assertEqual(5, len(keys))
+        self.assertEqual(ModuleCache.make_key(program, False, True), ModuleCache.make_key(program, False, True))
+
+    def test_cache_lru_eviction(self):
+        entry = {'untyped_seq': 'x' * 300 * 1024}
+        for k in ['a1', 'b2', 'c3']:
+            self.cache.put(k * 32, entry)
+            time.sleep(0.01)
+        # Marks the oldest entry as recently used
+        self.cache.get('a1' * 32)
+        self.cache.put('d4' * 32, entry)
+
+        self.assertIsNotNone(self.cache.get('a1' * 32))
+        self.assertIsNone(self.cache.get('b2' * 32))
+        self.assertIsNotNone(self.cache.get('d4' * 32))
+
+    def tearDown(self):
+        shutil.rmtree('./tmp_module_cache')
+
+
+class TestPipelineModuleCache(unittest.TestCase):
+    """
+    It tests the pipeline when the extracted files are cached
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        for _ in range(2):
+            # With one job, files are processed in this process, so the cache's stats are kept
+            cls.p = Pipeline(Path(__file__).parent.absolute().parent, join(Path(__file__).parent.absolute(),
+                             'tmp_cached'), nlp_transf=False, use_cache=False, use_pyre=False,
+                             module_cache_dir=join(Path(__file__).parent.absolute(), 'tmp_cached_modules'))
+            cls.p.run([{'author': 'tests', 'repo': 'examples'}], 1)
+
+    def test_pipeline_output_cached(self):
+        pipeline_out_exp = json.loads(open("exp_outputs/testsexamples_nonlp.json", 'r').read())
+        pipeline_out = json.loads(open("tmp_cached/processed_projects/testsexamples.json", 'r').read())
+
+        self.assertDictEqual(pipeline_out_exp, pipeline_out)
+        self.assertEqual(len(pipeline_out_exp['tests/examples']['src_files']),
+                         sum(len(files) for _, _, files in os.walk("tmp_cached_modules")))
+        self.assertEqual(len(pipeline_out_exp['tests/examples']['src_files']), self.p.module_cache.hits)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree("./tmp_cached/")
+        shutil.rmtree("./tmp_cached_modules/")
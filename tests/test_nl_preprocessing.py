@@ -0,0 +1,81 @@
+from libsa4py.nl_preprocessing import NLPreprocessor, SentenceProcessor, NLPCache, NLP_CACHES, compact_nlp_cache
+from libsa4py.utils import mk_dir_not_exist
+import unittest
+import shutil
+import os
+
+
+class TestNLPreprocessor(unittest.TestCase):
+    """
+    It tests processing identifiers and sentences in batches
+    """
+
+    sentences = ["Returns the running processes", "self.fooBar_baz", "the_config", None, "", "x = 12 + y",
+                 "Returns the running processes"]
+
+    def test_process_sentences(self):
+        nlp_prep = NLPreprocessor()
+        self.assertListEqual([nlp_prep.process_sentence(s) for s in self.sentences],
+                             nlp_prep.process_sentences(self.sentences))
+
+    def test_process_identifiers(self):
+        nlp_prep = NLPreprocessor()
+        identifiers = [s for s in self.sentences if s is not None]
+        self.assertListEqual([nlp_prep.process_identifier(s) for s in identifiers],
+                             nlp_prep.process_identifiers(identifiers))
+
+    def test_split_words(self):
+        for s in [s for s in self.sentences if s is not None] + ["getHTTPResponse2_fromURL\n\tx", "aB Cd", "été"]:
+            words = SentenceProcessor.tokenize(SentenceProcessor.remove_punctuation_and_linebreaks(
+                SentenceProcessor.replace_digits_with_space(s)))
+            self.assertListEqual([w for w in words.split(' ') if w != ''], SentenceProcessor.split_words(s))
+
+
+class TestNLPCache(unittest.TestCase):
+    """
+    It tests the caches of processed identifiers and sentences
+    """
+
+    def test_lru_eviction(self):
+        cache = NLPCache(max_size=2, policy='lru')
+        cache.put('a', 'a')
+        cache.put('b', 'b')
+        cache.get('a')
+        cache.put('c', 'c')
+        self.assertListEqual(['a', 'c'], list(cache.entries.keys()))
+
+    def test_fifo_eviction(self):
+        cache = NLPCache(max_size=2, policy='fifo')
+        cache.put('a', 'a')
+        cache.put('b', 'b')
+        cache.get('a')
+        cache.put('c', 'c')
+        self.assertListEqual(['b', 'c'], list(cache.entries.keys()))
+
+    def test_hit_rate(self):
+        cache = NLPCache()
+        cache.put('a', '')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(0.5, cache.hit_rate)
+
+    def test_persisted_cache(self):
+        mk_dir_not_exist('./tmp_nlp_cache')
+        nlp_prep = NLPreprocessor(cache_size=1024, cache_file='./tmp_nlp_cache/nlp_cache.jsonl')
+        processed = nlp_prep.process_identifiers(['fooBar', 'the_config'])
+        nlp_prep.process_sentence('Returns the running processes')
+        nlp_prep.save_cache()
+        hits, misses = compact_nlp_cache('./tmp_nlp_cache/nlp_cache.jsonl', 1024)
+        self.assertEqual((0, 3), (hits, misses))
+        self.assertListEqual(['nlp_cache.jsonl'], os.listdir('./tmp_nlp_cache'))
+
+        # A new process pre-warms its caches from the cache file
+        NLP_CACHES.clear()
+        nlp_prep = NLPreprocessor(cache_size=1024, cache_file='./tmp_nlp_cache/nlp_cache.jsonl')
+        self.assertListEqual(processed, nlp_prep.process_identifiers(['fooBar', 'the_config']))
+        self.assertEqual(2, nlp_prep.caches['identifiers'].hits)
+        self.assertEqual(1, len(nlp_prep.caches['sentences']))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree('./tmp_nlp_cache', ignore_errors=True)
@@ -1,7 +1,15 @@
 from libsa4py.cst_pipeline import Pipeline
+from libsa4py.jsonl_output import load_project_jsonl
+from libsa4py.type_normalizer import normalize_module_types
+from libsa4py.pyre_snapshot import PyreSnapshotWriter, open_pyre_snapshot
+from libsa4py.cst_extractor import Extractor
+from libsa4py.nl_preprocessing import NLPreprocessor
 from pathlib import Path
 from os.path import join
+from libsa4py.utils import read_file, load_json, mk_dir_not_exist, list_files
+from unittest.mock import patch
 import unittest
+import os
 import json
 import shutil
 
@@ -24,6 +32,41 @@ class TestPipeline(unittest.TestCase):
                             join(Path(__file__).parent.absolute(), 'tmp_nonlp'), nlp_transf=False, use_pyre=False)
         p_no_nlp.run([{'author': 'tests', 'repo': 'examples'}], 1)
 
+        p_file_sched = Pipeline(Path(__file__).parent.absolute().parent,
+                                join(Path(__file__).parent.absolute(), 'tmp_file_sched'), nlp_transf=False,
+                                use_pyre=False, scheduler='file')
+        p_file_sched.run([{'author': 'tests', 'repo': 'examples'}], 2)
+
+        p_jsonl = Pipeline(Path(__file__).parent.absolute().parent,
+                           join(Path(__file__).parent.absolute(), 'tmp_jsonl'), nlp_transf=False,
+                           use_pyre=False, output_format='jsonl')
+        p_jsonl.run([{'author': 'tests', 'repo': 'examples'}], 1)
+
+        p_jsonl_file_sched = Pipeline(Path(__file__).parent.absolute().parent,
+                                      join(Path(__file__).parent.absolute(), 'tmp_jsonl_file_sched'),
+                                      nlp_transf=False, use_pyre=False, scheduler='file', output_format='jsonl')
+        p_jsonl_file_sched.run([{'author': 'tests', 'repo': 'examples'}], 2)
+
+        p_norm_types = Pipeline(Path(__file__).parent.absolute().parent,
+                                join(Path(__file__).parent.absolute(), 'tmp_norm_types'), nlp_transf=False,
+                                use_pyre=False, normalize_types=True)
+        p_norm_types.run([{'author': 'tests', 'repo': 'examples'}], 1)
+
+        mk_dir_not_exist(join(Path(__file__).parent.absolute(), 'tmp_pyre_snapshot'))
+        snapshot_writer = PyreSnapshotWriter(join(Path(__file__).parent.absolute(), 'tmp_pyre_snapshot',
+                                                  'testsexamples.zip'))
+        snapshot_writer.write_file('vars_types_pyre.py', read_file('./examples/vars_types_pyre.py'),
+                                   load_json('./examples/vars_types_pyre_data.json'))
+        # The snapshot of a file that has changed since is not used
+        snapshot_writer.write_file('assignments.py', read_file('./examples/assignments.py') + '\n',
+                                   load_json('./examples/vars_types_pyre_data.json'))
+        snapshot_writer.close()
+        p_pyre_snapshot = Pipeline(Path(__file__).parent.absolute().parent,
+                                   join(Path(__file__).parent.absolute(), 'tmp_pyre_snapshot'), nlp_transf=False,
+                                   use_pyre=False, scheduler='file',
+                                   pyre_snapshot_dir=join(Path(__file__).parent.absolute(), 'tmp_pyre_snapshot'))
+        p_pyre_snapshot.run([{'author': 'tests', 'repo': 'examples'}], 2)
+
     def test_pipeline_output(self):
         pipeline_out_exp = json.loads(open("exp_outputs/testsexamples.json", 'r').read())
         pipeline_out = json.loads(open("tmp/processed_projects/testsexamples.json", 'r').read())
@@ -36,6 +79,74 @@ class TestPipeline(unittest.TestCase):
 
         self.assertDictEqual(pipeline_out_nonlp_exp, pipeline_out_nonlp)
 
+    def test_pipeline_output_file_sched(self):
+        pipeline_out_nonlp_exp = json.loads(open("exp_outputs/testsexamples_nonlp.json", 'r').read())
+        pipeline_out_file_sched = json.loads(open("tmp_file_sched/processed_projects/testsexamples.json", 'r').read())
+
+        self.assertDictEqual(pipeline_out_nonlp_exp, pipeline_out_file_sched)
+
+    def test_pipeline_output_jsonl(self):
+        pipeline_out_nonlp_exp = json.loads(open("exp_outputs/testsexamples_nonlp.json", 'r').read())
+        pipeline_out_jsonl = load_project_jsonl("tmp_jsonl/processed_projects/testsexamples.jsonl")
+
+        self.assertDictEqual(pipeline_out_nonlp_exp, pipeline_out_jsonl)
+        # The files are in the same order as the JSON output
+        pipeline_out_json = json.loads(open("tmp_nonlp/processed_projects/testsexamples.json", 'r').read())
+        self.assertListEqual(list(pipeline_out_json['tests/examples']['src_files'].keys()),
+                             list(pipeline_out_jsonl['tests/examples']['src_files'].keys()))
+
+    def test_pipeline_output_jsonl_file_sched(self):
+        pipeline_out_nonlp_exp = json.loads(open("exp_outputs/testsexamples_nonlp.json", 'r').read())
+        pipeline_out_jsonl = load_project_jsonl("tmp_jsonl_file_sched/processed_projects/testsexamples.jsonl")
+
+        self.assertDictEqual(pipeline_out_nonlp_exp, pipeline_out_jsonl)
+        self.assertEqual(read_file("tmp_nonlp/extracted_visible_types/tests_examples_avltypes.txt"),
+                         read_file("tmp_jsonl_file_sched/extracted_visible_types/tests_examples_avltypes.txt"))
+
+    def test_pipeline_output_norm_types(self):
+        pipeline_out_nonlp_exp = json.loads(open("exp_outputs/testsexamples_nonlp.json", 'r').read())
+        for f in pipeline_out_nonlp_exp['tests/examples']['src_files'].values():
+            normalize_module_types(f)
+        pipeline_out_norm_types = json.loads(open("tmp_norm_types/processed_projects/testsexamples.json", 'r').read())
+
+        self.assertDictEqual(pipeline_out_nonlp_exp, pipeline_out_norm_types)
+
+    def test_pipeline_output_pyre_snapshot(self):
+        pipeline_out_nonlp_exp = json.loads(open("exp_outputs/testsexamples_nonlp.json", 'r').read())
+        pipeline_out_nonlp_exp['tests/examples']['src_files']['libsa4py/tests/examples/vars_types_pyre.py'] = \
+            json.loads(json.dumps({**Extractor.extract(read_file('./examples/vars_types_pyre.py'),
+                                                       load_json('./examples/vars_types_pyre_data.json')).to_dict(),
+                                   'set': None}))
+        pipeline_out_pyre_snapshot = json.loads(open("tmp_pyre_snapshot/processed_projects/testsexamples.json",
+                                                     'r').read())
+
+        self.assertDictEqual(pipeline_out_nonlp_exp['tests/examples']['src_files'],
+                             pipeline_out_pyre_snapshot['tests/examples']['src_files'])
+        self.assertIsNone(open_pyre_snapshot("tmp_pyre_snapshot/testsexamples.zip").get(
+            'assignments.py', read_file('./examples/assignments.py')))
+
+    def test_file_task_pipeline(self):
+        p = Pipeline(Path(__file__).parent.absolute().parent, join(Path(__file__).parent.absolute(), 'tmp_nonlp'),
+                     nlp_transf=False, use_pyre=False, scheduler='file')
+        p.duplicate_files = {'examples/dup.py'}
+        p.split_dataset_files = {'examples/dup.py': 'train'}
+        file_task_pipeline = p.get_file_task_pipeline()
+
+        self.assertIsNone(file_task_pipeline.duplicate_files)
+        self.assertDictEqual({}, file_task_pipeline.split_dataset_files)
+        self.assertSetEqual({'examples/dup.py'}, p.duplicate_files)
+
+    def test_nlp_cache_saved_per_task(self):
+        # The examples are a single batch of files for the file-level scheduler
+        for scheduler in ('project', 'file'):
+            with patch.object(NLPreprocessor, 'save_cache') as save_cache:
+                p = Pipeline(Path(__file__).parent.absolute().parent,
+                             join(Path(__file__).parent.absolute(), 'tmp_nlp_cache_' + scheduler),
+                             nlp_transf=True, use_pyre=False, scheduler=scheduler)
+                p.run([{'author': 'tests', 'repo': 'examples'}], 1)
+            self.assertEqual(save_cache.call_count, 1)
+            shutil.rmtree("./tmp_nlp_cache_%s/" % scheduler)
+
     # TODO: Test the pipeline when using mypy
     # def test_pipeline_output_mypy(self):
     #     pass
@@ -44,3 +155,77 @@ class TestPipeline(unittest.TestCase):
     def tearDownClass(cls):
         shutil.rmtree("./tmp/")
         shutil.rmtree("./tmp_nonlp/")
+        shutil.rmtree("./tmp_file_sched/")
+        shutil.rmtree("./tmp_jsonl/")
+        shutil.rmtree("./tmp_jsonl_file_sched/")
+        shutil.rmtree("./tmp_norm_types/")
+        shutil.rmtree("./tmp_pyre_snapshot/")
+
+
+def query_types_batch(project_path: str, file_paths: list) -> dict:
+    """
+    Gives the types of the files like pyre, with the actual types of vars_types_pyre.py
+    """
+
+    return {f: load_json('./examples/vars_types_pyre_data.json') if f.endswith('vars_types_pyre.py') else
+            {'path': f, 'types': []} for f in file_paths}
+
+
+class TestPyreDump(unittest.TestCase):
+    """
+    It tests dumping pyre's types of projects to snapshots and extracting the projects with them, with pyre's
+    commands patched
+    """
+
+    projects_path = Path(__file__).parent.absolute().parent
+    project = {'author': 'tests', 'repo': 'examples'}
+
+    @classmethod
+    @patch('libsa4py.cst_pipeline.pyre_query_types_batch', side_effect=query_types_batch)
+    @patch('libsa4py.pyre.pyre_server_shutdown')
+    @patch('libsa4py.pyre.clean_pyre_config')
+    @patch('libsa4py.pyre.find_pyre_server', return_value=1)
+    @patch('libsa4py.pyre.pyre_server_init', return_value=True)
+    def setUpClass(cls, *_):
+        from dpu_utils.utils.dataloading import save_jsonl_gz
+        shutil.rmtree('tmp_pyre_dump', ignore_errors=True)
+        mk_dir_not_exist('tmp_pyre_dump')
+        # Only one file of the cluster is kept, which is chosen at random by every pipeline
+        cls.dup_files = [join(cls.projects_path, 'tests', 'examples', f) for f in ('vars_types_pyre.py',
+                                                                                   'assignments.py')]
+        save_jsonl_gz([cls.dup_files], 'tmp_pyre_dump/dups.jsonl.gz')
+
+        p_dump = Pipeline(cls.projects_path, None, nlp_transf=False, use_pyre=True,
+                          dups_files_path='tmp_pyre_dump/dups.jsonl.gz',
+                          pyre_snapshot_dir=join(Path(__file__).parent.absolute(), 'tmp_pyre_dump', 'snapshots'))
+        p_dump.run_pyre_dump([cls.project], 1)
+
+        cls.p_process = Pipeline(cls.projects_path, join(Path(__file__).parent.absolute(), 'tmp_pyre_dump', 'out'),
+                                 nlp_transf=False, use_pyre=False, dups_files_path='tmp_pyre_dump/dups.jsonl.gz',
+                                 pyre_snapshot_dir=join(Path(__file__).parent.absolute(), 'tmp_pyre_dump',
+                                                        'snapshots'))
+        cls.p_process.run([cls.project], 1)
+
+    def test_dump_all_files(self):
+        pyre_snapshot = open_pyre_snapshot('tmp_pyre_dump/snapshots/testsexamples.zip')
+
+        self.assertSetEqual(set(pyre_snapshot.zip_f.namelist()),
+                            {str(Path(f).relative_to('examples')) for f in list_files('examples')})
+        self.assertSetEqual(set(os.listdir('tmp_pyre_dump/snapshots')), {'testsexamples.zip', 'pyre_projects_time.csv'})
+
+    def test_process_deduplicated_files(self):
+        processed_files = load_json('tmp_pyre_dump/out/processed_projects/testsexamples.json')['tests/examples'][
+            'src_files']
+
+        self.assertEqual(len(processed_files), len(list_files('examples')) - 1)
+        for f, _, _ in self.p_process.get_project_files(self.project):
+            self.assertIsNotNone(self.p_process.get_pyre_snapshot_types('tests/examples', f, read_file(f)))
+        kept_file = next(f for f in self.dup_files if not self.p_process.is_file_duplicate(f))
+        self.assertDictEqual(json.loads(json.dumps({**Extractor.extract(read_file(kept_file),
+                                                                        query_types_batch('', [kept_file])[
+                                                                            kept_file]).to_dict(), 'set': None})),
+                             processed_files[str(Path(kept_file).relative_to(self.projects_path.parent))])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree('tmp_pyre_dump')
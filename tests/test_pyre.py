@@ -0,0 +1,166 @@
+from libsa4py.pyre import PyreServerPool, pyre_query_types_batch
+from subprocess import TimeoutExpired
+from unittest.mock import patch
+import multiprocessing
+import tempfile
+import unittest
+import shutil
+import time
+import json
+import os
+
+
+class TestPyreServerPool(unittest.TestCase):
+    """
+    It tests bounding, reusing, and restarting pyre servers, with pyre's commands patched
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lock_dir = os.path.join(self.tmp_dir, 'locks')
+        self.project_path = os.path.join(self.tmp_dir, 'project')
+        os.makedirs(self.lock_dir)
+        os.makedirs(self.project_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch('libsa4py.pyre.pyre_server_shutdown')
+    @patch('libsa4py.pyre.find_pyre_server', return_value=1)
+    @patch('libsa4py.pyre.pyre_server_init', return_value=True)
+    def test_max_servers(self, *_):
+        pool = PyreServerPool(self.lock_dir, max_servers=2, poll_interval=0.01)
+        running_servers = multiprocessing.Value('i', 0)
+        max_running_servers = multiprocessing.Value('i', 0)
+
+        def run_server(project_path: str):
+            with pool.server(project_path):
+                with running_servers.get_lock():
+                    running_servers.value += 1
+                    max_running_servers.value = max(max_running_servers.value, running_servers.value)
+                time.sleep(0.1)
+                with running_servers.get_lock():
+                    running_servers.value -= 1
+
+        # Forked processes inherit the patched pyre commands
+        processes = [multiprocessing.get_context('fork').Process(target=run_server, args=(self.project_path + str(i),))
+                     for i in range(6)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+
+        self.assertTrue(all(p.exitcode == 0 for p in processes))
+        self.assertEqual(2, max_running_servers.value)
+
+    @patch('libsa4py.pyre.pyre_server_shutdown')
+    @patch('libsa4py.pyre.find_pyre_server', return_value=1)
+    @patch('libsa4py.pyre.pyre_server_init', return_value=True)
+    def test_reuse_healthy_server(self, pyre_server_init, _, pyre_server_shutdown):
+        os.makedirs(os.path.join(self.project_path, '.pyre'))
+        with PyreServerPool(self.lock_dir, max_servers=1).server(self.project_path) as server_stats:
+            self.assertTrue(server_stats['reused'])
+            self.assertTrue(server_stats['healthy'])
+        pyre_server_init.assert_not_called()
+        pyre_server_shutdown.assert_called_once_with(self.project_path)
+
+    @patch('libsa4py.pyre.pyre_server_shutdown')
+    @patch('libsa4py.pyre.find_pyre_server', return_value=1)
+    @patch('libsa4py.pyre.pyre_server_init', side_effect=[False, True])
+    def test_retry_failed_start(self, pyre_server_init, *_):
+        with PyreServerPool(self.lock_dir, max_servers=1).server(self.project_path) as server_stats:
+            self.assertFalse(server_stats['reused'])
+            self.assertTrue(server_stats['healthy'])
+        self.assertEqual(2, pyre_server_init.call_count)
+
+    @patch('libsa4py.pyre.pyre_server_shutdown')
+    @patch('libsa4py.pyre.find_pyre_server', return_value=None)
+    @patch('libsa4py.pyre.pyre_server_init', return_value=True)
+    def test_unhealthy_server(self, pyre_server_init, *_):
+        with PyreServerPool(self.lock_dir, max_servers=1).server(self.project_path) as server_stats:
+            self.assertFalse(server_stats['healthy'])
+        self.assertEqual(2, pyre_server_init.call_count)
+
+    @patch('libsa4py.pyre.pyre_server_shutdown')
+    @patch('libsa4py.pyre.find_pyre_server', return_value=1)
+    @patch('libsa4py.pyre.pyre_server_init', return_value=True)
+    def test_shutdown_all_after_crashed_worker(self, _, __, pyre_server_shutdown):
+        pool = PyreServerPool(self.lock_dir, max_servers=2)
+
+        def crash_with_server():
+            with pool.server(self.project_path):
+                # Exits without shutting down the server or releasing its slot
+                os._exit(1)
+
+        p = multiprocessing.get_context('fork').Process(target=crash_with_server)
+        p.start()
+        p.join()
+        pyre_server_shutdown.assert_not_called()
+
+        pool.shutdown_all()
+        pyre_server_shutdown.assert_called_once_with(self.project_path)
+        # The slot is free and is not shut down again
+        pool.shutdown_all()
+        self.assertEqual(1, pyre_server_shutdown.call_count)
+        with pool.server(self.project_path) as server_stats:
+            self.assertEqual(0.0, round(server_stats['wait'], 1))
+
+
+def query_types_response(project_path: str, args: list, timeout=None, stdin=None):
+    """
+    Answers a `types` query like pyre, which fails the whole query if one of its files is named bad.py
+    """
+
+    rel_paths = [p.split("'")[1] for p in args[1][len('types('):-1].split(', ')]
+    if any(p.endswith('bad.py') for p in rel_paths):
+        return json.dumps({'error': 'Not able to get lookups'}), '', 0
+    return json.dumps({'response': [{'path': p, 'types': []} for p in rel_paths]}), '', 0
+
+
+class TestPyreQueryTypesBatch(unittest.TestCase):
+    """
+    It tests querying the types of files in batches, with pyre's commands patched
+    """
+
+    project_path = '/tmp/project'
+
+    def get_files(self, *files):
+        return [os.path.join(self.project_path, f) for f in files]
+
+    @patch('libsa4py.pyre.run_pyre_command', side_effect=query_types_response)
+    def test_relative_paths(self, run_pyre_command):
+        files = self.get_files('a.py', 'pkg/b.py')
+        files_types = pyre_query_types_batch(self.project_path, files)
+
+        self.assertDictEqual(files_types, {files[0]: {'path': 'a.py', 'types': []},
+                                           files[1]: {'path': 'pkg/b.py', 'types': []}})
+        run_pyre_command.assert_called_once_with(self.project_path, ['query', "types(path='a.py', path='pkg/b.py')"],
+                                                 timeout=600)
+
+    @patch('libsa4py.pyre.run_pyre_command', side_effect=query_types_response)
+    def test_split_failed_query(self, run_pyre_command):
+        files = self.get_files('a.py', 'b.py', 'bad.py', 'c.py', 'd.py')
+        files_types = pyre_query_types_batch(self.project_path, files, batch_size=4)
+
+        self.assertListEqual(sorted(files_types), sorted(files))
+        self.assertIsNone(files_types[files[2]])
+        self.assertTrue(all(files_types[f] is not None for f in files if f != files[2]))
+        # The batch [a, b, bad, c] is halved to [a, b] and [bad, c], which is halved to [bad] and [c]
+        self.assertEqual(run_pyre_command.call_count, 6)
+
+    @patch('libsa4py.pyre.run_pyre_command', side_effect=TimeoutExpired('pyre', 600))
+    def test_no_split_on_timeout(self, run_pyre_command):
+        files = self.get_files('a.py', 'b.py', 'c.py')
+        files_types = pyre_query_types_batch(self.project_path, files)
+
+        self.assertDictEqual(files_types, dict.fromkeys(files))
+        run_pyre_command.assert_called_once()
+
+    @patch('libsa4py.pyre.run_pyre_command', side_effect=query_types_response)
+    def test_quoted_path(self, run_pyre_command):
+        files = self.get_files("it's.py", 'a.py')
+        files_types = pyre_query_types_batch(self.project_path, files)
+
+        self.assertIsNone(files_types[files[0]])
+        self.assertIsNotNone(files_types[files[1]])
+        run_pyre_command.assert_called_once_with(self.project_path, ['query', "types(path='a.py')"], timeout=600)
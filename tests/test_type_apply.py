@@ -1,10 +1,13 @@
-from libsa4py.utils import mk_dir_not_exist, write_file, read_file, save_json
+from libsa4py.utils import mk_dir_not_exist, write_file, read_file, save_json, load_json, write_file_atomic
+from libsa4py.jsonl_output import ProjectJSONLWriter
 from libsa4py.cst_pipeline import TypeAnnotatingProjects
 from libsa4py.cst_extractor import Extractor
 from libsa4py.cst_transformers import TypeAnnotationRemover, TypeApplier
 from collections import Counter
 import unittest
 import shutil
+import json
+import os
 import libcst
 
 test_file = """from pathlib import Path
@@ -120,6 +123,70 @@ class TestTypeAnnotatingProjects(unittest.TestCase):
         # The imported types from typing
         self.assertEqual(Counter(" ".join(exp_split[0:7])), Counter(" ".join(out_split[0:7])))
 
+    def test_type_apply_pipeline_jsonl(self):
+        write_file('./tmp_ta/type_apply.py', test_file)
+        jsonl_writer = ProjectJSONLWriter('./tmp_ta/type_apply_ex.jsonl', 'tests/examples')
+        for f, f_d in load_json('./examples/type_apply_ex.json')['tests/examples']['src_files'].items():
+            jsonl_writer.write_file(f, f_d)
+        jsonl_writer.close()
+
+        ta = TypeAnnotatingProjects('./tmp_ta', None, apply_nlp=False)
+        ta.process_project('./tmp_ta/type_apply_ex.jsonl')
+
+        exp_split = test_file_exp.splitlines()
+        out_split = read_file('./tmp_ta/type_apply.py').splitlines()
+
+        self.assertEqual("\n".join(exp_split[7:]), "\n".join(out_split[7:]))
+        self.assertEqual(Counter(" ".join(exp_split[0:7])), Counter(" ".join(out_split[0:7])))
+
+    def test_type_apply_run(self):
+        mk_dir_not_exist('./tmp_ta/processed_projects')
+        save_json('./tmp_ta/processed_projects/type_apply_ex.json', load_json('./examples/type_apply_ex.json'))
+        exp_split = test_file_exp.splitlines()
+        for sched in ['file', 'project']:
+            write_file('./tmp_ta/type_apply.py', test_file)
+            ta = TypeAnnotatingProjects('./tmp_ta', './tmp_ta', apply_nlp=False, scheduler=sched)
+            ta.run(2)
+
+            out_split = read_file('./tmp_ta/type_apply.py').splitlines()
+            self.assertEqual("\n".join(exp_split[7:]), "\n".join(out_split[7:]))
+            self.assertEqual(Counter(" ".join(exp_split[0:7])), Counter(" ".join(out_split[0:7])))
+            files_time = read_file('./tmp_ta/apply_files_time.csv').splitlines()
+            self.assertEqual('file,status,time', files_time[0])
+            self.assertEqual(['type_apply.py', 'applied'], files_time[1].split(',')[:2])
+        # No temporary file is left behind by the atomic writes
+        self.assertFalse(any(f.endswith('.tmp') for f in os.listdir('./tmp_ta')))
+
+    def test_type_apply_run_tree_and_diff(self):
+        mk_dir_not_exist('./tmp_ta/processed_projects')
+        save_json('./tmp_ta/processed_projects/type_apply_ex.json', load_json('./examples/type_apply_ex.json'))
+        write_file('./tmp_ta/type_apply.py', test_file)
+        exp_split = test_file_exp.splitlines()
+
+        TypeAnnotatingProjects('./tmp_ta', './tmp_ta', apply_nlp=False, output_tree='./tmp_ta/tree').run(2)
+        out_split = read_file('./tmp_ta/tree/type_apply.py').splitlines()
+        self.assertEqual("\n".join(exp_split[7:]), "\n".join(out_split[7:]))
+
+        TypeAnnotatingProjects('./tmp_ta', './tmp_ta', apply_nlp=False, diff_path='./tmp_ta/diffs.jsonl').run(2)
+        diffs = [json.loads(l) for l in read_file('./tmp_ta/diffs.jsonl').splitlines()]
+        self.assertEqual(1, len(diffs))
+        self.assertEqual('type_apply.py', diffs[0]['file'])
+        self.assertEqual(TypeAnnotatingProjects.unified_diff('type_apply.py', test_file,
+                                                             read_file('./tmp_ta/tree/type_apply.py')),
+                         diffs[0]['diff'])
+        self.assertTrue(diffs[0]['diff'].startswith('--- a/type_apply.py\n+++ b/type_apply.py\n'))
+
+        # The source files are not rewritten
+        self.assertEqual(test_file, read_file('./tmp_ta/type_apply.py'))
+
+    def test_write_file_atomic(self):
+        write_file('./tmp_ta/atomic.py', 'x = 1')
+        os.chmod('./tmp_ta/atomic.py', 0o755)
+        write_file_atomic('./tmp_ta/atomic.py', 'x: int = 1')
+
+        self.assertEqual('x: int = 1', read_file('./tmp_ta/atomic.py'))
+        self.assertEqual(0o755, os.stat('./tmp_ta/atomic.py').st_mode & 0o777)
+
     def test_type_apply_local_vars(self):
         """
         This tests whether type annotations for local variables with the same names are applied correctly.
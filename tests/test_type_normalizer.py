@@ -0,0 +1,36 @@
+from libsa4py.type_normalizer import normalize_type, normalize_module_types
+import unittest
+
+
+class TestTypeNormalizer(unittest.TestCase):
+    """
+    It tests resolving the aliases of types
+    """
+
+    def test_normalize_type(self):
+        types = {'Dict[Any, Any]': 'dict', 'Dict': 'dict', '{}': 'dict', 'Set[Any]': 'set', 'Tuple[Any, ...]': 'tuple',
+                 'Tuple[int, ...]': 'Tuple[int]', 'Text': 'str', 'List[Text]': 'List[str]', '[]': 'list',
+                 'List[Any]': 'list', '[{}]': 'List[dict]', "Literal['foo']": 'Literal', 'Literal[3]': 'Literal',
+                 'Callable[..., Any]': 'Callable', '.foo.Bar': 'foo.Bar', 'Optional[]': 'Optional',
+                 'List[Dict[Any, Any]]': 'List[dict]', 'Dict[str, int]': 'Dict[str, int]', 'int': 'int'}
+        for t, t_exp in types.items():
+            self.assertEqual(t_exp, normalize_type(t))
+
+    def test_normalize_type_cache(self):
+        normalize_type.cache_clear()
+        normalize_type('Dict[Any, Any]')
+        normalize_type('Dict[Any, Any]')
+        self.assertEqual(1, normalize_type.cache_info().hits)
+        self.assertEqual(1, normalize_type.cache_info().misses)
+
+    def test_normalize_module_types(self):
+        fn = {'params': {'x': 'Text', 'y': ''}, 'ret_type': 'Dict[Any, Any]', 'variables': {'l': '[]'}}
+        module = {'variables': {'v': 'List[Any]'},
+                  'classes': [{'variables': {'c': 'Set[Any]'}, 'funcs': [dict(fn)]}], 'funcs': [dict(fn)]}
+        module = normalize_module_types(module)
+        self.assertDictEqual({'v': 'list'}, module['variables'])
+        self.assertDictEqual({'c': 'set'}, module['classes'][0]['variables'])
+        for fn_d in module['classes'][0]['funcs'] + module['funcs']:
+            self.assertDictEqual({'x': 'str', 'y': ''}, fn_d['params'])
+            self.assertEqual('dict', fn_d['ret_type'])
+            self.assertDictEqual({'l': 'list'}, fn_d['variables'])
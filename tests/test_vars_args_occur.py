@@ -21,6 +21,16 @@ class TestVarsArgsOccur(unittest.TestCase):
                                                   ['MOD_CONSTANT', 'PI', 'add_something', 'n']]}
         self.assertDictEqual(mod_vars_use_expected, self.processed_f['mod_var_occur'])
 
+    def test_module_vars_use_after_redefinition(self):
+        processed_f = Extractor().extract("X = 1\nprint(X)\nX, Y = 2, X\nif X > Y:\n    Z = X\n").to_dict()
+        self.assertDictEqual({'X': [['X', 'Y'], ['Z', 'X']], 'Y': [['X', 'Y']], 'Z': []},
+                             processed_f['mod_var_occur'])
+
+    def test_module_vars_use_in_with_and_import(self):
+        # Only the names of the first item of a with statement are considered
+        processed_f = Extractor().extract("A = 1\nB = 2\nwith open(A) as f, open(B) as g:\n    import B\n").to_dict()
+        self.assertDictEqual({'A': [['open', 'A', 'f']], 'B': [['B']]}, processed_f['mod_var_occur'])
+
 
     def test_fn_params_occur(self):
         print(self.processed_f['classes'][0]['funcs'][1]['params_occur'])